@@ -0,0 +1,68 @@
+"""
+Time the import of round-tripped grammars of increasing size in every format.
+
+Usage: python benchmarks/bench_import.py [--sizes 10 20 40 80]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from grape.automaton.automaton_manager import (
+    AutomatonFormat,
+    dump_automaton_to_file,
+    load_automaton_from_file,
+)
+from grape.automaton_generator import grammar_by_saturation, size_constraint
+from grape.dsl import DSL
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "0": ("int", 0),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "*": ("int -> int -> int", lambda x, y: x * y),
+        "-": ("int -> int", lambda x: -x),
+        "True": ("bool", True),
+        ">0": ("int -> bool", lambda x: x > 0),
+        "ite": ("bool -> int -> int -> int", lambda b, x, y: x if b else y),
+    }
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 20, 40, 80],
+        help="maximum program sizes of the generated grammars",
+    )
+    args = parser.parse_args()
+    formats = list(AutomatonFormat)
+    print("size".rjust(6), "rules".rjust(8), *(f.value.rjust(10) for f in formats))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in args.sizes:
+            grammar = grammar_by_saturation(
+                dsl, "int -> int -> int", [size_constraint(0, size)]
+            )
+            grammar = grammar.map_alphabet(str).classic_state_renaming()
+            timings = []
+            for format in formats:
+                file = os.path.join(folder, f"grammar{format.value}")
+                dump_automaton_to_file(grammar, file)
+                start = time.perf_counter()
+                loaded = load_automaton_from_file(file)
+                timings.append(time.perf_counter() - start)
+                assert loaded.rules == grammar.rules, format
+            print(
+                str(size).rjust(6),
+                str(len(grammar.rules)).rjust(8),
+                *(f"{t:.3f}s".rjust(10) for t in timings),
+            )
+
+
+if __name__ == "__main__":
+    main()
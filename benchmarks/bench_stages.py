@@ -0,0 +1,221 @@
+"""
+Time each stage of grape-prune on the reference DSLs of benchmarks/dsls at
+several sizes and record the peak memory of each stage.
+
+Stages: prune (obs_equiv_pruner.prune, from saturation to grammar_from_memory),
+add_loops, minimise, dump, load and counting.
+prune is run with grape.profiling enabled so that its own stages (prune.*) are
+recorded too; prune.evaluation is the time spent evaluating programs during the
+enumeration, it has no peak memory.
+The reference DSLs sample every type they use and their primitives have at
+most two arguments, so that add_loops works even at the smallest sizes.
+
+Usage: python benchmarks/bench_stages.py [--dsls bitvector lists] [--sizes 4 5]
+       [--repeat 3] [--no-memory] [-o results.json]
+Compare two results with benchmarks/compare.py.
+"""
+
+import argparse
+from contextlib import redirect_stderr, redirect_stdout
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from grape import profiling
+from grape.automaton.automaton_manager import (
+    dump_automaton_to_file,
+    load_automaton_from_file,
+)
+from grape.automaton.loop_manager import LoopingAlgorithm, add_loops
+from grape.cli import dsl_loader
+from grape.evaluator import Evaluator
+from grape.pruning import obs_equiv_pruner
+from grape.pruning.equivalence_class_manager import EquivalenceClassManager
+
+FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dsls")
+DSLS = ["bitvector", "lists", "strings", "polymorphic"]
+STAGES = [
+    "prune",
+    "prune.base_grammar",
+    "prune.saturation",
+    "prune.commutativity",
+    "prune.algebraic",
+    "prune.enumeration",
+    "prune.evaluation",
+    "prune.grammar_from_memory",
+    "add_loops",
+    "minimise",
+    "dump",
+    "load",
+    "counting",
+]
+
+
+def sample_inputs(
+    nsamples: int, sample_dict: dict[str, Callable], seed: int = 1
+) -> dict[str, list]:
+    random.seed(seed)
+    inputs = {}
+    for sampled_type, sample_fn in sample_dict.items():
+        sampled_inputs: list = []
+        tries = 0
+        while len(sampled_inputs) < nsamples and tries < 100:
+            sampled = sample_fn()
+            tries += 1
+            if sampled not in sampled_inputs:
+                sampled_inputs.append(sampled)
+                tries = 0
+        while len(sampled_inputs) < nsamples:
+            sampled_inputs = (sampled_inputs * 2)[:nsamples]
+        inputs[sampled_type] = sampled_inputs
+    return inputs
+
+
+class Recorder:
+    """
+    Runs stages and records either their times or their peak memory.
+    """
+
+    def __init__(self, memory: bool):
+        self.memory = memory
+        self.values: dict[str, float] = {}
+
+    def __call__(self, stage: str, fn: Callable[[], Any]) -> Any:
+        if self.memory:
+            tracemalloc.start()
+            out = fn()
+            self.values[stage] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            out = fn()
+            self.values[stage] = time.perf_counter() - start
+        return out
+
+    def profiled(self, stage: str, fn: Callable[[], Any]) -> Any:
+        """
+        Runs a stage with grape.profiling enabled and records its own stages too.
+        """
+        profiler = profiling.enable(memory=self.memory)
+        try:
+            with profiling.stage(stage):
+                out = fn()
+        finally:
+            profiling.disable()
+        metric = "peak_memory" if self.memory else "time"
+        for name, info in profiler.stages.items():
+            self.values[name] = info[metric]
+        if not self.memory:
+            for name, (_, total, _) in profiler.timers.items():
+                if name.startswith(stage + "."):
+                    self.values.setdefault(name, total)
+        return out
+
+
+def run_stages(dsl_name: str, size: int, nsamples: int, record: Recorder) -> None:
+    dsl, _, sample_dict, equal_dict, skip_exceptions, _ = dsl_loader.load_python_file(
+        os.path.join(FOLDER, f"{dsl_name}.py")
+    )
+    inputs = sample_inputs(nsamples, sample_dict)
+    evaluator = Evaluator(
+        dsl, inputs, equal_dict, skip_exceptions, symmetric_inputs=True
+    )
+    manager = EquivalenceClassManager()
+
+    def prune():
+        # Its summary and progress bar are not part of the results
+        with open(os.devnull, "w") as null:
+            with redirect_stdout(null), redirect_stderr(null):
+                return obs_equiv_pruner.prune(
+                    dsl, evaluator, manager, size, symmetry_breaking=True
+                )
+
+    reduced = record.profiled("prune", prune)
+    looped = record(
+        "add_loops", lambda: add_loops(reduced, dsl, LoopingAlgorithm.GRAPE)
+    )
+
+    def minimise():
+        out = looped.copy()
+        out.reduce()
+        return out.minimise()
+
+    record("minimise", minimise)
+    with tempfile.TemporaryDirectory() as folder:
+        file = os.path.join(folder, "grammar.grape")
+        record("dump", lambda: dump_automaton_to_file(looped, file))
+        loaded = record("load", lambda: load_automaton_from_file(file))
+    record("counting", lambda: loaded.trees_by_size(2 * size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--dsls", nargs="+", choices=DSLS, default=DSLS, help="DSLs to benchmark"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[4, 5], help="max program sizes"
+    )
+    parser.add_argument("--samples", type=int, default=50, help="inputs per type")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="number of runs, the best time is kept"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="do not measure the peak memory"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, help="JSON file of the results"
+    )
+    args = parser.parse_args()
+    results = []
+    print("dsl".ljust(12), "size".rjust(4), *(s[:10].rjust(11) for s in STAGES))
+    for dsl_name in args.dsls:
+        for size in args.sizes:
+            times: dict[str, float] = {}
+            for _ in range(args.repeat):
+                record = Recorder(memory=False)
+                run_stages(dsl_name, size, args.samples, record)
+                for stage, t in record.values.items():
+                    times[stage] = min(times.get(stage, t), t)
+            peaks: dict[str, float] = {}
+            if not args.no_memory:
+                record = Recorder(memory=True)
+                run_stages(dsl_name, size, args.samples, record)
+                peaks = record.values
+            for stage in STAGES:
+                results.append(
+                    {
+                        "dsl": dsl_name,
+                        "size": size,
+                        "stage": stage,
+                        "time": times[stage],
+                        "peak_memory": peaks.get(stage),
+                    }
+                )
+            print(
+                dsl_name.ljust(12),
+                str(size).rjust(4),
+                *(f"{times[s]:.4f}s".rjust(11) for s in STAGES),
+            )
+    if args.output is not None:
+        with open(args.output, "w") as fd:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "samples": args.samples,
+                    "results": results,
+                },
+                fd,
+                indent=1,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Time the import of every grape-* entry point with python -X importtime and fail
+if one of them exceeds its budget.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--scale 1.0]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Entry point module -> import time budget in milliseconds
+BUDGETS = {
+    "grape.cli.convert": 60,
+    "grape.cli.count": 60,
+    "grape.cli.despecialize": 60,
+    "grape.cli.enum": 60,
+    "grape.cli.info": 60,
+    "grape.cli.intersection": 60,
+    "grape.cli.specialize": 60,
+    "grape.cli.union": 60,
+    # These always need the DSL
+    "grape.cli.compile": 150,
+    "grape.cli.prune": 150,
+}
+
+
+def import_time(module: str) -> float:
+    """
+    Cumulative import time of the module in milliseconds.
+    """
+    # Measure with bytecode caches like an installed package
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in out.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    raise ValueError(f"no import time found for {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--runs", type=int, default=5, help="number of runs, the best one is kept"
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply all budgets by this factor"
+    )
+    args = parser.parse_args()
+    failed = []
+    print("module".ljust(24), "time".rjust(10), "budget".rjust(10))
+    for module, budget in BUDGETS.items():
+        # The first run fills the bytecode caches
+        import_time(module)
+        best = min(import_time(module) for _ in range(args.runs))
+        limit = budget * args.scale
+        if best > limit:
+            failed.append(module)
+        print(
+            module.ljust(24),
+            f"{best:.1f}ms".rjust(10),
+            f"{limit:.0f}ms".rjust(10),
+            "FAILED" if best > limit else "",
+        )
+    if failed:
+        print(f"import time budget exceeded: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
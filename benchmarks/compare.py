@@ -0,0 +1,89 @@
+"""
+Compare results of benchmarks/bench_stages.py against a baseline and flag the
+stages that became slower or use more memory.
+
+Usage: python benchmarks/compare.py results.json [--baseline benchmarks/baseline.json]
+       [--threshold 0.2] [--min-time 0.01]
+Exits with code 1 if there is a regression.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def load_results(file: str) -> dict[tuple[str, int, str], dict[str, Any]]:
+    with open(file) as fd:
+        data = json.load(fd)
+    return {(r["dsl"], r["size"], r["stage"]): r for r in data["results"]}
+
+
+def compare(
+    baseline: dict[tuple[str, int, str], dict[str, Any]],
+    current: dict[tuple[str, int, str], dict[str, Any]],
+    threshold: float,
+    min_time: float,
+) -> list[tuple[tuple[str, int, str], str, float, float]]:
+    """
+    Returns the regressions as (key, metric, baseline value, current value).
+    Times below min_time seconds are considered noise.
+    """
+    regressions = []
+    for key in sorted(set(baseline) & set(current)):
+        before, after = baseline[key], current[key]
+        if max(before["time"], after["time"]) >= min_time:
+            if after["time"] > before["time"] * (1 + threshold):
+                regressions.append((key, "time", before["time"], after["time"]))
+        if before.get("peak_memory") and after.get("peak_memory"):
+            if after["peak_memory"] > before["peak_memory"] * (1 + threshold):
+                regressions.append(
+                    (key, "peak_memory", before["peak_memory"], after["peak_memory"])
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("results", type=str, help="JSON file of bench_stages.py")
+    parser.add_argument(
+        "--baseline", type=str, default=BASELINE, help="JSON file of the baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative increase above which a stage is a regression",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.01,
+        help="stages faster than this in seconds are not compared on time",
+    )
+    args = parser.parse_args()
+    baseline = load_results(args.baseline)
+    current = load_results(args.results)
+    missing = sorted(set(baseline) - set(current))
+    if missing:
+        print(f"{len(missing)} stages of the baseline were not run")
+    print("dsl".ljust(12), "size".rjust(4), "stage".ljust(20), "time".rjust(8))
+    for key in sorted(set(baseline) & set(current)):
+        dsl, size, stage = key
+        ratio = current[key]["time"] / max(baseline[key]["time"], 1e-9)
+        print(dsl.ljust(12), str(size).rjust(4), stage.ljust(20), f"x{ratio:.2f}".rjust(8))
+    regressions = compare(baseline, current, args.threshold, args.min_time)
+    for (dsl, size, stage), metric, before, after in regressions:
+        print(
+            f"REGRESSION {dsl} size {size} {stage}: {metric} {before:.4g} -> {after:.4g}"
+        )
+    if regressions:
+        sys.exit(1)
+    print("no regression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+32-bit integers, as in the README example.
+"""
+
+import random
+from typing import Callable
+
+MAXI = (1 << 32) - 1
+random.seed(1)
+
+sample_dict: dict[str, Callable] = {"int": lambda: random.randint(-MAXI, MAXI)}
+
+dsl: dict[str, tuple[str, Callable]] = {
+    "+": ("int -> int -> int", lambda x, y: (x + y) & MAXI),
+    "*": ("int -> int -> int", lambda x, y: (x * y) & MAXI),
+    "-": ("int -> int -> int", lambda x, y: (x - y) & MAXI),
+    "^": ("int -> int -> int", lambda x, y: x ^ y),
+    "&": ("int -> int -> int", lambda x, y: x & y),
+    "|": ("int -> int -> int", lambda x, y: x | y),
+    "~": ("int -> int", lambda x: ~x & MAXI),
+    "1": ("int", 1),
+}
+
+target_type: str = "int"
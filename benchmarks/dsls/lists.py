@@ -0,0 +1,38 @@
+"""
+Lists of small integers, lists are tuples so that they can be compared and hashed.
+"""
+
+import random
+from typing import Callable
+
+random.seed(1)
+
+
+def sample_list() -> tuple:
+    return tuple(random.randint(-10, 10) for _ in range(random.randint(0, 8)))
+
+
+sample_dict: dict[str, Callable] = {
+    "list": sample_list,
+    "int": lambda: random.randint(-10, 10),
+}
+
+dsl: dict[str, tuple[str, Callable]] = {
+    "empty": ("list", ()),
+    "cons": ("int -> list -> list", lambda x, l: (x,) + l),
+    "append": ("list -> list -> list", lambda l1, l2: l1 + l2),
+    "reverse": ("list -> list", lambda l: l[::-1]),
+    "sort": ("list -> list", lambda l: tuple(sorted(l))),
+    "tail": ("list -> list", lambda l: l[1:]),
+    "head": ("list -> int", lambda l: l[0]),
+    "length": ("list -> int", lambda l: len(l)),
+    "sum": ("list -> int", lambda l: sum(l)),
+    "max": ("list -> int", lambda l: max(l)),
+    "+": ("int -> int -> int", lambda x, y: x + y),
+    "0": ("int", 0),
+    "1": ("int", 1),
+}
+
+target_type: str = "list"
+
+skip_exceptions: set = {IndexError, ValueError}
@@ -0,0 +1,31 @@
+"""
+Integers and lists with polymorphic primitives using 'a [ t1 | t2 ] types.
+"""
+
+import random
+from typing import Callable
+
+random.seed(1)
+
+
+def sample_list() -> tuple:
+    return tuple(random.randint(-10, 10) for _ in range(random.randint(0, 6)))
+
+
+sample_dict: dict[str, Callable] = {
+    "list": sample_list,
+    "int": lambda: random.randint(-10, 10),
+}
+
+dsl: dict[str, tuple[str, Callable]] = {
+    "add": ("'a [int|list] -> 'a -> 'a", lambda x, y: x + y),
+    "double": ("'a [int|list] -> 'a", lambda x: x + x),
+    "cons": ("int -> list -> list", lambda x, l: (x,) + l),
+    "tail": ("list -> list", lambda l: l[1:]),
+    "reverse": ("list -> list", lambda l: l[::-1]),
+    "length": ("list -> int", lambda l: len(l)),
+    "0": ("int", 0),
+    "1": ("int", 1),
+}
+
+target_type: str = "list"
@@ -0,0 +1,37 @@
+"""
+String manipulation with integer indices.
+"""
+
+import random
+import string
+from typing import Callable
+
+random.seed(1)
+
+
+def sample_string() -> str:
+    letters = string.ascii_letters + "  ,."
+    return "".join(random.choice(letters) for _ in range(random.randint(0, 12)))
+
+
+sample_dict: dict[str, Callable] = {
+    "str": sample_string,
+    "int": lambda: random.randint(-3, 12),
+}
+
+dsl: dict[str, tuple[str, Callable]] = {
+    "concat": ("str -> str -> str", lambda x, y: x + y),
+    "upper": ("str -> str", lambda x: x.upper()),
+    "lower": ("str -> str", lambda x: x.lower()),
+    "strip": ("str -> str", lambda x: x.strip()),
+    "take": ("str -> int -> str", lambda x, i: x[:i]),
+    "drop": ("str -> int -> str", lambda x, i: x[i:]),
+    "find": ("str -> str -> int", lambda x, y: x.find(y)),
+    "length": ("str -> int", lambda x: len(x)),
+    "+": ("int -> int -> int", lambda x, y: x + y),
+    "0": ("int", 0),
+    "1": ("int", 1),
+    "space": ("str", " "),
+}
+
+target_type: str = "str"
@@ -1,11 +1,21 @@
+from array import array
 from enum import StrEnum
+import importlib
+import io
+import mmap
+import re
+import struct
+import sys
+from typing import IO, Generator, Literal, Sequence, TextIO, overload
+import zlib
 
-from grape.automaton.tree_automaton import DFTA
+from grape.automaton.tree_automaton import DFTA, NFTA
 
 
 class AutomatonFormat(StrEnum):
     EBNF = ".ebnf"
     GRAPE = ".grape"
+    GRAPE_BINARY = ".grapeb"
     LARK = ".lark"
 
     @staticmethod
@@ -16,25 +26,139 @@ class AutomatonFormat(StrEnum):
         raise ValueError(f"invalid automaton format: '{content}")
 
 
-def dump_automaton_to_file(dfta: DFTA, file: str) -> None:
+GRAPEB_MAGIC = b"GRPB"
+GRAPEB_VERSION = 1
+# magic, version, number of: states, letters, finals, rules, ints in the rule array
+# then the crc32 of everything after the header
+__GRAPEB_HEADER__ = struct.Struct("<4sIIIIIII")
+
+
+# Extension -> module opening a compressed file, imported only when needed
+__COMPRESSIONS__ = {".gz": "gzip", ".xz": "lzma"}
+
+
+def __split_extension__(file: str) -> tuple[AutomatonFormat, str | None]:
+    """
+    Returns the automaton format and the compression extension if any, e.g.: grammar.grape.xz
+    """
     extension = file[file.rfind(".") :]
-    with open(file, "w") as fd:
-        fd.write(dump_automaton_to_str(dfta, AutomatonFormat.from_str(extension)))
+    compression = None
+    if extension in __COMPRESSIONS__:
+        compression = extension
+        file = file[: -len(extension)]
+        extension = file[file.rfind(".") :]
+    return AutomatonFormat.from_str(extension), compression
+
+
+def __open__(file: str, mode: str, compression: str | None) -> IO:
+    if compression is None:
+        return open(file, mode)
+    # Compressed files are opened in binary mode by default
+    if "b" not in mode:
+        mode += "t"
+    return importlib.import_module(__COMPRESSIONS__[compression]).open(file, mode)
+
+
+def dump_automaton_to_file(dfta: DFTA, file: str, sort: bool = True) -> None:
+    """
+    Dump the automaton, the format and the compression (.gz, .xz) are given by the extension.
+    If sort is False, rules are written in the order of the automaton.
+    """
+    format, compression = __split_extension__(file)
+    if format == AutomatonFormat.GRAPE_BINARY:
+        with __open__(file, "wb", compression) as fd:
+            fd.write(dump_automaton_to_bytes(dfta))
+    elif format == AutomatonFormat.GRAPE:
+        with __open__(file, "w", compression) as fd:
+            write_automaton(dfta, fd, sort)
+    else:
+        with __open__(file, "w", compression) as fd:
+            fd.write(dump_automaton_to_str(dfta, format))
+
+
+def write_automaton(dfta: DFTA, fd: TextIO, sort: bool = True) -> None:
+    """
+    Write the automaton in the .grape format one rule at a time.
+    If sort is False, rules are written in the order of the automaton.
+    """
+    fd.write("finals:" + ",".join(sorted(map(str, dfta.finals))) + "\n")
+    fd.write("letters:" + ",".join(sorted(map(str, dfta.alphabet))) + "\n")
+    fd.write("states:" + ",".join(sorted(map(str, dfta.states))) + "\n")
+    lines = (
+        f"{dst},{P}" + "".join("," + str(arg) for arg in args)
+        for (P, args), dst in dfta.rules.items()
+    )
+    if sort:
+        lines = iter(sorted(lines))
+    first = next(lines, None)
+    if first is not None:
+        fd.write(first)
+        for line in lines:
+            fd.write("\n")
+            fd.write(line)
+
+
+def __int32_bytes__(values: Sequence[int]) -> bytes:
+    data = array("i", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def __string_table__(strings: list[str]) -> bytes:
+    """
+    Offsets (n + 1 int32) followed by the utf-8 blob padded to 4 bytes.
+    """
+    encoded = [x.encode() for x in strings]
+    offsets = [0]
+    for x in encoded:
+        offsets.append(offsets[-1] + len(x))
+    blob = b"".join(encoded)
+    return __int32_bytes__(offsets) + blob + b"\0" * (-len(blob) % 4)
+
+
+def dump_automaton_to_bytes(dfta: DFTA) -> bytes:
+    """
+    Binary format: interned string tables for states and letters and flat int32 arrays.
+    A rule is stored as: dst, letter, arity, args...
+    """
+    states = sorted(set(map(str, dfta.all_states)) | set(map(str, dfta.finals)))
+    letters = sorted(set(map(str, dfta.alphabet)))
+    state_ids = {s: i for i, s in enumerate(states)}
+    letter_ids = {l: i for i, l in enumerate(letters)}
+    finals = sorted(state_ids[str(q)] for q in dfta.finals)
+    rules = []
+    for (P, args), dst in dfta.rules.items():
+        rules.append(state_ids[str(dst)])
+        rules.append(letter_ids[str(P)])
+        rules.append(len(args))
+        rules.extend(state_ids[str(arg)] for arg in args)
+    payload = b"".join(
+        [
+            __string_table__(states),
+            __string_table__(letters),
+            __int32_bytes__(finals),
+            __int32_bytes__(rules),
+        ]
+    )
+    header = __GRAPEB_HEADER__.pack(
+        GRAPEB_MAGIC,
+        GRAPEB_VERSION,
+        len(states),
+        len(letters),
+        len(finals),
+        len(dfta.rules),
+        len(rules),
+        zlib.crc32(payload),
+    )
+    return header + payload
 
 
 def dump_automaton_to_str(dfta: DFTA, format: AutomatonFormat) -> str:
     if format == AutomatonFormat.GRAPE:
-        s = "finals:" + ",".join(sorted(map(str, dfta.finals))) + "\n"
-        s += "letters:" + ",".join(sorted(map(str, dfta.alphabet))) + "\n"
-        s += "states:" + ",".join(sorted(map(str, dfta.states))) + "\n"
-        lines = []
-        for (P, args), dst in dfta.rules.items():
-            add = ""
-            if len(args) > 0:
-                add = "," + ",".join(map(str, args))
-            lines.append(f"{dst},{P}{add}")
-
-        return s + "\n".join(sorted(lines))
+        out = io.StringIO()
+        write_automaton(dfta, out)
+        return out.getvalue()
     elif format == AutomatonFormat.EBNF:
         elements = []
         dfta = dfta.map_states(lambda x: str(x).replace("=", "_").replace("-", "_"))
@@ -69,134 +193,426 @@ def dump_automaton_to_str(dfta: DFTA, format: AutomatonFormat) -> str:
 
 
 def load_automaton_from_file(file: str) -> DFTA[str, str]:
-    extension = file[file.rfind(".") :]
-    with open(file) as fd:
-        content = fd.read()
-        return load_automaton_from_str(content, AutomatonFormat.from_str(extension))
+    """
+    Load the automaton, the format and the compression (.gz, .xz) are given by the extension.
+    """
+    format, compression = __split_extension__(file)
+    if format == AutomatonFormat.GRAPE_BINARY:
+        if compression is not None:
+            with __open__(file, "rb", compression) as fd:
+                return load_automaton_from_bytes(fd.read())
+        with open(file, "rb") as fd:
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return load_automaton_from_bytes(data)
+    with __open__(file, "r", compression) as fd:
+        if format == AutomatonFormat.GRAPE:
+            return read_automaton(fd)
+        elif format == AutomatonFormat.EBNF:
+            return read_ebnf(fd)
+        elif format == AutomatonFormat.LARK:
+            return read_lark(fd)
+        else:
+            raise ValueError(f"unsupported format:{format}")
 
 
-def load_automaton_from_str(data: str, format: AutomatonFormat) -> DFTA[str, str]:
-    if format == AutomatonFormat.GRAPE:
-        lines = data.splitlines()
-        finals = set(
-            map(lambda x: x.strip(), lines.pop(0)[len("finals:") :].split(","))
-        )
-        letters = set(
-            map(lambda x: x.strip(), lines.pop(0)[len("letters:") :].split(","))
+def load_nfta_from_file(file: str) -> NFTA[str, str]:
+    """
+    Load a possibly nondeterministic automaton, only for the .ebnf and .lark formats.
+    """
+    format, compression = __split_extension__(file)
+    with __open__(file, "r", compression) as fd:
+        if format == AutomatonFormat.EBNF:
+            return read_ebnf(fd, True)
+        elif format == AutomatonFormat.LARK:
+            return read_lark(fd, True)
+        else:
+            return NFTA.from_dfta(load_automaton_from_file(file))
+
+
+def read_automaton(fd: TextIO) -> DFTA[str, str]:
+    """
+    Read an automaton in the .grape format one line at a time.
+    """
+    finals = set(map(lambda x: x.strip(), fd.readline()[len("finals:") :].split(",")))
+    letters = set(
+        map(lambda x: x.strip(), fd.readline()[len("letters:") :].split(","))
+    )
+    states = set(map(lambda x: x.strip(), fd.readline()[len("states:") :].split(",")))
+    rules = {}
+    for line_no, line in enumerate(fd):
+        line = line.rstrip("\r\n")
+        if len(line) == 0:
+            continue
+        elements = line.split(",")
+        dst = elements.pop(0)
+        assert dst in states, (
+            f"loading at line{3 + line_no}: state: '{dst}' not declared beforehand!"
         )
-        states = set(
-            map(lambda x: x.strip(), lines.pop(0)[len("states:") :].split(","))
+        letter = elements.pop(0)
+        assert letter in letters, (
+            f"loading at line{3 + line_no}: letter: '{letter}' not declared beforehand!"
         )
-        rules = {}
-        for line_no, line in enumerate(lines):
-            elements = line.split(",")
-            dst = elements.pop(0)
-            assert dst in states, (
-                f"loading at line{3 + line_no}: state: '{dst}' not declared beforehand!"
+        args = tuple(elements)
+        for arg in args:
+            assert arg in states, (
+                f"loading at line{3 + line_no}: state: '{arg}' not declared beforehand!"
             )
-            letter = elements.pop(0)
-            assert letter in letters, (
-                f"loading at line{3 + line_no}: letter: '{letter}' not declared beforehand!"
-            )
-            args = tuple(elements)
-            for arg in args:
-                assert arg in states, (
-                    f"loading at line{3 + line_no}: state: '{arg}' not declared beforehand!"
-                )
-            rules[(letter, args)] = dst
-        return DFTA(rules, set(finals))
-    elif format == AutomatonFormat.EBNF:
-        data = data.replace("\n", " ")
-        terminal_chars = ['"', "'"]
-        elements = data.split(";")
+        rules[(letter, args)] = dst
+    return DFTA(rules, set(finals))
+
+
+def load_automaton_from_bytes(data: bytes | mmap.mmap) -> DFTA[str, str]:
+    """
+    Load an automaton in the binary format, int32 arrays are read in place.
+    """
+    if len(data) < __GRAPEB_HEADER__.size:
+        raise ValueError("invalid binary automaton: truncated header")
+    magic, version, n_states, n_letters, n_finals, n_rules, n_ints, checksum = (
+        __GRAPEB_HEADER__.unpack_from(data)
+    )
+    if magic != GRAPEB_MAGIC:
+        raise ValueError("invalid binary automaton: bad magic number")
+    if version != GRAPEB_VERSION:
+        raise ValueError(f"unsupported binary automaton version: {version}")
+    views: list[memoryview] = []
+    try:
+        buffer = memoryview(data)
+        views.append(buffer)
+        payload = buffer[__GRAPEB_HEADER__.size :]
+        views.append(payload)
+        if zlib.crc32(payload) != checksum:
+            raise ValueError("invalid binary automaton: checksum mismatch")
+        offset = 0
+
+        def int32_array(n: int) -> Sequence[int]:
+            nonlocal offset
+            if offset + 4 * n > len(payload):
+                raise ValueError("invalid binary automaton: truncated data")
+            view = payload[offset : offset + 4 * n]
+            views.append(view)
+            offset += 4 * n
+            if sys.byteorder == "little":
+                out = view.cast("i")
+                views.append(out)
+                return out
+            out_array = array("i")
+            out_array.frombytes(view)
+            out_array.byteswap()
+            return out_array
+
+        def string_table(n: int) -> list[str]:
+            nonlocal offset
+            offsets = int32_array(n + 1)
+            start = offset
+            blob = bytes(payload[start : start + offsets[n]])
+            offset += offsets[n] + (-offsets[n] % 4)
+            return [blob[offsets[i] : offsets[i + 1]].decode() for i in range(n)]
+
+        states = string_table(n_states)
+        letters = string_table(n_letters)
+        finals = {states[i] for i in int32_array(n_finals)}
+        ints = int32_array(n_ints)
         rules = {}
-        finals = set()
-        for element in elements:
-            rules_for_nonterminals = [
-                x.strip() for x in element.split("=") if len(x.strip()) > 0
-            ]
-            if len(rules_for_nonterminals) <= 1:
-                continue
-            dst = rules_for_nonterminals.pop(0).strip()
-            finals.add(dst)
-            for sub_rule in "=".join(rules_for_nonterminals).split("|"):
-                sub_elements = [
-                    x.strip() for x in sub_rule.split(",") if len(x.strip()) > 0
-                ]
-                terminal = sub_elements.pop(0).strip()
-                assert any(
-                    terminal.startswith(c) and terminal.endswith(c)
-                    for c in terminal_chars
-                ), (
-                    f"error parsing rule: {element}\n\twhile handling:{sub_rule}\n\t\t<<{terminal}>> could not be parsed as a terminal"
-                )
-                args = tuple(map(lambda x: x.strip(), sub_elements))
-                rules[(terminal[1:-1], args)] = dst
+        i = 0
+        for _ in range(n_rules):
+            dst, letter, arity = ints[i], ints[i + 1], ints[i + 2]
+            args = tuple(states[x] for x in ints[i + 3 : i + 3 + arity])
+            rules[(letters[letter], args)] = states[dst]
+            i += 3 + arity
         return DFTA(rules, finals)
+    finally:
+        # mmap cannot be closed while views on it are alive
+        for view in reversed(views):
+            view.release()
+
+
+def load_automaton_from_str(data: str, format: AutomatonFormat) -> DFTA[str, str]:
+    if format == AutomatonFormat.GRAPE:
+        return read_automaton(io.StringIO(data))
+    elif format == AutomatonFormat.EBNF:
+        return read_ebnf(io.StringIO(data))
     elif format == AutomatonFormat.LARK:
-        terminal_chars = ['"', "'"]
-        elements = data.splitlines()
-        rules = {}
-        finals = set()
-        last_state = None
-
-        def parse_terminal(content: str) -> int:
-            for i, c in enumerate(content):
-                if c in terminal_chars:
-                    return i + 1
-            return len(content)
-
-        def parse_rule(rule: str, state: str):
-            elements = rule.split(" ")
-            to_add = []
-            stack = []
-            while elements:
-                element = elements.pop(0).strip()
-                if len(element) == 0:
+        return read_lark(io.StringIO(data))
+    else:
+        raise ValueError(f"unsupported format:{format}")
+
+
+# Token: (terminal, unterminated quote, symbol, name), only one is not empty
+Token = tuple[str, str, str, str]
+
+__QUOTES__ = "\"'"
+
+
+def __token_regex__(symbols: tuple[str, ...], spaced_names: bool) -> re.Pattern:
+    """
+    Names are the longest runs of characters that are not symbols or quotes,
+    if spaced_names they can contain (inner) spaces.
+    """
+    excluded = re.escape(__QUOTES__ + "".join(p[0] for p in symbols))
+    name_chars = ["[^" + excluded + ("\\n" if spaced_names else "\\s") + "]"]
+    # First character of a longer symbol that is not followed by the rest of it
+    for p in symbols:
+        if len(p) > 1:
+            name_chars.append(re.escape(p[0]) + "(?!" + re.escape(p[1:]) + ")")
+    name = "(?:" + "|".join(name_chars) + ")+"
+    return re.compile(
+        r"\s*(?:"
+        + r"(\"[^\"\n]*\"|'[^'\n]*')"
+        + r"|([\"'])"
+        + "|("
+        + "|".join(map(re.escape, sorted(symbols, key=len, reverse=True)))
+        + ")"
+        + "|("
+        + name
+        + "))"
+    )
+
+
+class __Tokenizer__:
+    """
+    Single pass tokenizer reading a file one line at a time.
+    Tokens of a line are produced at once by the regex engine, positions are
+    only computed when an error is reported.
+    """
+
+    def __init__(self, fd: TextIO, symbols: tuple[str, ...], spaced_names: bool):
+        self.fd = fd
+        self.regex = __token_regex__(symbols, spaced_names)
+        self.line_no = 0
+        self.line = ""
+
+    def lines(self) -> Generator[list[Token], None, None]:
+        for line_no, line in enumerate(self.fd, start=1):
+            self.line_no = line_no
+            self.line = line
+            tokens = self.regex.findall(line)
+            for terminal, unterminated, _, _ in tokens:
+                if unterminated:
+                    raise self.error(tokens.index(("", unterminated, "", "")), "")
+            yield tokens
+
+    def position(self, line_no: int, index: int) -> str:
+        """
+        Position of the index-th token of the line line_no.
+        The column is only known for the current line.
+        """
+        if line_no != self.line_no:
+            return f"line {line_no}"
+        match = list(self.regex.finditer(self.line))[index]
+        return f"line {line_no}, column {match.start(match.lastindex or 0) + 1}"
+
+    def error(self, index: int | None, expected: str) -> ValueError:
+        """
+        Error at the index-th token of the current line, None for the end of the file.
+        """
+        if index is None:
+            return ValueError(f"unexpected end of file, expected {expected}")
+        match = list(self.regex.finditer(self.line))[index]
+        position = self.position(self.line_no, index)
+        if match.group(2):
+            return ValueError(f"{position}: unterminated terminal")
+        return ValueError(
+            f"{position}: expected {expected} got '{match.group(match.lastindex or 0)}'"
+        )
+
+
+def __add_rule__(
+    rules: dict[tuple[str, tuple[str, ...]], set[str]],
+    letter: str,
+    args: tuple[str, ...],
+    dst: str,
+    tokenizer: __Tokenizer__,
+    line_no: int,
+    index: int,
+    nondeterministic: bool,
+) -> None:
+    dsts = rules.setdefault((letter, args), set())
+    if dsts and dst not in dsts and not nondeterministic:
+        raise ValueError(
+            f"{tokenizer.position(line_no, index)}: nondeterministic rule: '{letter}' {args} leads to both '{dsts.pop()}' and '{dst}'"
+        )
+    dsts.add(dst)
+
+
+def __make_automaton__(
+    rules: dict[tuple[str, tuple[str, ...]], set[str]],
+    finals: set[str],
+    nondeterministic: bool,
+) -> DFTA[str, str] | NFTA[str, str]:
+    if nondeterministic:
+        return NFTA(rules, finals)
+    return DFTA({key: dsts.pop() for key, dsts in rules.items()}, finals)
+
+
+@overload
+def read_ebnf(fd: TextIO, nondeterministic: Literal[False] = False) -> DFTA[str, str]:
+    pass
+
+
+@overload
+def read_ebnf(fd: TextIO, nondeterministic: Literal[True]) -> NFTA[str, str]:
+    pass
+
+
+def read_ebnf(
+    fd: TextIO, nondeterministic: bool = False
+) -> DFTA[str, str] | NFTA[str, str]:
+    """
+    Read an automaton in the EBNF subset where each rule starts with a terminal:
+    dst = "letter" , arg1 , arg2 | "other";
+    If nondeterministic, returns a NFTA instead of failing when a rule leads to several states.
+    """
+    tokenizer = __Tokenizer__(fd, ("=", ",", "|", ";"), True)
+    rules: dict[tuple[str, tuple[str, ...]], set[str]] = {}
+    finals = set()
+    # What is expected next
+    HEAD, EQUAL, TERMINAL, ARG, SEPARATOR = range(5)
+    expected_names = ["a non terminal", "'='", "a terminal", "a non terminal", "';'"]
+    expected = HEAD
+    dst = ""
+    # Current alternative
+    letter = ""
+    letter_position = (0, 0)
+    args: list[str] = []
+    for tokens in tokenizer.lines():
+        for index, (terminal, _, symbol, name) in enumerate(tokens):
+            if expected == SEPARATOR:
+                if symbol == ",":
+                    expected = ARG
                     continue
-                if any(element.startswith(letter) for letter in terminal_chars):
-                    end = parse_terminal(element[1:])
-                    stack.append(element[1:end])
-                    rest = element[end + 1 :].strip()
-                    if len(rest) > 0:
-                        elements.insert(0, rest)
-                elif element.startswith("..") and len(stack) > 0:
-                    other_terminal = element[3 : parse_terminal(element[3:])]
-                    previous = stack.pop()
-                    assert len(previous) == 1 and len(other_terminal) == 1, (
-                        f"cannot make range from '{previous}' to '{other_terminal}'"
-                    )
-                    for i in range(ord(previous), ord(other_terminal) + 1):
-                        to_add.append((chr(i), tuple()))
-                elif element == "|":
-                    to_add.append((stack[0], tuple(stack[1:])))
-                    stack.clear()
+                __add_rule__(
+                    rules,
+                    letter,
+                    tuple(args),
+                    dst,
+                    tokenizer,
+                    *letter_position,
+                    nondeterministic,
+                )
+                if symbol == "|":
+                    expected = TERMINAL
+                elif symbol == ";":
+                    expected = HEAD
                 else:
-                    stack.append(element)
-            if len(stack) > 0:
-                to_add.append((stack[0], tuple(stack[1:])))
-
-            for key in to_add:
-                rules[key] = state
-
-        for element in elements:
-            element = element.strip()
-            if ":" in element:
-                # We are defining a new rule
-                parts = element.split(":")
-                state = parts[0].strip()
-                finals.add(state)
-                last_state = state
-                rule = ":".join(parts[1:])
-                parse_rule(rule, state)
-            elif element.startswith("|"):
-                # we are adding to the last rule
-                assert last_state is not None
-                parse_rule(element[1:], last_state)
+                    raise tokenizer.error(index, "';'")
+            elif expected == ARG and name:
+                args.append(name.rstrip())
+                expected = SEPARATOR
+            elif expected == TERMINAL and terminal:
+                letter = terminal[1:-1]
+                letter_position = (tokenizer.line_no, index)
+                args = []
+                expected = SEPARATOR
+            elif expected == HEAD and name:
+                dst = name.rstrip()
+                finals.add(dst)
+                expected = EQUAL
+            elif expected == HEAD and symbol == ";":
+                continue
+            elif expected == EQUAL and symbol == "=":
+                expected = TERMINAL
             else:
-                # skip
-                pass
-        return DFTA(rules, finals)
+                raise tokenizer.error(index, expected_names[expected])
+    if expected == SEPARATOR:
+        __add_rule__(
+            rules,
+            letter,
+            tuple(args),
+            dst,
+            tokenizer,
+            *letter_position,
+            nondeterministic,
+        )
+    elif expected != HEAD:
+        raise tokenizer.error(None, expected_names[expected])
+    return __make_automaton__(rules, finals, nondeterministic)
 
-    else:
-        raise ValueError(f"unsupported format:{format}")
+
+@overload
+def read_lark(fd: TextIO, nondeterministic: Literal[False] = False) -> DFTA[str, str]:
+    pass
+
+
+@overload
+def read_lark(fd: TextIO, nondeterministic: Literal[True]) -> NFTA[str, str]:
+    pass
+
+
+def read_lark(
+    fd: TextIO, nondeterministic: bool = False
+) -> DFTA[str, str] | NFTA[str, str]:
+    """
+    Read an automaton in the Lark subset where each rule starts with a terminal:
+    dst : "letter" arg1 arg2 | "other"
+    Ranges of characters are supported: "a".."z".
+    If nondeterministic, returns a NFTA instead of failing when a rule leads to several states.
+    """
+    tokenizer = __Tokenizer__(fd, (":", "|", "..", "//"), False)
+    rules: dict[tuple[str, tuple[str, ...]], set[str]] = {}
+    finals = set()
+    state = ""
+    # Current alternative: (value, token index) of the letter then of the arguments
+    items: list[tuple[str, int]] = []
+
+    def end_alternative() -> None:
+        if items:
+            if not state:
+                raise tokenizer.error(items[0][1], "a rule definition")
+            letter, index = items[0]
+            args = tuple(value for value, _ in items[1:])
+            line_no = tokenizer.line_no
+            __add_rule__(
+                rules, letter, args, state, tokenizer, line_no, index, nondeterministic
+            )
+            items.clear()
+
+    for tokens in tokenizer.lines():
+        if tokens and tokens[0][3].startswith("%"):
+            # Directive
+            continue
+        # Token index of the '..' of a range waiting for its end
+        range_index = None
+        for index, (terminal, _, symbol, name) in enumerate(tokens):
+            if range_index is not None:
+                if len(terminal) != 3:
+                    raise tokenizer.error(index, "a character after '..'")
+                start, start_index = items.pop()
+                line_no = tokenizer.line_no
+                for i in range(ord(start), ord(terminal[1]) + 1):
+                    letter = chr(i)
+                    __add_rule__(
+                        rules,
+                        letter,
+                        (),
+                        state,
+                        tokenizer,
+                        line_no,
+                        start_index,
+                        nondeterministic,
+                    )
+                range_index = None
+            elif name:
+                items.append((name, index))
+            elif terminal:
+                items.append((terminal[1:-1], index))
+            elif symbol == ":":
+                name_before = index > 0 and tokens[index - 1][3]
+                if not items or items[-1][1] != index - 1 or not name_before:
+                    raise tokenizer.error(index, "a rule name before ':'")
+                head = items.pop()[0]
+                end_alternative()
+                state = head.lstrip("?!")
+                finals.add(state)
+            elif symbol == "|":
+                end_alternative()
+            elif symbol == "..":
+                if len(items) != 1 or len(tokens[index - 1][0]) != 3:
+                    raise tokenizer.error(index, "a single character before '..'")
+                range_index = index
+            elif symbol == "//":
+                break
+        if range_index is not None:
+            raise tokenizer.error(range_index, "a character after '..'")
+        # An alternative cannot span several lines
+        end_alternative()
+    return __make_automaton__(rules, finals, nondeterministic)
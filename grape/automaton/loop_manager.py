@@ -1,11 +1,11 @@
 from collections import defaultdict
+from dataclasses import dataclass, field
 from enum import StrEnum
+from bisect import bisect_right
 import itertools
-from typing import Generator
+from typing import Any, Generator
 
-from tqdm import tqdm
-
-from grape import types
+from grape import profiling, types
 from grape.automaton.spec_manager import is_specialized
 from grape.automaton.tree_automaton import DFTA
 from grape.dsl import DSL
@@ -17,153 +17,368 @@ class LoopingAlgorithm(StrEnum):
     GRAPE = "grape"
 
 
-def __state2letter__(state: str) -> str:
-    if "(" in state:
-        return state[1 : state.find(" ")]
-    else:
-        return state
+# Rules indexed by destination state: state -> list of (letter, args)
+ReversedRules = list[list[tuple[int, tuple[int, ...]]]]
+
+
+@dataclass
+class StateDescriptors:
+    """
+    Compact description of the states of a grammar where one state is one program.
+    States and letters are integers, each list is indexed by state.
+    """
+
+    states: list[Any]
+    letters: list[str]
+    letter: list[int]
+    size: list[int]
+    depth: list[int]
+    type_id: list[int]
+    is_var: list[bool]
+    types: list[str]
+
+    def add_state(self, letter: int, type_id: int, is_var: bool) -> int:
+        """
+        Add a new leaf state and returns it.
+        """
+        self.states.append(None)
+        self.letter.append(letter)
+        self.size.append(1)
+        self.depth.append(1)
+        self.type_id.append(type_id)
+        self.is_var.append(is_var)
+        return len(self.states) - 1
+
+
+def __is_variable__(letter: Any) -> bool:
+    if isinstance(letter, Variable):
+        return True
+    name = str(letter)
+    return name.startswith("var") and name[len("var") :].isdigit()
+
+
+def describe_states(
+    dfta: DFTA[Any, Any], state_to_type: dict[Any, str]
+) -> tuple[StateDescriptors, dict[tuple[int, tuple[int, ...]], int]]:
+    """
+    Returns the descriptors of the states of dfta and its rules over integers.
+
+    Assumes one state = one program: the head letter, size and depth of a state
+    are the ones of the first of its rules that can be derived.
+    """
+    state_ids: dict[Any, int] = {}
+    letter_ids: dict[str, int] = {}
+    descriptors = StateDescriptors([], [], [], [], [], [], [], [])
+    type_ids: dict[str, int] = {}
+
+    def get_state(state: Any) -> int:
+        out = state_ids.get(state)
+        if out is None:
+            out = len(state_ids)
+            state_ids[state] = out
+            descriptors.states.append(state)
+        return out
+
+    rules: dict[tuple[int, tuple[int, ...]], int] = {}
+    is_var_letter: list[bool] = []
+    for (P, args), dst in dfta.rules.items():
+        name = str(P)
+        letter = letter_ids.get(name)
+        if letter is None:
+            letter = len(letter_ids)
+            letter_ids[name] = letter
+            descriptors.letters.append(name)
+            is_var_letter.append(__is_variable__(P))
+        rules[(letter, tuple(map(get_state, args)))] = get_state(dst)
+    n = len(state_ids)
+    descriptors.letter = [-1] * n
+    descriptors.size = [0] * n
+    descriptors.depth = [0] * n
+    descriptors.is_var = [False] * n
+    for state in descriptors.states:
+        t = state_to_type[state]
+        if t not in type_ids:
+            type_ids[t] = len(type_ids)
+            descriptors.types.append(t)
+        descriptors.type_id.append(type_ids[t])
+    # Bottom-up propagation: a rule is ready once all its arguments are described
+    missing: list[int] = []
+    consumers: dict[int, list[int]] = defaultdict(list)
+    rule_list = list(rules.items())
+    ready = []
+    for i, ((letter, args), dst) in enumerate(rule_list):
+        missing.append(len(args))
+        for arg in args:
+            consumers[arg].append(i)
+        if len(args) == 0:
+            ready.append(i)
+    while ready:
+        i = ready.pop()
+        (letter, args), dst = rule_list[i]
+        if descriptors.letter[dst] >= 0:
+            continue
+        descriptors.letter[dst] = letter
+        descriptors.is_var[dst] = is_var_letter[letter]
+        descriptors.size[dst] = 1 + sum(descriptors.size[arg] for arg in args)
+        descriptors.depth[dst] = 1 + max(
+            (descriptors.depth[arg] for arg in args), default=0
+        )
+        for j in consumers[dst]:
+            missing[j] -= 1
+            if missing[j] == 0:
+                ready.append(j)
+    return descriptors, rules
 
 
 def __can_states_merge(
-    reversed_rules: dict[tuple[str, tuple[str, ...]], str],
-    original: str,
-    candidate: str,
-    merge_memory: dict[(str, str), bool],
-    state_to_letter: dict[str, tuple[str, bool]],
+    reversed_rules: ReversedRules,
+    original: int,
+    candidate: int,
+    merge_memory: dict[tuple[int, int], bool],
+    letter: list[int],
+    is_var: list[bool],
 ) -> bool:
+    """
+    original can be merged into candidate iff for each rule of original
+    there is a rule of candidate whose arguments can all be merged.
+
+    Iterative depth-first search, a frame is:
+    [original, candidate, rules of original, i, rules of candidate, j, k]
+    where the kth argument of the ith and jth rules is being checked.
+    """
     res = merge_memory.get((original, candidate))
-    if res is None:
-        lc = state_to_letter[candidate]
-        if lc[0] != state_to_letter[original][0] and not lc[1]:
+    if res is not None:
+        return res
+
+    def push(original: int, candidate: int) -> bool | None:
+        res = merge_memory.get((original, candidate))
+        if res is not None:
+            return res
+        if letter[candidate] != letter[original] and not is_var[candidate]:
             merge_memory[(original, candidate)] = False
-            merge_memory[(candidate, original)] = False
             return False
-        for P1, args1 in reversed_rules[original]:
-            has_equivalent = False
-            for P2, args2 in reversed_rules[candidate]:
-                if all(
-                    __can_states_merge(
-                        reversed_rules, arg1, arg2, merge_memory, state_to_letter
-                    )
-                    for arg1, arg2 in zip(args1, args2)
-                    if arg1 != arg2
-                ):
-                    has_equivalent = True
-                    break
-            if not has_equivalent:
-                merge_memory[(original, candidate)] = False
-                merge_memory[(candidate, original)] = False
-                return False
-        merge_memory[(original, candidate)] = True
-        merge_memory[(candidate, original)] = True
-        return True
-    else:
-        return res
+        stack.append(
+            [
+                original,
+                candidate,
+                reversed_rules[original],
+                0,
+                reversed_rules[candidate],
+                0,
+                0,
+            ]
+        )
+        return None
+
+    stack: list[list] = []
+    # Result of the last completed check
+    res = push(original, candidate)
+    while stack:
+        frame = stack[-1]
+        original, candidate, rules1, i, rules2, j, k = frame
+        while True:
+            if i == len(rules1):
+                res = True
+                break
+            if j == len(rules2):
+                res = False
+                break
+            args1 = rules1[i][1]
+            args2 = rules2[j][1]
+            if res is not None:
+                # Returning from the check of the kth argument
+                if res:
+                    k += 1
+                else:
+                    j += 1
+                    k = 0
+                res = None
+                continue
+            n = min(len(args1), len(args2))
+            while k < n and args1[k] == args2[k]:
+                k += 1
+            if k == n:
+                # The jth rule is equivalent to the ith rule
+                i += 1
+                j = 0
+                k = 0
+                continue
+            res = push(args1[k], args2[k])
+            if res is None:
+                break
+        if res is None:
+            frame[3], frame[5], frame[6] = i, j, k
+        else:
+            stack.pop()
+            # Merging is not symmetric: only this order is known
+            merge_memory[(original, candidate)] = res
+    assert res is not None
+    return res
+
+
+def __merge_table__(
+    reversed_rules: ReversedRules,
+    rules: dict[tuple[int, tuple[int, ...]], int],
+    descriptors: StateDescriptors,
+) -> list[frozenset[int]]:
+    """
+    Returns for each state the set of states it can be merged into, itself included.
+
+    Since one state is one program, a state can only be merged into a variable or
+    into a state read with its letter on arguments its own arguments can be merged
+    into, so the candidates are built bottom-up from the rules then checked.
+    """
+    n = len(reversed_rules)
+    letter = descriptors.letter
+    is_var = descriptors.is_var
+    variables = [s for s in range(n) if is_var[s]]
+    by_letter: dict[int, list[int]] = defaultdict(list)
+    for s in range(n):
+        by_letter[letter[s]].append(s)
+    # Arguments come first, states that cannot be derived last
+    order = sorted(range(n), key=lambda s: descriptors.depth[s] or n + 1)
+    table: list[frozenset[int] | None] = [None] * n
+    merge_memory: dict[tuple[int, int], bool] = {}
+    for s in order:
+        candidates = set(variables)
+        if reversed_rules[s]:
+            for P, args in reversed_rules[s]:
+                possibles = [table[arg] or (arg,) for arg in args]
+                for new_args in itertools.product(*possibles):
+                    dst = rules.get((P, new_args))
+                    if dst is not None:
+                        candidates.add(dst)
+        else:
+            candidates.update(by_letter[letter[s]])
+        table[s] = frozenset(
+            candidate
+            for candidate in candidates
+            if __can_states_merge(
+                reversed_rules, s, candidate, merge_memory, letter, is_var
+            )
+        )
+    return table
 
 
 def __find_merge__(
-    dfta: DFTA[str, str],
-    P: str,
-    args: tuple[str, ...],
-    candidates: set[str],
-    merge_memory: dict[(str, str), bool],
-    state_to_letter: dict[str, tuple[str, bool]],
-    state_to_size: dict[str, int],
-) -> str | None:
-    best_candidate = None
-    size_best = -1
+    reversed_rules: ReversedRules,
+    args: tuple[int, ...],
+    candidates: list[int],
+    merges: list[frozenset[int]],
+) -> int | None:
+    """
+    Candidates are sorted by decreasing size so the first one that fits is the largest.
+    """
     for candidate in candidates:
-        if state_to_size[candidate] <= size_best:
-            break
-        elif state_to_letter[candidate][0] != P and not state_to_letter[candidate][1]:
-            continue
-        has_equivalent = False
-        for P2, args2 in dfta.reversed_rules[candidate]:
-            if all(
-                __can_states_merge(
-                    dfta.reversed_rules, arg1, arg2, merge_memory, state_to_letter
-                )
-                for arg1, arg2 in zip(args, args2)
-                if arg1 != arg2
-            ):
-                has_equivalent = True
-                break
+        for _, args2 in reversed_rules[candidate]:
+            if all(arg2 in merges[arg1] for arg1, arg2 in zip(args, args2)):
+                return candidate
+    return None
+
+
+@dataclass
+class LoopContext:
+    """
+    Everything needed to compute the new rules of add_loops.
+    It is sent once to each worker in parallel mode.
+    """
+
+    algorithm: LoopingAlgorithm
+    max_size: int
+    descriptors: StateDescriptors
+    # Rules of the bounded automaton (without virtual variables)
+    base_reversed_rules: ReversedRules
+    # Rules of the automaton being extended (with virtual variables)
+    reversed_rules: ReversedRules
+    rules: dict[tuple[int, tuple[int, ...]], int]
+    states_by_types: dict[int, list[int]]
+    states_by_types_and_letter: dict[tuple[int, int], list[int]]
+    state_to_bucket: dict[int, tuple[list[int], list[int]]]
+    # state -> states it can be merged into, read-only,
+    # with the rules of the bounded automaton for base_merges
+    merges: list[frozenset[int]]
+    base_merges: list[frozenset[int]]
+    largest_merge: dict[int, list[int]] = field(default_factory=dict)
+
 
-        if has_equivalent:
-            size_best = state_to_size[candidate]
-            best_candidate = candidate
-    return best_candidate
-
-
-def __convert_automaton__(dfta: DFTA[str, str]) -> DFTA[str, Program]:
-    return dfta.map_alphabet(
-        lambda x: Variable(int(str(x)[len("var") :]))
-        if str(x).startswith("var")
-        else Primitive(str(x))
-    )
-
-
-def __get_largest_merges__(
-    state: str,
-    dfta: DFTA[str, str],
-    state_to_letter: dict[str, tuple[str, bool]],
-    state_to_size: dict[str, int],
-    merge_memory: dict[tuple[str, str], bool],
-    largest_merge: dict[str, str],
-    states_by_types_and_letter: dict[tuple[str, str], list[str]],
-) -> list[str]:
-    res = largest_merge.get(state, None)
+def __get_largest_merges__(state: int, ctx: LoopContext) -> list[int]:
+    res = ctx.largest_merge.get(state, None)
     if res is None:
-        candidates = [S for S in states_by_types_and_letter.values() if state in S].pop(
-            0
-        )
+        size_of = ctx.descriptors.size
+        candidates, neg_sizes = ctx.state_to_bucket.get(state, ([], []))
         out = []
         size = -1
-        my_size = state_to_size[state]
-        for candidate in candidates:
-            cs = state_to_size[candidate]
+        # Skip candidates that are not strictly smaller
+        start = bisect_right(neg_sizes, -size_of[state])
+        for candidate in candidates[start:]:
+            cs = size_of[candidate]
             if cs < size:
                 break
-            elif cs >= my_size:
-                continue
-            if __can_states_merge(
-                dfta.reversed_rules, state, candidate, merge_memory, state_to_letter
-            ):
-                out.append(state)
-                size = state_to_size[candidate]
-        largest_merge[state] = out
+            if candidate in ctx.base_merges[state]:
+                out.append(candidate)
+                size = size_of[candidate]
+        ctx.largest_merge[state] = out
         return out
     else:
         return res
 
 
 def __all_sub_args__(
-    combi: tuple[str, ...],
-    dfta: DFTA[str, str],
-    state_to_letter: dict[str, tuple[str, bool]],
-    state_to_size: dict[str, int],
-    merge_memory: dict[tuple[str, str], bool],
-    largest_merge: dict[str, str],
-    states_by_types_and_letter: dict[tuple[str, str], list[str]],
-) -> Generator[str, None, None]:
-    possibles = list(
-        map(
-            lambda s: __get_largest_merges__(
-                s,
-                dfta,
-                state_to_letter,
-                state_to_size,
-                merge_memory,
-                largest_merge,
-                states_by_types_and_letter,
-            ),
-            combi,
-        )
-    )
+    combi: tuple[int, ...], ctx: LoopContext
+) -> Generator[tuple[int, ...], None, None]:
+    possibles = [__get_largest_merges__(s, ctx) for s in combi]
     for new_args in itertools.product(*possibles):
         yield new_args
 
 
+def __is_allowed__(P: int, combi: tuple[int, ...], ctx: LoopContext) -> bool:
+    match ctx.algorithm:
+        case LoopingAlgorithm.OBSERVATIONAL_EQUIVALENCE:
+            return True
+        case LoopingAlgorithm.GRAPE:
+            size_of = ctx.descriptors.size
+            return all(
+                (P, sub_args) in ctx.rules
+                for sub_args in __all_sub_args__(combi, ctx)
+                if sum(size_of[x] for x in sub_args) + 1 <= ctx.max_size
+            )
+
+
+def __loop_task__(
+    P: int, rtype: int, possibles: list[list[int]], ctx: LoopContext
+) -> list[tuple[tuple[int, ...], int]]:
+    """
+    Returns the new rules (args, dst) for letter P among the given combinations.
+    """
+    candidates = ctx.states_by_types_and_letter.get((rtype, P), [])
+    size_of = ctx.descriptors.size
+    new_rules = []
+    for combi in itertools.product(*possibles):
+        dst_size = sum(size_of[x] for x in combi) + 1
+        if dst_size > ctx.max_size and __is_allowed__(P, combi, ctx):
+            new_state = __find_merge__(
+                ctx.reversed_rules, combi, candidates, ctx.merges
+            )
+            assert new_state is not None
+            new_rules.append((combi, new_state))
+    return new_rules
+
+
+# Context of the current worker process
+__WORKER_CONTEXT__: list[LoopContext] = []
+
+
+def __init_worker__(ctx: LoopContext) -> None:
+    __WORKER_CONTEXT__.append(ctx)
+
+
+def __run_worker_task__(
+    task: tuple[int, int, list[list[int]]],
+) -> list[tuple[tuple[int, ...], int]]:
+    P, rtype, possibles = task
+    return __loop_task__(P, rtype, possibles, __WORKER_CONTEXT__[0])
+
+
 def __product__(elements: list[int]) -> int:
     out = 1
     for x in elements:
@@ -171,152 +386,190 @@ def __product__(elements: list[int]) -> int:
     return out
 
 
+def __to_program__(letter: str) -> Program:
+    if __is_variable__(letter):
+        return Variable(int(letter[len("var") :]))
+    else:
+        return Primitive(letter)
+
+
+@profiling.timed("add_loops")
 def add_loops(
-    dfta: DFTA[str, Program | str],
+    dfta: DFTA[Any, Program | str],
     dsl: DSL,
     algorithm: LoopingAlgorithm = LoopingAlgorithm.OBSERVATIONAL_EQUIVALENCE,
     use_tqdm: bool = False,
+    jobs: int = 1,
 ) -> DFTA[str, Program]:
     """
     Assumes specialized DFTA, one state = one letter and that variants are mapped.
+
+    A state can only be merged into a state that generalises it, that is the same
+    program where some subprograms are replaced by variables. This check is not
+    symmetric: earlier versions also stored its result for the reversed pair, so
+    their output depended on the order of the combinations and had more rules.
+
+    With jobs > 1, the combinations are split across worker processes,
+    which all read the same precomputed merge tables.
     """
     if dfta.is_unbounded():
         raise ValueError("automaton is already looping: cannot add loops!")
     elif not is_specialized(dfta):
         raise ValueError("automaton is not specialized: cannot add loops!")
     else:
-        match algorithm:
-            case LoopingAlgorithm.OBSERVATIONAL_EQUIVALENCE:
-
-                def is_allowed(*args, **kwargs):
-                    return True
-            case LoopingAlgorithm.GRAPE:
-
-                def is_allowed(
-                    P: str,
-                    combi: tuple[str, ...],
-                    dfta: DFTA[str, str | Program],
-                    state_to_letter: dict[str, tuple[str, bool]],
-                    state_to_size: dict[str, int],
-                    merge_memory: dict[tuple[str, str], bool],
-                    largest_merge: dict[str, str],
-                    states_by_types_and_letter: dict[tuple[str, str], list[str]],
-                ) -> bool:
-                    return all(
-                        (P, sub_args) in new_dfta
-                        for sub_args in __all_sub_args__(
-                            combi,
-                            dfta,
-                            state_to_letter,
-                            state_to_size,
-                            merge_memory,
-                            largest_merge,
-                            states_by_types_and_letter,
-                        )
-                        if sum(map(lambda x: state_to_size[x], sub_args)) + 1
-                        <= max_size
-                    )
-
-        dfta = dfta.map_alphabet(str)
         state_to_type = dsl.get_state_types(dfta)
-        state_to_size = {s: s.count(" ") + 1 for s in dfta.all_states}
-        state_to_letter = {
-            s: (__state2letter__(s), __state2letter__(s).startswith("var"))
-            for s in dfta.all_states
-        }
-        max_size = max(state_to_size.values())
+        descriptors, rules = describe_states(dfta, state_to_type)
+        letter_ids = {name: i for i, name in enumerate(descriptors.letters)}
+        type_ids = {t: i for i, t in enumerate(descriptors.types)}
+        size_of = descriptors.size
+        is_var = descriptors.is_var
+        max_size = max(size_of)
+        # Keep the order of state_to_type among states of same size
+        state_ids = {s: i for i, s in enumerate(descriptors.states)}
+        ordered = [state_ids[s] for s in state_to_type]
         states_by_types = {
             t: sorted(
-                [s for s, st in state_to_type.items() if st == t],
+                [s for s in ordered if descriptors.type_id[s] == t],
                 reverse=True,
-                key=lambda s: state_to_size[s],
+                key=lambda s: size_of[s],
             )
-            for t in set(state_to_type.values())
+            for t in range(len(descriptors.types))
         }
-        new_dfta = DFTA(dfta.rules.copy(), dfta.finals.copy())
-        virtual_vars = set()
+        base_reversed_rules: ReversedRules = [[] for _ in descriptors.states]
+        for (letter, args), dst in rules.items():
+            base_reversed_rules[dst].append((letter, args))
+        new_rules = rules.copy()
+        virtual_vars = []
         max_varno = (
             max(
-                int(s[len("var") :])
-                for s in state_to_type.keys()
-                if state_to_letter[s][1]
+                (
+                    int(name[len("var") :])
+                    for name in descriptors.letters
+                    if __is_variable__(name)
+                ),
+                default=-1,
             )
             + 1
         )
-        for t, states in states_by_types.copy().items():
-            if all(not state_to_letter[s][1] for s in states):
-                virtual_vars.add(max_varno)
-                dst = str(Variable(max_varno))
-                new_dfta.rules[(dst, tuple())] = dst
+        for t, states in states_by_types.items():
+            if all(not is_var[s] for s in states):
+                name = str(Variable(max_varno))
+                letter = len(descriptors.letters)
+                descriptors.letters.append(name)
+                letter_ids[name] = letter
+                dst = descriptors.add_state(letter, t, True)
+                new_rules[(letter, tuple())] = dst
                 states_by_types[t].append(dst)
-                state_to_size[dst] = 1
-                state_to_letter[dst] = (dst, True)
+                virtual_vars.append((letter, tuple()))
                 max_varno += 1
-        new_dfta.refresh_reversed_rules()
-        merge_memory = {}
-        largest_merge = {}
-        states_by_types_and_letter = defaultdict(list)
+        reversed_rules: ReversedRules = [[] for _ in descriptors.states]
+        for (letter, args), dst in new_rules.items():
+            reversed_rules[dst].append((letter, args))
+        for _ in range(len(descriptors.states) - len(base_reversed_rules)):
+            base_reversed_rules.append([])
+        states_by_types_and_letter: dict[tuple[int, int], list[int]] = defaultdict(
+            list
+        )
         for t, states in states_by_types.items():
             later = []
             for s in states:
-                if state_to_letter[s][1]:
+                if is_var[s]:
                     later.append(s)
                 else:
-                    key = (t, state_to_letter[s][0])
+                    key = (t, descriptors.letter[s])
                     states_by_types_and_letter[key].append(s)
             for (tt, _), val in states_by_types_and_letter.items():
                 if tt == t:
                     for x in later:
                         val.append(x)
-        update = lambda: 1
+        # Index: state -> (first bucket containing it, negated sizes of bucket)
+        state_to_bucket: dict[int, tuple[list[int], list[int]]] = {}
+        for bucket in states_by_types_and_letter.values():
+            indexed = (bucket, [-size_of[s] for s in bucket])
+            for s in bucket:
+                state_to_bucket.setdefault(s, indexed)
+        with profiling.timer("add_loops.merge_table"):
+            merges = __merge_table__(reversed_rules, new_rules, descriptors)
+            base_merges = []
+            if algorithm == LoopingAlgorithm.GRAPE:
+                base_merges = __merge_table__(base_reversed_rules, rules, descriptors)
+        ctx = LoopContext(
+            algorithm,
+            max_size,
+            descriptors,
+            base_reversed_rules,
+            reversed_rules,
+            new_rules,
+            states_by_types,
+            dict(states_by_types_and_letter),
+            state_to_bucket,
+            merges,
+            base_merges,
+        )
+        # Tasks: (letter, return type, possible states for each argument)
+        # split along the first argument
+        tasks: list[tuple[int, int, list[list[int]]]] = []
+        for P, (Ptype, _) in dsl.primitives.items():
+            args_types, rtype = types.parse(Ptype)
+            if len(args_types) == 0:
+                continue
+            if P not in letter_ids:
+                letter_ids[P] = len(descriptors.letters)
+                descriptors.letters.append(P)
+            possibles = [
+                states_by_types[type_ids[arg_t]] if arg_t in type_ids else []
+                for arg_t in args_types
+            ]
+            for first in possibles[0]:
+                tasks.append(
+                    (letter_ids[P], type_ids.get(rtype, -1), [[first]] + possibles[1:])
+                )
+        update = lambda _: 1
         if use_tqdm:
+            from tqdm import tqdm
+
             pbar = tqdm(
-                total=sum(
-                    __product__(
-                        [
-                            len(states_by_types[arg_t])
-                            for arg_t in types.arguments(Ptype)
-                        ]
-                    )
-                    for (Ptype, _) in dsl.primitives.values()
-                ),
+                total=sum(__product__(list(map(len, task[2]))) for task in tasks),
                 desc="adding loops",
             )
-            update = lambda: pbar.update()
-        for P, (Ptype, _) in dsl.primitives.items():
-            args_types, rtype = types.parse(Ptype)
-            possibles = [states_by_types[arg_t] for arg_t in args_types]
-            for combi in itertools.product(*possibles):
-                update()
-                key = (P, combi)
-                dst_size = sum(map(lambda x: state_to_size[x], combi)) + 1
-                if dst_size > max_size and is_allowed(
-                    P,
-                    combi,
-                    dfta,
-                    state_to_letter,
-                    state_to_size,
-                    merge_memory,
-                    largest_merge,
-                    states_by_types_and_letter,
-                ):
-                    assert key not in new_dfta.rules
-                    new_state = __find_merge__(
-                        new_dfta,
-                        P,
-                        combi,
-                        states_by_types_and_letter[(rtype, P)],
-                        merge_memory,
-                        state_to_letter,
-                        state_to_size,
-                    )
-                    assert new_state in state_to_size
-                    new_dfta.rules[key] = new_state
+            update = lambda task: pbar.update(__product__(list(map(len, task[2]))))
+        if jobs > 1:
+            import multiprocessing
+
+            # Do not fork: the caller may be multi-threaded (e.g. tqdm monitor)
+            mp_context = multiprocessing.get_context("spawn")
+            with mp_context.Pool(
+                jobs, initializer=__init_worker__, initargs=(ctx,)
+            ) as pool:
+                results = pool.imap(__run_worker_task__, tasks, chunksize=16)
+                for task, task_rules in zip(tasks, results):
+                    update(task)
+                    for combi, new_state in task_rules:
+                        assert (task[0], combi) not in new_rules
+                        new_rules[(task[0], combi)] = new_state
+        else:
+            for task in tasks:
+                P, rtype, possibles = task
+                for combi, new_state in __loop_task__(P, rtype, possibles, ctx):
+                    assert (P, combi) not in new_rules
+                    new_rules[(P, combi)] = new_state
+                update(task)
         if use_tqdm:
             pbar.close()
-        for no in virtual_vars:
-            dst = str(Variable(no))
-            del new_dfta.rules[(dst, tuple())]
+        if profiling.ENABLED:
+            profiling.count("add_loops.tasks", len(tasks))
+            profiling.count("add_loops.new_rules", len(new_rules) - len(rules))
+            profiling.count("add_loops.virtual_variables", len(virtual_vars))
+            profiling.count("add_loops.merges", sum(map(len, merges)))
+        for key in virtual_vars:
+            del new_rules[key]
 
-        new_dfta.reduce()
-        return __convert_automaton__(new_dfta).minimise().classic_state_renaming()
+        letters = [__to_program__(name) for name in descriptors.letters]
+        new_dfta = DFTA(
+            {(letters[P], args): dst for (P, args), dst in new_rules.items()},
+            # A final state without rule cannot be reached
+            {state_ids[s] for s in dfta.finals if s in state_ids},
+        )
+        with profiling.timer("add_loops.minimise"):
+            new_dfta.reduce()
+            return new_dfta.minimise().classic_state_renaming()
@@ -1,5 +1,13 @@
 from collections import defaultdict
-from typing import TYPE_CHECKING, TypeVar, overload
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Generator,
+    NamedTuple,
+    TypeVar,
+    overload,
+)
 
 from grape import types
 from grape.automaton.tree_automaton import DFTA
@@ -70,6 +78,170 @@ def specialize(
     return dfta
 
 
+class SpecializationIndex(NamedTuple):
+    """
+    Type-indexed view of a despecialized grammar shared by all its specializations.
+    Rules are referred to by their index in rules.
+    """
+
+    rules: list[tuple[tuple[Any, tuple[Any, ...]], Any]]
+    # var type -> destination of the var_type rule
+    var_dst: dict[str, Any]
+    make_var: Callable[[int], Any]
+    finals: list[Any]
+    state_to_type: dict[Any, str] | None
+    # state -> indices of the rules that consume it
+    consumers: dict[Any, list[int]]
+    # state -> indices of the rules that produce it
+    producers: dict[Any, list[int]]
+    # number of distinct arguments of each rule
+    arities: list[int]
+
+
+def __make_str_var__(i: int) -> str:
+    return f"var{i}"
+
+
+def build_specialization_index(
+    grammar: DFTA[T, str] | DFTA[T, Program], syntax: "DSL | None"
+) -> SpecializationIndex:
+    """
+    Precompute what is needed to specialize the despecialized grammar to many type requests.
+    """
+    make_var = (
+        __make_str_var__ if isinstance(list(grammar.alphabet)[0], str) else Variable
+    )
+    rules = []
+    var_dst = {}
+    consumers = defaultdict(list)
+    producers = defaultdict(list)
+    arities = []
+    for (P, args), dst in grammar.rules.items():
+        if str(P).startswith("var_"):
+            var_dst[str(P)[len("var_") :]] = dst
+            continue
+        i = len(rules)
+        rules.append(((P, args), dst))
+        distinct = set(args)
+        arities.append(len(distinct))
+        for arg in distinct:
+            consumers[arg].append(i)
+        producers[dst].append(i)
+    return SpecializationIndex(
+        rules,
+        var_dst,
+        make_var,
+        list(grammar.finals),
+        None if syntax is None else syntax.get_state_types(grammar),
+        dict(consumers),
+        dict(producers),
+        arities,
+    )
+
+
+def specialize_from_index(index: SpecializationIndex, type_req: str) -> DFTA[Any, Any]:
+    """
+    Same as specialize followed by reduce but only walks the part of the grammar
+    that is reachable with the variables of type_req.
+    """
+    arg_types = types.arguments(type_req)
+    rtype = types.return_type(type_req)
+    whatever = rtype.lower() == "none"
+    var_rules = {
+        (index.make_var(i), ()): index.var_dst[arg_type]
+        for i, arg_type in enumerate(arg_types)
+        if arg_type in index.var_dst
+    }
+    # Reachable states and rules
+    missing = index.arities.copy()
+    reachable = set(var_rules.values())
+    stack = list(reachable)
+    used = []
+    for i, arity in enumerate(missing):
+        if arity == 0:
+            used.append(i)
+            dst = index.rules[i][1]
+            if dst not in reachable:
+                reachable.add(dst)
+                stack.append(dst)
+    while stack:
+        state = stack.pop()
+        for i in index.consumers.get(state, []):
+            missing[i] -= 1
+            if missing[i] == 0:
+                used.append(i)
+                dst = index.rules[i][1]
+                if dst not in reachable:
+                    reachable.add(dst)
+                    stack.append(dst)
+    if whatever or index.state_to_type is None:
+        finals = {q for q in index.finals if q in reachable}
+    else:
+        finals = {
+            q
+            for q in index.finals
+            if q in reachable and index.state_to_type[q] == rtype
+        }
+    # Productive states
+    is_used = [False] * len(index.rules)
+    for i in used:
+        is_used[i] = True
+    productive = set(finals)
+    stack = list(finals)
+    while stack:
+        state = stack.pop()
+        for i in index.producers.get(state, []):
+            if is_used[i]:
+                for arg in index.rules[i][0][1]:
+                    if arg not in productive:
+                        productive.add(arg)
+                        stack.append(arg)
+    new_rules = {key: dst for key, dst in var_rules.items() if dst in productive}
+    for i in sorted(used):
+        key, dst = index.rules[i]
+        if dst in productive:
+            new_rules[key] = dst
+    return DFTA(new_rules, finals)
+
+
+# Index of the current worker process
+__WORKER_INDEX__: list[SpecializationIndex] = []
+
+
+def __init_worker__(index: SpecializationIndex) -> None:
+    __WORKER_INDEX__.append(index)
+
+
+def __run_worker_task__(type_req: str) -> DFTA[Any, Any]:
+    return specialize_from_index(__WORKER_INDEX__[0], type_req)
+
+
+def specialize_many(
+    grammar: DFTA[T, str] | DFTA[T, Program],
+    type_requests: list[str],
+    syntax: "DSL | None",
+    jobs: int = 1,
+) -> Generator[DFTA[T, str] | DFTA[T, Program], None, None]:
+    """
+    Specialize a despecialized grammar to each of the specified type requests.
+    Yields reduced grammars in the order of type_requests.
+
+    With jobs > 1, type requests are split across worker processes.
+    """
+    index = build_specialization_index(grammar, syntax)
+    if jobs > 1 and len(type_requests) > 1:
+        import multiprocessing
+
+        mp_context = multiprocessing.get_context("spawn")
+        with mp_context.Pool(
+            jobs, initializer=__init_worker__, initargs=(index,)
+        ) as pool:
+            yield from pool.imap(__run_worker_task__, type_requests)
+    else:
+        for type_req in type_requests:
+            yield specialize_from_index(index, type_req)
+
+
 def is_specialized(grammar: DFTA[T, str] | DFTA[T, Program]) -> bool:
     """
     Returns true if this grammar is specialized.
@@ -82,33 +254,52 @@ def type_request_from_specialized(
 ) -> str:
     """
     Returns the type request of this specialized grammar.
+    The result is cached on the grammar until its rules change.
     """
+    return grammar.cached(
+        ("type_request", dsl), lambda: __guess_type_request__(grammar, dsl)
+    )
+
+
+def __guess_type_request__(
+    grammar: DFTA[T, str] | DFTA[T, Program], dsl: "DSL"
+) -> str:
     # Guess variable type
     states_by_var = defaultdict(set)
-    for (P, args), dst in grammar.rules.items():
+    # state -> rules that consume it
+    consumers = defaultdict(list)
+    elements = list(grammar.rules.items())
+    for i, ((P, args), dst) in enumerate(elements):
         if str(P).startswith("var"):
             varno = int(str(P)[len("var") :])
             states_by_var[varno].add(dst)
+        else:
+            for arg in set(args):
+                consumers[arg].append(i)
 
     varno_to_type = {}
 
     for varno, states in states_by_var.items():
         possibles = None
-        for (P, args), dst in grammar.rules.items():
-            if str(P).startswith("var"):
-                continue
-            local = []
-            for variant_type in types.all_variants(dsl.get_type(str(P))):
-                for arg, arg_type in zip(args, types.arguments(variant_type)):
-                    if arg in states:
-                        local.append(arg_type)
-            if local:
-                if possibles is None:
-                    possibles = set(local)
-                else:
-                    possibles.intersection_update(local)
+        seen = set()
+        for state in states:
+            for i in consumers[state]:
+                if i in seen:
+                    continue
+                seen.add(i)
+                (P, args), _ = elements[i]
+                local = set()
+                for arg_types, _ in dsl.get_type_signatures(dsl.get_type(str(P))):
+                    for arg, arg_type in zip(args, arg_types):
+                        if arg in states:
+                            local.add(arg_type)
+                if local:
+                    if possibles is None:
+                        possibles = local
+                    else:
+                        possibles.intersection_update(local)
         assert possibles is not None
-        varno_to_type[varno] = "|".join(possibles)
+        varno_to_type[varno] = "|".join(sorted(possibles))
     varlen = max(varno_to_type.keys())
     # Guess return type
     return_types = set()
@@ -1,7 +1,9 @@
 from collections import defaultdict
 from typing import (
+    Any,
     Callable,
     Dict,
+    FrozenSet,
     Generator,
     Generic,
     List,
@@ -14,7 +16,9 @@ from typing import (
     overload,
 )
 import itertools
+from grape import profiling
 from grape.partitions import integer_partitions
+from grape.program import Function, Primitive, Program
 
 U = TypeVar("U")
 V = TypeVar("V")
@@ -22,6 +26,47 @@ W = TypeVar("W")
 X = TypeVar("X")
 
 
+class __Rules__(dict):
+    """
+    Dict of rules that counts its in-place edits, so that cached values can tell
+    when the rules changed.
+    """
+
+    edits = 0
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.edits += 1
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        self.edits += 1
+        super().__delitem__(key)
+
+    def __ior__(self, other: Any) -> "__Rules__":
+        self.edits += 1
+        return super().__ior__(other)
+
+    def pop(self, *args: Any) -> Any:
+        self.edits += 1
+        return super().pop(*args)
+
+    def popitem(self) -> Any:
+        self.edits += 1
+        return super().popitem()
+
+    def setdefault(self, *args: Any) -> Any:
+        self.edits += 1
+        return super().setdefault(*args)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        self.edits += 1
+        super().update(*args, **kwargs)
+
+    def clear(self) -> None:
+        self.edits += 1
+        super().clear()
+
+
 class DFTA(Generic[U, V]):
     """
     Deterministic finite tree automaton.
@@ -40,8 +85,11 @@ class DFTA(Generic[U, V]):
         ],
         finals: Set[U],
     ) -> None:
+        # Bumped each time the rules or the finals are replaced or refreshed
+        self.__version = 0
+        self.__cache: Dict[Any, Tuple[Tuple[int, int], Any]] = {}
         self.finals = {s for s in sorted(finals)}
-        self.rules = {k: rules[k] for k in sorted(rules, key=str)}
+        self.rules = __Rules__((k, rules[k]) for k in sorted(rules, key=str))
         self.reversed_rules: Dict[
             U,
             List[
@@ -53,11 +101,63 @@ class DFTA(Generic[U, V]):
         ] = {}
         self.refresh_reversed_rules()
 
+    @property
+    def rules(self) -> Dict[Tuple[V, Tuple[U, ...]], U]:
+        return self.__rules
+
+    @rules.setter
+    def rules(self, rules: Dict[Tuple[V, Tuple[U, ...]], U]) -> None:
+        if not isinstance(rules, __Rules__):
+            rules = __Rules__(rules)
+        self.__rules = rules
+        self.__version += 1
+
+    @property
+    def finals(self) -> Set[U]:
+        return self.__finals
+
+    @finals.setter
+    def finals(self, finals: Set[U]) -> None:
+        self.__finals = finals
+        self.__version += 1
+
     def refresh_reversed_rules(self) -> None:
+        self.__version += 1
         self.reversed_rules = defaultdict(list)
         for r, s in self.rules.items():
             self.reversed_rules[s].append(r)
 
+    def cached(self, key: Any, compute: Callable[[], X]) -> X:
+        """
+        Returns compute() which is computed at most once per version of the rules.
+        """
+        version = (self.__version, self.__rules.edits)
+        entry = self.__cache.get(key)
+        if entry is None or entry[0] != version:
+            entry = (version, compute())
+            self.__cache[key] = entry
+        return entry[1]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Cached values may hold objects that cannot be pickled
+        state = self.__dict__.copy()
+        state["_DFTA__cache"] = {}
+        return state
+
+    def copy(self) -> "DFTA[U, V]":
+        """
+        Copy of the automaton that can be modified independently, rules are not sorted again.
+        """
+        out: DFTA[U, V] = DFTA.__new__(DFTA)
+        out.__version = 0
+        out.__cache = {}
+        out.finals = set(self.finals)
+        out.rules = __Rules__(self.rules)
+        out.reversed_rules = defaultdict(list)
+        for dst, keys in self.reversed_rules.items():
+            out.reversed_rules[dst] = list(keys)
+        return out
+
     def size(self) -> int:
         """
         Return the size of the DFTA which is the number of rules.
@@ -144,12 +244,14 @@ class DFTA(Generic[U, V]):
                 new_rules[(P1, new_args)] = (dst1, dst2)
         return new_rules
 
+    @profiling.timed("dfta.intersection")
     def read_intersection(self, other: "DFTA[W, V]") -> "DFTA[tuple[U, W], V]":
         new_finals = set(el for el in itertools.product(self.finals, other.finals))
         d = DFTA(self.__product_rules__(other), new_finals)
         d.reduce()
         return d
 
+    @profiling.timed("dfta.union")
     def read_union(self, other: "DFTA[W, V]") -> "DFTA[tuple[U, W], V]":
         new_finals = set(
             el for el in itertools.product(self.finals, other.states)
@@ -181,6 +283,7 @@ class DFTA(Generic[U, V]):
                     del self.rules[S]
                     removed = True
 
+    @profiling.timed("dfta.reduce")
     def reduce(self) -> None:
         """
         Removes unreachable states and unproductive states.
@@ -205,6 +308,7 @@ class DFTA(Generic[U, V]):
     ) -> "DFTA[Tuple[U, ...], V]":
         pass
 
+    @profiling.timed("dfta.minimise")
     def minimise(
         self,
         mapping: Union[Literal[None], Callable[[Tuple[U, ...]], W]] = None,
@@ -316,6 +420,7 @@ class DFTA(Generic[U, V]):
             new_rules[(l, t_args)] = f(cls2states[state2cls[dst]])
         return DFTA(new_rules, {f(cls2states[state2cls[q]]) for q in self.finals})  # type: ignore
 
+    @profiling.timed("dfta.map_states")
     def map_states(self, mapping: Callable[[U], X]) -> "DFTA[X, V]":
         return DFTA(
             {
@@ -325,6 +430,7 @@ class DFTA(Generic[U, V]):
             set(map(mapping, self.finals)),
         )
 
+    @profiling.timed("dfta.classic_state_renaming")
     def classic_state_renaming(self) -> "DFTA[str, V]":
         """
         Rename states in the format SXX
@@ -370,6 +476,7 @@ class DFTA(Generic[U, V]):
                             count[state][csize] += total
             yield csize, sum(count[state][csize] for state in accepted)
 
+    @profiling.timed("dfta.trees_by_size")
     def trees_by_size(self, size: int, finals_only: bool = True) -> dict[int, int]:
         """
         Return the number of trees produced of all sizes until the given size (included).
@@ -415,6 +522,7 @@ class DFTA(Generic[U, V]):
                     updated = True
         return False
 
+    @profiling.timed("dfta.compute_max_size_and_depth")
     def compute_max_size_and_depth(self) -> tuple[int, int]:
         """
         Return max size and max depth
@@ -470,3 +578,288 @@ class DFTA(Generic[U, V]):
             lines.append(f"{dst} <- '{P}' {add}")
 
         return s + "\n".join(sorted(lines))
+
+
+class NFTA(Generic[U, V]):
+    """
+    Nondeterministic finite tree automaton.
+    states: U
+    alphabet: V
+    A rule maps (letter, args) to a set of states.
+    """
+
+    def __init__(
+        self,
+        rules: Dict[
+            Tuple[
+                V,
+                Tuple[U, ...],
+            ],
+            Set[U],
+        ],
+        finals: Set[U],
+    ) -> None:
+        self.finals = set(finals)
+        self.rules = {k: set(rules[k]) for k in sorted(rules, key=str) if rules[k]}
+        # letter -> first argument (None if no argument) -> list of (args, dsts)
+        self.__by_letter: Dict[
+            V, Dict[Optional[U], List[Tuple[Tuple[U, ...], Set[U]]]]
+        ] = defaultdict(lambda: defaultdict(list))
+        for (letter, args), dsts in self.rules.items():
+            first = args[0] if args else None
+            self.__by_letter[letter][first].append((args, dsts))
+
+    @staticmethod
+    def from_dfta(dfta: DFTA[U, V]) -> "NFTA[U, V]":
+        return NFTA({key: {dst} for key, dst in dfta.rules.items()}, dfta.finals)
+
+    @property
+    def all_states(self) -> Set[U]:
+        """
+        The set of all states.
+        """
+        states = set(self.finals)
+        for (_, args), dsts in self.rules.items():
+            states.update(dsts)
+            states.update(args)
+        return states
+
+    @property
+    def alphabet(self) -> Set[V]:
+        """
+        The set of letters.
+        """
+        return {letter for letter, _ in self.rules}
+
+    def is_deterministic(self) -> bool:
+        return all(len(dsts) == 1 for dsts in self.rules.values())
+
+    def read(self, letter: V, children: Tuple[FrozenSet[U], ...]) -> FrozenSet[U]:
+        """
+        Set of states reached by reading letter on sets of states.
+        """
+        by_first = self.__by_letter.get(letter)
+        if by_first is None:
+            return frozenset()
+        out: Set[U] = set()
+        if not children:
+            for _, dsts in by_first.get(None, []):
+                out.update(dsts)
+            return frozenset(out)
+        for first in children[0]:
+            for args, dsts in by_first.get(first, []):
+                if len(args) == len(children) and all(
+                    arg in child for arg, child in zip(args[1:], children[1:])
+                ):
+                    out.update(dsts)
+        return frozenset(out)
+
+    def lazy_determinise(self, max_states: Optional[int] = None) -> "LazyDFTA[U, V]":
+        """
+        Subset construction computed on demand, only reachable subsets are explored.
+        """
+        return LazyDFTA(self, max_states)
+
+    def determinise(self, max_states: Optional[int] = None) -> DFTA[FrozenSet[U], V]:
+        """
+        Subset construction of all reachable subsets.
+        Raises a ValueError if there are more than max_states of them.
+        """
+        return self.lazy_determinise(max_states).materialise()
+
+    def __str__(self) -> str:
+        s = "finals:" + ", ".join(sorted(map(str, self.finals))) + "\n"
+        s += "letters:" + ", ".join(sorted(map(str, self.alphabet))) + "\n"
+        lines = []
+        for (P, args), dsts in self.rules.items():
+            add = ""
+            if len(args) > 0:
+                add = " ".join(map(str, args))
+            for dst in dsts:
+                lines.append(f"{dst} <- '{P}' {add}")
+        return s + "\n".join(sorted(lines))
+
+
+class LazyDFTA(Generic[U, V]):
+    """
+    Determinisation of a NFTA by subset construction where transitions are computed
+    when they are first needed.
+    states: non empty FrozenSet[U]
+    alphabet: V
+    """
+
+    def __init__(self, nfta: NFTA[U, V], max_states: Optional[int] = None) -> None:
+        self.nfta = nfta
+        self.max_states = max_states
+        # Transitions computed so far, None when no state is reached
+        self.rules: Dict[
+            Tuple[V, Tuple[FrozenSet[U], ...]], Optional[FrozenSet[U]]
+        ] = {}
+        self.states: Set[FrozenSet[U]] = set()
+        self.arities: Dict[V, Set[int]] = defaultdict(set)
+        for letter, args in nfta.rules:
+            self.arities[letter].add(len(args))
+
+    def is_final(self, state: FrozenSet[U]) -> bool:
+        return not self.nfta.finals.isdisjoint(state)
+
+    def read(
+        self, letter: V, children: Tuple[FrozenSet[U], ...]
+    ) -> Optional[FrozenSet[U]]:
+        key = (letter, children)
+        if key in self.rules:
+            return self.rules[key]
+        dst: Optional[FrozenSet[U]] = self.nfta.read(letter, children)
+        if not dst:
+            dst = None
+        elif dst not in self.states:
+            if self.max_states is not None and len(self.states) >= self.max_states:
+                raise ValueError(
+                    f"determinisation exceeds the maximum of {self.max_states} states"
+                )
+            self.states.add(dst)
+        self.rules[key] = dst
+        return dst
+
+    def run(self, program: Program) -> Optional[FrozenSet[U]]:
+        """
+        State reached by the program, letters are compared to the program nodes or their string.
+        """
+        match program:
+            case Function(function, arguments):
+                children = []
+                for arg in arguments:
+                    child = self.run(arg)
+                    if child is None:
+                        return None
+                    children.append(child)
+                return self.read(self.__letter__(function), tuple(children))
+            case _:
+                return self.read(self.__letter__(program), ())
+
+    def __letter__(self, program: Program) -> V:
+        if program in self.arities:
+            return program  # type: ignore
+        return str(program)  # type: ignore
+
+    def accepts(self, program: Program) -> bool:
+        state = self.run(program)
+        return state is not None and self.is_final(state)
+
+    def __by_size__(
+        self,
+        size: int,
+        combine: Callable[[V, Tuple[W, ...]], W],
+        merge: Callable[[List[W]], W],
+    ) -> Generator[Dict[FrozenSet[U], W], None, None]:
+        """
+        For each size until size (included), yield state -> merged values of trees of that size.
+        Only subsets reached by trees of at most that size are explored.
+        """
+        by_size: List[Dict[FrozenSet[U], W]] = [{}]
+        letters = sorted(self.arities, key=str)
+        for csize in range(1, size + 1):
+            values: Dict[FrozenSet[U], List[W]] = defaultdict(list)
+            for letter in letters:
+                for arity in sorted(self.arities[letter]):
+                    if arity == 0:
+                        if csize == 1:
+                            dst = self.read(letter, ())
+                            if dst is not None:
+                                values[dst].append(combine(letter, ()))
+                        continue
+                    for partition in integer_partitions(arity, csize - 1):
+                        possibles = [by_size[s].items() for s in partition]
+                        for combi in itertools.product(*possibles):
+                            dst = self.read(letter, tuple(q for q, _ in combi))
+                            if dst is not None:
+                                values[dst].append(
+                                    combine(letter, tuple(v for _, v in combi))
+                                )
+            by_size.append({q: merge(vals) for q, vals in values.items()})
+            yield by_size[-1]
+
+    def stream_trees_by_size(self, size: int) -> Generator[tuple[int, int], None, None]:
+        """
+        stream (size, number of accepted trees) until the given size (included).
+        """
+
+        def combine(_: V, counts: Tuple[int, ...]) -> int:
+            total = 1
+            for count in counts:
+                total *= count
+            return total
+
+        for csize, counts in enumerate(self.__by_size__(size, combine, sum), start=1):
+            yield csize, sum(n for q, n in counts.items() if self.is_final(q))
+
+    def trees_by_size(self, size: int) -> dict[int, int]:
+        """
+        Return the number of accepted trees of all sizes until the given size (included).
+        """
+        return {csize: count for csize, count in self.stream_trees_by_size(size)}
+
+    def enumerate_until_size(self, size: int) -> Generator[Program, None, None]:
+        """
+        Enumerate all accepted programs until programs reach target size (excluded).
+        """
+
+        def combine(letter: V, args: Tuple[List[Program], ...]) -> List[Program]:
+            P = letter if isinstance(letter, Program) else Primitive(str(letter))
+            if not args:
+                return [P]
+            return [Function(P, list(c)) for c in itertools.product(*args)]
+
+        def merge(values: List[List[Program]]) -> List[Program]:
+            return [p for programs in values for p in programs]
+
+        if size <= 1:
+            return
+        for by_state in self.__by_size__(size - 1, combine, merge):
+            for q, programs in by_state.items():
+                if self.is_final(q):
+                    yield from programs
+
+    def materialise(self) -> DFTA[FrozenSet[U], V]:
+        """
+        Explore all reachable subsets and returns the corresponding DFTA.
+        """
+        letters = sorted(
+            (
+                (letter, arity)
+                for letter, arities in self.arities.items()
+                for arity in arities
+            ),
+            key=str,
+        )
+        rules: Dict[Tuple[V, Tuple[FrozenSet[U], ...]], FrozenSet[U]] = {}
+        old: List[FrozenSet[U]] = []
+        frontier: List[FrozenSet[U]] = []
+        known: Set[FrozenSet[U]] = set()
+        for letter, arity in letters:
+            if arity == 0:
+                dst = self.read(letter, ())
+                if dst is not None:
+                    rules[(letter, ())] = dst
+                    if dst not in known:
+                        known.add(dst)
+                        frontier.append(dst)
+        while frontier:
+            every = old + frontier
+            next_frontier = []
+            for letter, arity in letters:
+                # Semi-naive: the ith argument is the first one in the frontier,
+                # so each combination of states is read exactly once
+                for i in range(arity):
+                    possibles = [old] * i + [frontier] + [every] * (arity - i - 1)
+                    for combi in itertools.product(*possibles):
+                        dst = self.read(letter, combi)
+                        if dst is None:
+                            continue
+                        rules[(letter, combi)] = dst
+                        if dst not in known:
+                            known.add(dst)
+                            next_frontier.append(dst)
+            old = every
+            frontier = next_frontier
+        return DFTA(rules, {q for q in old if self.is_final(q)})
@@ -1,6 +1,8 @@
+from collections import defaultdict
 from dataclasses import dataclass
 from itertools import product
 from typing import Any, Callable
+from weakref import WeakKeyDictionary
 
 from grape.dsl import DSL
 from grape.program import Function, Primitive, Program, Variable
@@ -87,123 +89,299 @@ def commutativity_constraint(commutatives: list[tuple[str, list[int]]]) -> Const
     )
 
 
-def grammar_by_saturation(
-    dsl: DSL, requested_type: str, constraints: list[Constraint] = []
-) -> DFTA[Any, Program]:
+def algebraic_constraint(
+    laws: list[tuple[str, str, list]], commutatives: list[tuple[str, list[int]]]
+) -> Constraint:
     """
-    Returns a specialized grammar with the given constraints.
+    Forbids the programs that the laws found by algebraic_pruner rewrite into
+    smaller ones, and all but one association of associative primitives.
+    It must be used with the commutativity_constraint of the same commutatives:
+    an associative and commutative primitive only forbids f(f(a, b), f(c, d)).
+
+    States are (head, is leaf).
     """
-    args, rtype = types.parse(requested_type)
-    whatever = rtype.lower() == "none"
-    rules: dict[tuple[Program, tuple[str, ...]], str] = {}
+    commutative = {p for p, _ in commutatives}
+    # primitive -> [(argument index, forbidden argument state)]
+    forbidden: dict[str, list[tuple[int, tuple[str, bool]]]] = defaultdict(list)
+    idempotents: set[str] = set()
+    nested_both: set[str] = set()
+    for p, law, data in laws:
+        if law in ("identity", "absorbing"):
+            forbidden[p].append((data[0], (data[1], True)))
+        elif law == "associative":
+            if p in commutative:
+                nested_both.add(p)
+            else:
+                forbidden[p].append((0, (p, False)))
+        elif law == "idempotent":
+            idempotents.add(p)
+        elif law == "involutive":
+            forbidden[p].append((0, (p, False)))
 
-    added = True
-    states = set()
-    finals = set()
-    for i, var_type in enumerate(args):
-        var = Variable(i)
-        state = (var_type, tuple(c.init(var) for c in constraints))
-        rules[(var, tuple())] = state
-        if state not in states:
-            states.add(state)
-            added = True
-            if (whatever or state[0] == rtype) and all(
-                c.is_final(state[1][i]) for i, c in enumerate(constraints)
+    def transition(p: Program, args: tuple[tuple[str, bool], ...]) -> Any | None:
+        key = str(p)
+        if any(args[i] == state for i, state in forbidden.get(key, [])):
+            return None
+        if key in idempotents:
+            # g(g(x)) = g(x) and f(x, x) = x
+            if len(args) == 1 and args[0] == (key, False):
+                return None
+            if len(args) == 2 and args[0] == args[1] and args[0][1]:
+                return None
+        if key in nested_both and args[0] == args[1] == (key, False):
+            return None
+        return key, False
+
+    return Constraint(
+        lambda p: (str(p), True),
+        transition,
+        lambda _: True,
+    )
+
+
+def automaton_constraint(dfta: DFTA[Any, Any]) -> Constraint:
+    """
+    Compile a DFTA into a constraint: a transition is allowed iff the DFTA can read it.
+    Letters are compared by their string representation.
+    """
+    rules = {(str(P), args): dst for (P, args), dst in dfta.rules.items()}
+    finals = dfta.finals
+
+    def transition(p: Program, args: tuple[Any, ...]) -> Any | None:
+        return rules.get((str(p), args))
+
+    return Constraint(
+        lambda p: rules.get((str(p), ())),
+        transition,
+        lambda s: s in finals,
+    )
+
+
+def __constrained_product__(
+    grammar: DFTA[Any, Program],
+    constraints: list[Constraint],
+    make_state: Callable[[Any, tuple], Any],
+) -> tuple[dict[tuple[Program, tuple[Any, ...]], Any], set[Any]]:
+    """
+    On-the-fly product of grammar with the constraints.
+    Only reachable product states are expanded, semi-naively.
+    Returns (rules, finals).
+    """
+    rules: dict[tuple[Program, tuple[Any, ...]], Any] = {}
+    finals: set[Any] = set()
+    # Product state -> constraint states
+    sub_states_of: dict[Any, tuple] = {}
+    # Product states indexed by base state
+    states_by_base: dict[Any, list] = defaultdict(list)
+    new_states: dict[Any, list] = defaultdict(list)
+    # Base rules indexed by the base states they consume
+    consumers: dict[Any, list[int]] = defaultdict(list)
+    functions: list[tuple[Program, tuple[Any, ...], Any]] = []
+
+    def add_state(base: Any, sub_states: tuple) -> Any:
+        state = make_state(base, sub_states)
+        if state not in sub_states_of:
+            sub_states_of[state] = sub_states
+            new_states[base].append(state)
+            if base in grammar.finals and all(
+                c.is_final(sub_states[i]) for i, c in enumerate(constraints)
             ):
                 finals.add(state)
-    while added:
-        added = False
-        for primitive, (str_type, _) in dsl.primitives.items():
-            arg_types = types.arguments(str_type)
-            prog = Primitive(primitive)
-            if len(arg_types) == 0:
-                state = (
-                    types.return_type(str_type),
-                    tuple(c.init(prog) for c in constraints),
+        return state
+
+    for (P, args), dst in grammar.rules.items():
+        if len(args) == 0:
+            sub_states = tuple(c.init(P) for c in constraints)
+            if any(x is None for x in sub_states):
+                continue
+            rules[(P, ())] = add_state(dst, sub_states)
+        else:
+            for arg in set(args):
+                consumers[arg].append(len(functions))
+            functions.append((P, args, dst))
+
+    while new_states:
+        delta = new_states
+        new_states = defaultdict(list)
+        old_states_by_base = {q: list(S) for q, S in states_by_base.items()}
+        for q, S in delta.items():
+            states_by_base[q] += S
+        touched = sorted({rule for q in delta for rule in consumers[q]})
+        for rule in touched:
+            P, args, dst = functions[rule]
+            for i, arg in enumerate(args):
+                if arg not in delta:
+                    continue
+                possibles = (
+                    [old_states_by_base.get(q, []) for q in args[:i]]
+                    + [delta[arg]]
+                    + [states_by_base[q] for q in args[i + 1 :]]
                 )
-                rules[(prog, tuple())] = state
-                if state not in states:
-                    states.add(state)
-                    added = True
-                    if (whatever or state[0] == rtype) and all(
-                        c.is_final(state[1][i]) for i, c in enumerate(constraints)
-                    ):
-                        finals.add(state)
-            else:
-                possibles = [
-                    [state for state in states if state[0] == arg_type]
-                    for arg_type in arg_types
-                ]
                 for combination in product(*possibles):
-                    key = (prog, combination)
-                    if key in rules:
-                        continue
-                    dst_constraints = []
-                    skip = False
-                    for i, c in enumerate(constraints):
+                    dst_sub_states = []
+                    for j, c in enumerate(constraints):
                         out = c.transition(
-                            key[0], tuple(combi[1][i] for combi in combination)
+                            P, tuple(sub_states_of[s][j] for s in combination)
                         )
-                        skip = skip or out is None
-                        dst_constraints.append(out)
-                    if skip:
-                        continue
-                    dst = (types.return_type(str_type), tuple(dst_constraints))
-                    if dst not in states:
-                        states.add(dst)
-                        added = True
-                        if (whatever or dst[0] == rtype) and all(
-                            c.is_final(dst[1][i]) for i, c in enumerate(constraints)
-                        ):
-                            finals.add(dst)
-                    rules[key] = dst
+                        if out is None:
+                            break
+                        dst_sub_states.append(out)
+                    else:
+                        rules[(P, combination)] = add_state(
+                            dst, tuple(dst_sub_states)
+                        )
+    return rules, finals
+
+
+def constrain(
+    grammar: DFTA[Any, Program], constraints: list[Constraint]
+) -> DFTA[tuple[Any, tuple], Program]:
+    """
+    Returns the product of the grammar with the given constraints.
+    States are (grammar state, (constraint states...)).
+    """
+    rules, finals = __constrained_product__(
+        grammar, constraints, lambda q, sub_states: (q, sub_states)
+    )
+    return DFTA(rules, finals)
+
+
+# Saturated grammars without constraints: DSL -> type request -> grammar
+__SATURATED__: WeakKeyDictionary[DSL, dict[str, DFTA[Any, Program]]] = (
+    WeakKeyDictionary()
+)
+
+
+def __saturate__(dsl: DSL, requested_type: str) -> DFTA[Any, Program]:
+    """
+    Saturate the type grammar, states are (type, ()).
+
+    Saturation is semi-naive: each round only explores the combinations
+    that contain at least one state discovered during the previous round.
+    """
+    requested = types.Type.of(requested_type)
+    args, rtype = requested.arguments, requested.rtype
+    whatever = rtype.lower() == "none"
+    rules: dict[tuple[Program, tuple[Any, ...]], Any] = {}
+
+    states: set = set()
+    # Known states indexed by type, and states discovered in the current round
+    states_by_type: dict[str, list] = defaultdict(list)
+    new_states: dict[str, list] = defaultdict(list)
+
+    def add_state(state: tuple[str, tuple]) -> None:
+        if state not in states:
+            states.add(state)
+            new_states[state[0]].append(state)
+
+    for i, var_type in enumerate(args):
+        state = (var_type, ())
+        rules[(Variable(i), tuple())] = state
+        add_state(state)
+    # Parse types only once
+    functions: list[tuple[Primitive, tuple[str, ...], str]] = []
+    for primitive, (str_type, _) in dsl.primitives.items():
+        ptype = types.Type.of(str_type)
+        arg_types, prim_rtype = ptype.arguments, ptype.rtype
+        prog = Primitive(primitive)
+        if len(arg_types) == 0:
+            state = (prim_rtype, ())
+            rules[(prog, tuple())] = state
+            add_state(state)
+        else:
+            functions.append((prog, arg_types, prim_rtype))
+
+    while new_states:
+        delta = new_states
+        new_states = defaultdict(list)
+        old_states_by_type = {t: list(S) for t, S in states_by_type.items()}
+        for t, S in delta.items():
+            states_by_type[t] += S
+        for prog, arg_types, prim_rtype in functions:
+            # Argument i is new, arguments before i are old ones
+            # so that each combination is explored exactly once
+            for i, arg_type in enumerate(arg_types):
+                if arg_type not in delta:
+                    continue
+                possibles = (
+                    [old_states_by_type.get(t, []) for t in arg_types[:i]]
+                    + [delta[arg_type]]
+                    + [states_by_type[t] for t in arg_types[i + 1 :]]
+                )
+                for combination in product(*possibles):
+                    dst = (prim_rtype, ())
+                    add_state(dst)
+                    rules[(prog, combination)] = dst
+    finals = {s for s in states if whatever or s[0] == rtype}
     return DFTA(rules, finals)
 
 
-def __fix_vars__(program: Program, var_merge: dict[int, int]) -> Program:
-    if isinstance(program, Primitive):
-        return program
-    elif isinstance(program, Variable):
-        return Variable(var_merge[program.no])
-    elif isinstance(program, Function):
-        return Function(
-            __fix_vars__(program.function, var_merge),
-            [__fix_vars__(arg, var_merge) for arg in program.arguments],
-        )
+def grammar_by_saturation(
+    dsl: DSL, requested_type: str, constraints: list[Constraint] = []
+) -> DFTA[Any, Program]:
+    """
+    Returns a specialized grammar with the given constraints.
+
+    The type grammar is saturated once per (DSL, type request) and cached,
+    constraints are then applied through a lazy product with it.
+    States are (type, (constraint states...)).
+    """
+    cache = __SATURATED__.setdefault(dsl, {})
+    base = cache.get(requested_type)
+    if base is None:
+        base = __saturate__(dsl, requested_type)
+        cache[requested_type] = base
+    if len(constraints) == 0:
+        return DFTA(base.rules, base.finals)
+    rules, finals = __constrained_product__(
+        base, constraints, lambda q, sub_states: (q[0], sub_states)
+    )
+    return DFTA(rules, finals)
 
 
 def grammar_from_memory(
     memory: dict[Any, dict[int, list[Program]]],
     type_req: str,
     prev_finals: set[str],
-) -> tuple[DFTA[str, Program], int]:
+) -> tuple[DFTA[int, Program], int]:
     """
     Returns (specialized grammar, 1)
+
+    States are integer ids of the kept programs, see program_state_names to name them.
     """
     max_size = max(max(memory[state].keys()) for state in memory)
     args_type = types.arguments(type_req)
     # Compute variable merging: all variables of same type should be merged
-    type2var = {}
+    type2var: dict[str, Variable] = {}
     for t in args_type:
         if t not in type2var:
-            type2var[t] = len(type2var)
+            type2var[t] = Variable(len(type2var))
     var_merge = {i: type2var[t] for i, t in enumerate(args_type)}
     # Produce rules incrementally
-    rules: dict[tuple[Program, tuple[str, ...]], str] = {}
-    finals: set[str] = set()
+    rules: dict[tuple[Program, tuple[int, ...]], int] = {}
+    finals: set[int] = set()
+    # Program -> id of its state
+    program2id: dict[Program, int] = {}
 
     for size in range(1, max_size + 1):
         for state in sorted(memory):
-            programs = memory[state][size]
-            fixed = {__fix_vars__(prog, var_merge) for prog in programs}
-            for prog in fixed:
-                dst = str(prog)
+            is_final = state in prev_finals
+            for prog in memory[state][size]:
                 if isinstance(prog, Function):
-                    key = (prog.function, tuple(map(str, prog.arguments)))
+                    key = (
+                        prog.function,
+                        tuple(program2id[arg] for arg in prog.arguments),
+                    )
+                elif isinstance(prog, Variable):
+                    key = (var_merge[prog.no], ())
                 else:
                     key = (prog, ())
-                rules[key] = dst
-                if state in prev_finals:
+                dst = rules.get(key)
+                if dst is None:
+                    dst = len(rules)
+                    rules[key] = dst
+                program2id[prog] = dst
+                if is_final:
                     finals.add(dst)
     relevant_dfta = DFTA(rules, finals)
 
@@ -232,3 +410,17 @@ def grammar_from_memory(
     # ==================================
 
     return relevant_dfta, 1
+
+
+def program_state_names(dfta: DFTA[int, Program]) -> dict[int, str]:
+    """
+    Name each state of a grammar produced by grammar_from_memory with its program.
+    """
+    names: dict[int, str] = {}
+    # States are created bottom-up so ids are already ordered
+    for (P, args), dst in sorted(dfta.rules.items(), key=lambda rule: rule[1]):
+        if len(args) == 0:
+            names[dst] = str(P)
+        else:
+            names[dst] = f"({P} {' '.join(names[arg] for arg in args)})"
+    return names
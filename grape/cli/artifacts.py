@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import os
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
+
+# Solve circular import problem
+if TYPE_CHECKING:
+    from grape.automaton.tree_automaton import DFTA
+
+T = TypeVar("T")
+
+
+class LRUCache:
+    """
+    Keeps at most max_entries values, the least recently used one is evicted first.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Any, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any, compute: Callable[[], T]) -> T:
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        value = compute()
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Only enabled by grape-serve, commands load everything otherwise
+__CACHE__: LRUCache | None = None
+
+
+def enable_cache(max_entries: int) -> LRUCache:
+    global __CACHE__
+    __CACHE__ = LRUCache(max_entries)
+    return __CACHE__
+
+
+def disable_cache() -> None:
+    global __CACHE__
+    __CACHE__ = None
+
+
+def cached(kind: str, file: str, key: Any, compute: Callable[[], T]) -> T:
+    """
+    Value derived from the file, kept until the file changes when the cache is enabled.
+    The value is shared so it must not be modified.
+    """
+    if __CACHE__ is None:
+        return compute()
+    path = os.path.abspath(file)
+    stat = os.stat(path)
+    return __CACHE__.get((kind, path, stat.st_mtime_ns, stat.st_size, key), compute)
+
+
+def load_automaton(file: str) -> "DFTA[str, str]":
+    """
+    Load the automaton, the returned automaton can be modified.
+    """
+    from grape.automaton.automaton_manager import load_automaton_from_file
+
+    if __CACHE__ is None:
+        return load_automaton_from_file(file)
+    return cached("automaton", file, None, lambda: load_automaton_from_file(file)).copy()
+
+
+def load_dsl(file: str) -> tuple:
+    """
+    See dsl_loader.load_python_file, the DSL file is executed once while it is cached.
+    """
+    from grape.cli import dsl_loader
+
+    return cached("dsl", file, None, lambda: dsl_loader.load_python_file(file))
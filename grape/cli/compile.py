@@ -1,17 +1,18 @@
 import argparse
 import sys
-from grape import types
+from grape import profiling, types
 from grape.automaton.automaton_manager import dump_automaton_to_file
+from grape.automaton.tree_automaton import DFTA
 from grape.automaton_generator import (
     depth_constraint,
     grammar_by_saturation,
     size_constraint,
 )
-from grape.cli import dsl_loader
+from grape.cli import artifacts, serve
 from grape.program import Primitive, Variable
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Generate a basic grammar based on type constraints",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -60,27 +61,55 @@ def parse_args():
         help="output file containing the pruned grammar",
     )
 
-    return parser.parse_args()
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
-    dsl, target_type, sample_dict, _, __ = dsl_loader.load_python_file(args.dsl)
+    if args.server is not None:
+        serve.delegate(args.server, "compile")
+    profiling.run_profiled(run, args)
+
+
+def run(args):
+    grammar = compile_grammar(
+        args.dsl, args.msize, args.Msize, args.mdepth, args.Mdepth, args.short
+    )
+    dump_automaton_to_file(grammar, args.output)
+
+
+def compile_grammar(
+    dsl_file: str,
+    msize: int = -1,
+    Msize: int = -1,
+    mdepth: int = -1,
+    Mdepth: int = -1,
+    short: bool = False,
+) -> DFTA:
+    """
+    The grammar generated by grape-compile, sizes and depths are ignored when -1.
+    """
+    dsl, target_type, sample_dict, _, __, custom_constraints = artifacts.load_dsl(
+        dsl_file
+    )
     type_req = "->".join(list(sample_dict.keys()) + [target_type])
     constraints = []
     mappers = []
-    if int(args.msize) > 0 or int(args.Msize) > 0:
-        constraints.append(
-            size_constraint(min_size=int(args.msize), max_size=int(args.Msize))
-        )
+    if int(msize) > 0 or int(Msize) > 0:
+        constraints.append(size_constraint(min_size=int(msize), max_size=int(Msize)))
         mappers.append(lambda s: f"-size={s}")
-    if int(args.mdepth) > 0 or int(args.Mdepth) > 0:
+    if int(mdepth) > 0 or int(Mdepth) > 0:
         constraints.append(
-            depth_constraint(min_depth=int(args.mdepth), max_depth=int(args.Mdepth))
+            depth_constraint(min_depth=int(mdepth), max_depth=int(Mdepth))
         )
         mappers.append(lambda s: f"-depth={s}")
+    for name, constraint in custom_constraints.items():
+        constraints.append(constraint)
+        mappers.append(lambda s, name=name: f"-{name}={s}")
     grammar = grammar_by_saturation(dsl, type_req, constraints)
-    if not args.short:
+    if not short:
         if len(constraints) == 0:
             grammar = grammar.map_states(lambda state: state[0])
         else:
@@ -108,8 +137,7 @@ def main():
             f"[warning] the following primitives are not present in the grammar: {', '.join(missing)}",
             file=sys.stderr,
         )
-
-    dump_automaton_to_file(grammar, args.output)
+    return grammar
 
 
 if __name__ == "__main__":
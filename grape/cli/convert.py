@@ -1,11 +1,10 @@
 import argparse
-from grape.automaton.automaton_manager import (
-    dump_automaton_to_file,
-    load_automaton_from_file,
-)
+from grape import profiling
+from grape.automaton.automaton_manager import dump_automaton_to_file
+from grape.cli import artifacts, serve
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Convert a grammar to another format",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -21,13 +20,26 @@ def parse_args():
         type=str,
         help="output file",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--unsorted",
+        action="store_true",
+        help="write rules in the order of the grammar instead of sorting them",
+    )
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
-    dfta = load_automaton_from_file(args.automaton)
-    dump_automaton_to_file(dfta, args.output)
+    if args.server is not None:
+        serve.delegate(args.server, "convert")
+    profiling.run_profiled(run, args)
+
+
+def run(args):
+    dfta = artifacts.load_automaton(args.automaton)
+    dump_automaton_to_file(dfta, args.output, sort=not args.unsorted)
 
 
 if __name__ == "__main__":
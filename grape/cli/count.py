@@ -1,10 +1,10 @@
 import argparse
-from grape.automaton.automaton_manager import load_automaton_from_file
+from grape import profiling
 from grape.automaton.spec_manager import specialize
-from grape.cli import dsl_loader
+from grape.cli import artifacts, serve
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Count the number of programs at the specified constraints",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -32,13 +32,21 @@ def parse_args():
         default=None,
         help="DSL file, enables pruning of finals states",
     )
-    return parser.parse_args()
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
-    dfta = load_automaton_from_file(args.automaton)
-    dsl = dsl_loader.load_python_file(args.dsl)[0] if args.dsl is not None else None
+    if args.server is not None:
+        serve.delegate(args.server, "count")
+    profiling.run_profiled(run, args)
+
+
+def run(args):
+    dfta = artifacts.load_automaton(args.automaton)
+    dsl = artifacts.load_dsl(args.dsl)[0] if args.dsl is not None else None
     if str(args.request) != "None":
         dfta = specialize(dfta, args.request, dsl)
         dfta.reduce()
@@ -1,12 +1,11 @@
 import argparse
-from grape.automaton.automaton_manager import (
-    dump_automaton_to_file,
-    load_automaton_from_file,
-)
+from grape import profiling
+from grape.automaton.automaton_manager import dump_automaton_to_file
 from grape.automaton.spec_manager import despecialize
+from grape.cli import artifacts, serve
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Despecialize a grammar from a type request",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -27,12 +26,20 @@ def parse_args():
         default="./grammar.grape",
         help="output file containing the pruned grammar",
     )
-    return parser.parse_args()
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
-    dfta = load_automaton_from_file(args.automaton)
+    if args.server is not None:
+        serve.delegate(args.server, "despecialize")
+    profiling.run_profiled(run, args)
+
+
+def run(args):
+    dfta = artifacts.load_automaton(args.automaton)
     grammar = despecialize(dfta, args.type_request)
     dump_automaton_to_file(grammar, args.output)
 
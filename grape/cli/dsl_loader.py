@@ -1,12 +1,14 @@
 import importlib
-from typing import Callable
-
-from grape.dsl import DSL
+from typing import TYPE_CHECKING, Callable
 
 import importlib.util
 import sys
 import string
-import secrets
+
+# The DSL is only imported when a file is loaded
+if TYPE_CHECKING:
+    from grape.automaton_generator import Constraint
+    from grape.dsl import DSL
 
 
 def gensym(length=32, prefix="gendsl_modulename_"):
@@ -16,6 +18,8 @@ def gensym(length=32, prefix="gendsl_modulename_"):
 
     :return: generated symbol
     """
+    import secrets
+
     alphabet = string.ascii_uppercase + string.ascii_lowercase + string.digits
     symbol = "".join([secrets.choice(alphabet) for i in range(length)])
     return prefix + symbol
@@ -51,12 +55,15 @@ def __make_error_lambda(text: str) -> Callable:
 def load_python_file(
     file_path: str,
 ) -> tuple[
-    DSL,
+    "DSL",
     str | None,
     dict[str, Callable],
     dict[str, Callable],
     set,
+    dict[str, "Constraint"],
 ]:
+    from grape.dsl import DSL
+
     module = load_module(file_path)
     elements = [
         ("dsl", __make_error_lambda("No DSL specified")),
@@ -64,6 +71,7 @@ def load_python_file(
         ("sample_dict", __make_error_lambda("No Sample Dict specified")),
         ("equal_dict", dict),
         ("skip_exceptions", set),
+        ("constraints", dict),
     ]
     out = []
     for attr_name, default in elements:
@@ -1,9 +1,10 @@
 import argparse
-from grape.automaton.automaton_manager import load_automaton_from_file
+from grape import profiling
+from grape.cli import artifacts, serve
 from grape.enumerator import Enumerator
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Enumerate all programs until some size",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -18,12 +19,20 @@ def parse_args():
         "--size", type=int, default=7, help="max size of programs to check"
     )
 
-    return parser.parse_args()
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
-    dfta = load_automaton_from_file(args.automaton)
+    if args.server is not None:
+        serve.delegate(args.server, "enum")
+    profiling.run_profiled(run, args)
+
+
+def run(args):
+    dfta = artifacts.load_automaton(args.automaton)
 
     enumerator = Enumerator(dfta)
     gen = enumerator.enumerate_until_size(args.size + 1)
@@ -1,11 +1,10 @@
 import argparse
+from grape import profiling
 from grape.automaton import spec_manager
-from grape.automaton.automaton_manager import (
-    load_automaton_from_file,
-)
+from grape.cli import artifacts, serve
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Show basic information about the grammar",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -16,12 +15,20 @@ def parse_args():
         type=str,
         help="your automaton file",
     )
-    return parser.parse_args()
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
-    dfta = load_automaton_from_file(args.automaton)
+    if args.server is not None:
+        serve.delegate(args.server, "info")
+    profiling.run_profiled(run, args)
+
+
+def run(args):
+    dfta = artifacts.load_automaton(args.automaton)
     old_rules = dfta.rules.copy()
     dfta.reduce()
 
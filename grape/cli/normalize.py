@@ -0,0 +1,104 @@
+import argparse
+import os
+import sys
+from grape import profiling
+from grape.cli import artifacts, serve
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Rewrite programs into the representatives of the equivalence classes found by grape-prune",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "classes",
+        type=str,
+        help="equivalence classes file produced by grape-prune --classes",
+    )
+    parser.add_argument(
+        "programs",
+        type=str,
+        nargs="*",
+        default=["-"],
+        help="files with one program per line, - for stdin",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="output file, stdout if not given",
+    )
+    parser.add_argument(
+        "--unique",
+        action="store_true",
+        help="print each normalized program only once",
+    )
+    parser.add_argument(
+        "--max-steps",
+        type=int,
+        default=100,
+        help="maximum number of rewrites at the root of a subprogram",
+    )
+    parser.add_argument(
+        "--dsl",
+        type=str,
+        help="python file of the DSL, variables of the rules then only match subprograms of their type",
+    )
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.server is not None:
+        serve.delegate(args.server, "normalize")
+    profiling.run_profiled(run, args)
+
+
+def __load_normalizer__(file: str, max_steps: int, dsl_file: str | None):
+    from grape.pruning.normalizer import Normalizer
+
+    dsl = None if dsl_file is None else artifacts.load_dsl(dsl_file)[0]
+    with open(file) as fd:
+        return Normalizer.from_classes(fd, max_steps, dsl=dsl)
+
+
+def run(args):
+    # The normalizer is rebuilt when the DSL file changes
+    dsl_key = None
+    if args.dsl is not None:
+        dsl_key = (os.path.abspath(args.dsl), os.stat(args.dsl).st_mtime_ns)
+    normalizer = artifacts.cached(
+        "normalizer",
+        args.classes,
+        (args.max_steps, dsl_key),
+        lambda: __load_normalizer__(args.classes, args.max_steps, args.dsl),
+    )
+    out = sys.stdout if args.output is None else open(args.output, "w")
+    seen: set[str] = set()
+    try:
+        for file in args.programs:
+            fd = sys.stdin if file == "-" else open(file)
+            try:
+                lines = (line.strip() for line in fd)
+                programs = normalizer.normalize_all(line for line in lines if line)
+                for program in programs:
+                    text = str(program)
+                    if args.unique:
+                        if text in seen:
+                            continue
+                        seen.add(text)
+                    out.write(text)
+                    out.write("\n")
+            finally:
+                if fd is not sys.stdin:
+                    fd.close()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
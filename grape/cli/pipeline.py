@@ -0,0 +1,438 @@
+"""
+grape-pipeline runs a list of stages in one process, grammars are passed
+directly from one stage to the next.
+
+The spec is a TOML or JSON file, e.g.:
+    dsl = "dsl.py"
+
+    [[stages]]
+    name = "base"
+    op = "compile"
+    Msize = 5
+
+    [[stages]]
+    op = "prune"
+    size = 5
+    samples = 50
+
+    [[stages]]
+    op = "save"
+    output = "pruned.grape"
+
+Each stage takes the grammar of the previous stage unless "input" (a stage
+name or a list of names) is given. The output of a stage is cached on disk by
+a hash of its op, its parameters, the content of its files and the hashes of
+its inputs, so only the stages after a modification are computed again.
+The content of the Python modules a DSL file imports is hashed with it, except
+for the installed ones: upgrading a package does not invalidate the cache.
+prune samples its inputs at random: without a "seed" parameter, its cached
+output is one of the grammars it can give.
+"""
+
+import argparse
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Callable
+
+from grape import profiling
+from grape.automaton.automaton_manager import (
+    dump_automaton_to_bytes,
+    dump_automaton_to_file,
+    load_automaton_from_bytes,
+)
+from grape.automaton.tree_automaton import DFTA
+from grape.cli import artifacts
+
+# Bumped when the cached outputs of a stage may change
+CACHE_VERSION = 2
+
+# Parameters that do not change the output of a stage, add_loops gives the
+# same grammar whatever the number of jobs
+__NOT_HASHED__ = {"name", "op", "input", "jobs"}
+
+
+@dataclass
+class Stage:
+    name: str
+    op: str
+    params: dict[str, Any]
+    inputs: list[str] = field(default_factory=list)
+    key: str = ""
+
+
+def __to_strings__(dfta: DFTA) -> DFTA[str, str]:
+    """
+    The automaton as it would be after being saved and loaded again.
+    """
+    rules = {
+        (str(P), tuple(map(str, args))): str(dst) for (P, args), dst in dfta.rules.items()
+    }
+    return DFTA(rules, set(map(str, dfta.finals)))
+
+
+def __dsl__(params: dict[str, Any]) -> Any:
+    if params.get("dsl") is None:
+        return None
+    return artifacts.load_dsl(params["dsl"])[0]
+
+
+def __load__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    return artifacts.load_automaton(params["file"])
+
+
+def __compile__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    from grape.cli.compile import compile_grammar
+
+    return compile_grammar(
+        params["dsl"],
+        params.get("msize", -1),
+        params.get("Msize", -1),
+        params.get("mdepth", -1),
+        params.get("Mdepth", -1),
+        params.get("short", False),
+    )
+
+
+def __prune__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    from grape.cli.prune import prune_grammar
+
+    grammar, _ = prune_grammar(
+        params["dsl"],
+        params.get("size", 7),
+        params.get("samples", 1000),
+        params.get("strategy", "grape"),
+        params.get("jobs", 1),
+        inputs[0].copy() if inputs else None,
+        keep_elements=False,
+        seed=params.get("seed"),
+    )
+    return grammar
+
+
+def __specialize__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    from grape.automaton.spec_manager import specialize
+
+    grammar = specialize(inputs[0], params["type_request"], __dsl__(params))
+    grammar.reduce()
+    return grammar
+
+
+def __despecialize__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    from grape.automaton.spec_manager import despecialize
+
+    return despecialize(inputs[0], params["type_request"])
+
+
+def __union__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    from grape.cli.union import union_all
+
+    return union_all(inputs)
+
+
+def __intersection__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    from grape.cli.intersection import intersect_all
+
+    return intersect_all(inputs)
+
+
+def __minimise__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    grammar = inputs[0].copy()
+    grammar.reduce()
+    return grammar.minimise().classic_state_renaming()
+
+
+def __count__(params: dict[str, Any], inputs: list[Any]) -> list[list[int]]:
+    return [
+        [size, count] for size, count in inputs[0].stream_trees_by_size(params["size"])
+    ]
+
+
+def __save__(params: dict[str, Any], inputs: list[Any]) -> DFTA:
+    dump_automaton_to_file(inputs[0], params["output"])
+    return inputs[0]
+
+
+# op -> (function, number of inputs: 0, 1 or None for any, file parameters)
+OPS: dict[str, tuple[Callable[[dict, list], Any], int | None, tuple[str, ...]]] = {
+    "load": (__load__, 0, ("file",)),
+    "compile": (__compile__, 0, ("dsl",)),
+    "prune": (__prune__, None, ("dsl",)),
+    "specialize": (__specialize__, 1, ("dsl",)),
+    "despecialize": (__despecialize__, 1, ()),
+    "union": (__union__, None, ()),
+    "intersection": (__intersection__, None, ()),
+    "minimise": (__minimise__, 1, ()),
+    "count": (__count__, 1, ()),
+    "save": (__save__, 1, ()),
+}
+# Ops executed at each run for their side effects, their outputs are not grammars
+__SIDE_EFFECTS__ = {"count", "save"}
+__NOT_GRAMMARS__ = {"count"}
+
+
+def __file_hash__(file: str) -> str:
+    digest = hashlib.sha256()
+    with open(file, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def __local_modules__(file: str) -> list[str]:
+    """
+    Python files imported by file, directly or not, that are neither part of grape
+    nor installed in the Python prefix. A package is all of its files.
+    """
+    import ast
+    import importlib.util
+
+    grape_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ignored = tuple(
+        os.path.join(os.path.abspath(folder), "")
+        for folder in {sys.prefix, sys.base_prefix, grape_folder}
+    )
+    found: list[str] = []
+    todo = [file]
+    while todo:
+        with open(todo.pop(), "rb") as fd:
+            tree = ast.parse(fd.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                try:
+                    spec = importlib.util.find_spec(name.split(".")[0])
+                except (ImportError, ValueError):
+                    continue
+                if spec is None or not (spec.origin or "").endswith(".py"):
+                    continue
+                files = [spec.origin]
+                for folder in spec.submodule_search_locations or []:
+                    for root, _, names_in_folder in os.walk(folder):
+                        files += [
+                            os.path.join(root, x)
+                            for x in names_in_folder
+                            if x.endswith(".py")
+                        ]
+                for module_file in map(os.path.abspath, files):
+                    if not module_file.startswith(ignored) and module_file not in found:
+                        found.append(module_file)
+                        todo.append(module_file)
+    return sorted(found)
+
+
+def load_spec(file: str) -> dict[str, Any]:
+    if file.endswith(".toml"):
+        import tomllib
+
+        with open(file, "rb") as fd:
+            return tomllib.load(fd)
+    with open(file) as fd:
+        return json.load(fd)
+
+
+def parse_stages(spec: dict[str, Any], folder: str) -> list[Stage]:
+    """
+    Stages of the spec with their inputs resolved and file paths relative to folder.
+    """
+    stages: list[Stage] = []
+    by_name: dict[str, Stage] = {}
+    last_grammar: str | None = None
+    for i, item in enumerate(spec.get("stages", [])):
+        params = dict(item)
+        op = params.get("op")
+        if op not in OPS:
+            raise ValueError(f"stage {i}: unknown op: {op}")
+        name = str(params.get("name", f"stage{i}"))
+        if name in by_name:
+            raise ValueError(f"stage {i}: duplicate name: {name}")
+        _, ninputs, files = OPS[op]
+        if "dsl" in files and "dsl" not in params and "dsl" in spec:
+            params["dsl"] = spec["dsl"]
+        for key in files + ("output",):
+            if params.get(key) is not None:
+                params[key] = os.path.join(folder, params[key])
+        if "input" in params:
+            inputs = params["input"]
+            inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        elif ninputs == 0 or last_grammar is None:
+            inputs = []
+        else:
+            inputs = [last_grammar]
+        for input in inputs:
+            if input not in by_name:
+                raise ValueError(f"stage {name}: unknown input stage: {input}")
+            if by_name[input].op in __NOT_GRAMMARS__:
+                raise ValueError(f"stage {name}: input {input} is not a grammar")
+        if ninputs is not None and len(inputs) != ninputs:
+            raise ValueError(f"stage {name}: {op} expects {ninputs} input(s)")
+        if op == "prune" and len(inputs) > 1:
+            raise ValueError(f"stage {name}: prune expects at most one input")
+        elif ninputs is None and op != "prune" and len(inputs) == 0:
+            raise ValueError(f"stage {name}: {op} expects inputs")
+        stage = Stage(name, op, params, inputs)
+        content = {
+            "version": CACHE_VERSION,
+            "op": op,
+            "params": {
+                k: v
+                for k, v in params.items()
+                if k not in __NOT_HASHED__ and k not in files
+            },
+            "inputs": [by_name[input].key for input in inputs],
+            "files": {
+                key: __file_hash__(params[key])
+                for key in files
+                if params.get(key) is not None
+            },
+        }
+        if params.get("dsl") is not None and "dsl" in files:
+            content["modules"] = [
+                __file_hash__(module) for module in __local_modules__(params["dsl"])
+            ]
+        stage.key = hashlib.sha256(
+            json.dumps(content, sort_keys=True).encode()
+        ).hexdigest()
+        stages.append(stage)
+        by_name[name] = stage
+        if op not in __NOT_GRAMMARS__:
+            last_grammar = name
+    return stages
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage], cache: str | None, force: bool = False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache = cache
+        self.force = force
+        self.values: dict[str, Any] = {}
+        # stage name -> "cached" or time taken in seconds
+        self.report: dict[str, str | float] = {}
+
+    def __cache_file__(self, stage: Stage) -> str | None:
+        if self.cache is None or stage.op == "save":
+            return None
+        extension = ".json" if stage.op in __NOT_GRAMMARS__ else ".grapeb"
+        return os.path.join(self.cache, stage.key + extension)
+
+    def __load_cached__(self, stage: Stage) -> Any:
+        file = self.__cache_file__(stage)
+        if file is None or self.force or not os.path.exists(file):
+            return None
+        if stage.op in __NOT_GRAMMARS__:
+            with open(file) as fd:
+                return json.load(fd)
+        with open(file, "rb") as fd:
+            return load_automaton_from_bytes(fd.read())
+
+    def __store__(self, stage: Stage, value: Any) -> None:
+        file = self.__cache_file__(stage)
+        if file is None:
+            return
+        os.makedirs(self.cache, exist_ok=True)  # type: ignore
+        tmp_file = f"{file}.{os.getpid()}.tmp"
+        if stage.op in __NOT_GRAMMARS__:
+            with open(tmp_file, "w") as fd:
+                json.dump(value, fd)
+        else:
+            with open(tmp_file, "wb") as fd:
+                fd.write(dump_automaton_to_bytes(value))
+        os.replace(tmp_file, file)
+
+    def value(self, name: str) -> Any:
+        """
+        Output of the stage, computed only if it is not cached.
+        """
+        if name in self.values:
+            return self.values[name]
+        stage = self.stages[name]
+        value = self.__load_cached__(stage)
+        if value is not None:
+            self.report[name] = "cached"
+        else:
+            inputs = [self.value(input) for input in stage.inputs]
+            start = time.perf_counter()
+            with profiling.stage(f"pipeline.{name}"):
+                value = OPS[stage.op][0](stage.params, inputs)
+            if stage.op not in __NOT_GRAMMARS__ and stage.op != "save":
+                value = __to_strings__(value)
+            self.report[name] = time.perf_counter() - start
+            self.__store__(stage, value)
+        self.values[name] = value
+        return value
+
+    def run(self) -> None:
+        """
+        Compute the stages with side effects and the last stage.
+        """
+        names = list(self.stages)
+        for name in names:
+            stage = self.stages[name]
+            if stage.op in __SIDE_EFFECTS__ or name == names[-1]:
+                self.value(name)
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Run a pipeline of grape stages in one process",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "spec",
+        type=str,
+        help="TOML or JSON file describing the stages",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default=None,
+        help="folder of the cached stage outputs, defaults to the 'cache' of the spec or .grape-cache next to it",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="do not read nor write the cache"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="compute all stages again"
+    )
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    profiling.run_profiled(run, args)
+
+
+def run(args):
+    spec = load_spec(args.spec)
+    folder = os.path.dirname(os.path.abspath(args.spec))
+    stages = parse_stages(spec, folder)
+    cache = None
+    if not args.no_cache:
+        cache = args.cache or os.path.join(folder, spec.get("cache", ".grape-cache"))
+    pipeline = Pipeline(stages, cache, args.force)
+    pipeline.run()
+    for name, stage in pipeline.stages.items():
+        status = pipeline.report.get(name)
+        if status is None:
+            continue
+        if not isinstance(status, str):
+            status = f"{status:.2f}s"
+        print(f"[{name}] {stage.op}: {status}", file=sys.stderr)
+        if stage.op == "count":
+            cumulative = 0
+            for size, count in pipeline.values[name]:
+                cumulative += count
+                print(f"[{name}] size {size}: {count:.2e} cumulative: {cumulative:.2e}")
+
+
+if __name__ == "__main__":
+    main()
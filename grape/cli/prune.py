@@ -1,16 +1,17 @@
 import argparse
+import os
+import random
 import sys
 from typing import Callable
-from tqdm import tqdm
-from grape import types
-from grape.automaton.automaton_manager import (
-    dump_automaton_to_file,
-    load_automaton_from_file,
-)
+from grape import profiling, types
+from grape.automaton.automaton_manager import dump_automaton_to_file
 from grape.automaton.loop_manager import LoopingAlgorithm, add_loops
 from grape.automaton.spec_manager import despecialize, type_request_from_specialized
-from grape.cli import dsl_loader
-from grape.evaluator import Evaluator
+from grape.automaton.tree_automaton import DFTA
+from grape.cli import artifacts, serve
+from grape.evaluator import Evaluator, PrimitiveProfiler
+from grape.pruning.budget import Budget
+from grape.pruning.checkpoint import Checkpoint
 from grape.pruning.equivalence_class_manager import EquivalenceClassManager
 from grape.pruning.obs_equiv_pruner import prune
 
@@ -18,6 +19,8 @@ from grape.pruning.obs_equiv_pruner import prune
 def sample_inputs(
     nsamples: int, sample_dict: dict[str, Callable], equal_dict: dict[str, Callable]
 ) -> dict[str, list]:
+    from tqdm import tqdm
+
     inputs = {}
     pbar = tqdm(total=nsamples * len(sample_dict))
     pbar.set_description_str("sampling")
@@ -44,7 +47,31 @@ def sample_inputs(
     return inputs
 
 
-def parse_args():
+__UNITS__ = {
+    "seconds": {"s": 1, "m": 60, "h": 3600, "d": 86400},
+    "bytes": {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40},
+}
+
+
+def __parse_quantity__(text: str, kind: str) -> float:
+    """
+    A number with an optional unit, e.g.: 90m or 16G.
+    """
+    units = __UNITS__[kind]
+    factor = units.get(text[-1:].lower())
+    number = text[:-1] if factor is not None else text
+    try:
+        value = float(number) * (factor or 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid {kind}: {text}, expected a number followed by one of: {', '.join(units)}"
+        )
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"invalid {kind}: {text}, must be positive")
+    return value
+
+
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Grammar Pruning with Observational Equivalence",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -66,6 +93,12 @@ def parse_args():
     parser.add_argument(
         "--samples", type=int, default=1000, help="number of inputs to sample"
     )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="seed of the random sampling, for reproducible grammars",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -84,6 +117,12 @@ def parse_args():
         default=loop_strategies[0],
         help="looping algorithm to use",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to add loops",
+    )
     parser.add_argument(
         "--from",
         dest="automaton",
@@ -94,37 +133,191 @@ def parse_args():
         "--classes",
         type=str,
         default=None,
-        help="save equivalence classes ina JSON file",
+        help="save equivalence classes in a JSON Lines file, one class per line",
+    )
+    parser.add_argument(
+        "--classes-counts",
+        action="store_true",
+        help="only save the number of programs of each class",
+    )
+    parser.add_argument(
+        "--primitive-report",
+        nargs="?",
+        const="total",
+        default=None,
+        choices=PrimitiveProfiler.SORT_KEYS,
+        help="print the evaluation cost of each primitive sorted by this column",
+    )
+    parser.add_argument(
+        "--defer-expensive",
+        action="store_true",
+        help="evaluate programs using expensive primitives on all inputs only when needed",
+    )
+    parser.add_argument(
+        "--no-symmetry-breaking",
+        action="store_true",
+        help="also evaluate programs that only differ by a permutation of variables of the same type",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=None,
+        help="reuse the inputs and outputs saved in this file by a previous run, then save those of this run",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=lambda text: __parse_quantity__(text, "seconds"),
+        default=None,
+        help="stop enumerating at the last complete size before this time is used, e.g.: 2h",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=lambda text: int(__parse_quantity__(text, "bytes")),
+        default=None,
+        help="stop enumerating at the last complete size before this peak memory is used, e.g.: 16G",
+    )
+    parser.add_argument(
+        "--auto-size",
+        action="store_true",
+        help="with a budget, only enumerate the sizes predicted to fit in it, --size is then an upper bound",
     )
 
-    return parser.parse_args()
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.auto_size and args.time_budget is None and args.memory_budget is None:
+        parser.error("--auto-size needs --time-budget or --memory-budget")
+    return args
 
 
 def main():
     args = parse_args()
-    dsl, target_type, sample_dict, equal_dict, skip_exceptions = (
-        dsl_loader.load_python_file(args.dsl)
-    )
-    inputs = sample_inputs(args.samples, sample_dict, equal_dict)
+    if args.server is not None:
+        serve.delegate(args.server, "prune")
+    profiling.run_profiled(run, args)
+
 
-    evaluator = Evaluator(dsl, inputs, equal_dict, skip_exceptions)
-    manager = EquivalenceClassManager()
+def run(args):
+    budget = None
+    if args.time_budget is not None or args.memory_budget is not None:
+        budget = Budget(args.time_budget, args.memory_budget, args.auto_size)
     base_grammar = None
     base_aut_file: str = args.automaton or ""
     if len(base_aut_file) > 0:
-        base_grammar = load_automaton_from_file(base_aut_file)
-    reduced_grammar = prune(
-        dsl,
-        evaluator,
-        manager,
+        base_grammar = artifacts.load_automaton(base_aut_file)
+    primitive_profiler = None
+    if args.primitive_report is not None or args.defer_expensive:
+        primitive_profiler = PrimitiveProfiler()
+    grammar, manager = prune_grammar(
+        args.dsl,
         args.size,
-        None,
+        args.samples,
+        args.strategy,
+        args.jobs,
         base_grammar,
+        primitive_profiler,
+        args.defer_expensive,
+        keep_elements=args.classes is not None and not args.classes_counts,
+        symmetry_breaking=not args.no_symmetry_breaking,
+        checkpoint_file=args.checkpoint,
+        budget=budget,
+        seed=args.seed,
     )
+
+    dump_automaton_to_file(grammar, args.output)
+
+    if args.primitive_report is not None:
+        print(primitive_profiler.format(args.primitive_report))  # type: ignore
+
+    if args.classes is not None:
+        with open(args.classes, "w") as fd:
+            manager.write_jsonl(fd)
+
+
+def prune_grammar(
+    dsl_file: str,
+    size: int,
+    samples: int,
+    strategy: str = LoopingAlgorithm.GRAPE,
+    jobs: int = 1,
+    base_grammar: DFTA | None = None,
+    primitive_profiler: PrimitiveProfiler | None = None,
+    defer_expensive: bool = False,
+    keep_elements: bool = True,
+    symmetry_breaking: bool = True,
+    checkpoint_file: str | None = None,
+    budget: Budget | None = None,
+    seed: int | None = None,
+) -> tuple[DFTA, EquivalenceClassManager]:
+    """
+    The grammar generated by grape-prune and the equivalence classes found,
+    only their sizes are kept without keep_elements.
+    If the checkpoint file exists only the programs with new or changed
+    primitives are evaluated, it is then overwritten. It is not reused if
+    its inputs were sampled for other types or another number of samples.
+    With a seed, the sampling of the inputs is reproducible.
+    """
+    dsl, target_type, sample_dict, equal_dict, skip_exceptions, _ = (
+        artifacts.load_dsl(dsl_file)
+    )
+    if seed is not None:
+        random.seed(seed)
+    checkpoint = None
+    if checkpoint_file is not None and os.path.exists(checkpoint_file):
+        with profiling.stage("checkpoint.load"):
+            checkpoint = Checkpoint.load(checkpoint_file)
+        sampled = {t: len(values) for t, values in checkpoint.inputs.items()}
+        if sampled != {t: samples for t in sample_dict}:
+            print(
+                f"[warning] checkpoint not reused: its inputs were sampled as {sampled}",
+                file=sys.stderr,
+            )
+            checkpoint = None
+    if checkpoint is not None:
+        inputs = checkpoint.inputs
+    else:
+        with profiling.stage("sampling"):
+            inputs = artifacts.cached(
+                "inputs",
+                dsl_file,
+                (samples, seed),
+                lambda: sample_inputs(samples, sample_dict, equal_dict),
+            )
+        if checkpoint_file is not None:
+            checkpoint = Checkpoint(inputs)
+
+    evaluator = Evaluator(
+        dsl,
+        inputs,
+        equal_dict,
+        skip_exceptions,
+        primitive_profiler=primitive_profiler,
+        defer_expensive=defer_expensive,
+        symmetric_inputs=symmetry_breaking,
+    )
+    manager = EquivalenceClassManager(keep_elements)
+    with profiling.stage("prune"):
+        reduced_grammar = prune(
+            dsl,
+            evaluator,
+            manager,
+            size,
+            None,
+            base_grammar,
+            symmetry_breaking,
+            checkpoint,
+            budget,
+        )
+    if checkpoint_file is not None:
+        assert checkpoint is not None
+        with profiling.stage("checkpoint.save"):
+            checkpoint.save(checkpoint_file)
     type_req = type_request_from_specialized(reduced_grammar, dsl)
-    loop_algorithm = args.strategy
-    if loop_algorithm != "none":
-        grammar = add_loops(reduced_grammar, dsl, loop_algorithm, use_tqdm=True)
+    if strategy != "none":
+        with profiling.stage("add_loops"):
+            grammar = add_loops(
+                reduced_grammar, dsl, strategy, use_tqdm=True, jobs=jobs
+            )
     else:
         grammar = reduced_grammar
 
@@ -143,12 +336,7 @@ def main():
             f"[warning] the following primitives are not present in the grammar: {', '.join(missing)}",
             file=sys.stderr,
         )
-
-    dump_automaton_to_file(grammar, args.output)
-
-    if args.classes is not None:
-        with open(args.classes, "w") as fd:
-            fd.write(manager.to_json())
+    return grammar, manager
 
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+"""
+grape-serve keeps DSLs, sampled inputs and grammars in memory and runs the
+grape-* commands on behalf of their --server option.
+
+Protocol: JSON-RPC 2.0 over a Unix socket, one JSON object per line.
+Methods:
+    run(command, argv, cwd) -> {code, stdout, stderr}
+    ping() -> "pong"
+    stats() -> cache statistics
+    clear() -> empties the cache
+    shutdown() -> stops the server
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import stat
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any
+
+from grape import profiling
+from grape.cli import artifacts
+
+DEFAULT_SOCKET = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"grape-{os.getuid()}.sock"
+)
+
+COMMANDS = {
+    "compile",
+    "convert",
+    "count",
+    "despecialize",
+    "enum",
+    "info",
+    "intersection",
+    "normalize",
+    "prune",
+    "specialize",
+    "union",
+}
+
+
+def add_server_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--server",
+        type=str,
+        nargs="?",
+        const=DEFAULT_SOCKET,
+        default=None,
+        help="delegate to the grape-serve listening on this socket",
+    )
+
+
+def request(
+    socket_path: str, method: str, params: dict[str, Any] | None = None
+) -> Any:
+    """
+    Send one request to the server and returns its result.
+    """
+    import socket
+
+    message = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params or {}}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rw", encoding="utf-8") as fd:
+            fd.write(json.dumps(message) + "\n")
+            fd.flush()
+            line = fd.readline()
+    if not line:
+        raise ValueError("grape-serve closed the connection")
+    response = json.loads(line)
+    if "error" in response:
+        raise ValueError(f"grape-serve: {response['error']['message']}")
+    return response["result"]
+
+
+def delegate(socket_path: str, command: str) -> None:
+    """
+    Run the current command with its arguments on the server and exit with its code.
+    """
+    try:
+        result = request(
+            socket_path,
+            "run",
+            {"command": command, "argv": sys.argv[1:], "cwd": os.getcwd()},
+        )
+    except OSError as e:
+        print(f"cannot connect to grape-serve at {socket_path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(result["stdout"])
+    sys.stderr.write(result["stderr"])
+    sys.exit(result["code"])
+
+
+def run_command(command: str, argv: list[str], cwd: str) -> dict[str, Any]:
+    """
+    Run the command as if it was called from cwd, capturing its outputs.
+    """
+    if command not in COMMANDS:
+        raise ValueError(f"unknown command: {command}")
+    module = importlib.import_module(f"grape.cli.{command}")
+    stdout, stderr = io.StringIO(), io.StringIO()
+    code = 0
+    previous = os.getcwd()
+    try:
+        os.chdir(cwd)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                args = module.parse_args(argv)
+                args.server = None
+                profiling.run_profiled(module.run, args)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception as e:
+                print(f"{type(e).__name__}: {e}", file=sys.stderr)
+                code = 1
+    finally:
+        os.chdir(previous)
+    return {"code": code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+def __handle__(message: dict[str, Any], cache: artifacts.LRUCache) -> Any:
+    method = message.get("method")
+    params = message.get("params", {})
+    if method == "run":
+        return run_command(params["command"], params["argv"], params["cwd"])
+    elif method == "ping":
+        return "pong"
+    elif method == "stats":
+        return cache.stats()
+    elif method == "clear":
+        cache.clear()
+        return None
+    raise ValueError(f"unknown method: {method}")
+
+
+def serve(socket_path: str, max_entries: int) -> None:
+    """
+    Serve requests one at a time until the shutdown method is called.
+    """
+    import socket
+
+    if os.path.lexists(socket_path):
+        # Only replace the socket of a previous server
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise ValueError(f"{socket_path} exists and is not a socket")
+        os.unlink(socket_path)
+    cache = artifacts.enable_cache(max_entries)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        running = True
+        try:
+            while running:
+                conn, _ = server.accept()
+                with conn, conn.makefile("rw", encoding="utf-8") as fd:
+                    for line in fd:
+                        message = json.loads(line)
+                        response: dict[str, Any] = {
+                            "jsonrpc": "2.0",
+                            "id": message.get("id"),
+                        }
+                        if message.get("method") == "shutdown":
+                            running = False
+                            response["result"] = None
+                        else:
+                            try:
+                                response["result"] = __handle__(message, cache)
+                            except Exception as e:
+                                response["error"] = {"code": -32000, "message": str(e)}
+                        fd.write(json.dumps(response) + "\n")
+                        fd.flush()
+                        if not running:
+                            break
+        finally:
+            os.unlink(socket_path)
+            artifacts.disable_cache()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Serve grape-* commands with DSLs and grammars kept in memory",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=DEFAULT_SOCKET,
+        help="Unix socket to listen on",
+    )
+    parser.add_argument(
+        "--max-entries",
+        type=int,
+        default=32,
+        help="maximum number of DSLs, inputs and grammars kept in memory",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    serve(args.socket, args.max_entries)
+
+
+if __name__ == "__main__":
+    main()
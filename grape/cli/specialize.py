@@ -1,13 +1,12 @@
 import argparse
-from grape.automaton.automaton_manager import (
-    dump_automaton_to_file,
-    load_automaton_from_file,
-)
-from grape.automaton.spec_manager import specialize
-from grape.cli import dsl_loader
+import os
+from grape import profiling
+from grape.automaton.automaton_manager import dump_automaton_to_file
+from grape.automaton.spec_manager import specialize_many
+from grape.cli import artifacts, serve
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Specialize a grammar to a type request",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -19,7 +18,10 @@ def parse_args():
         help="your automaton file",
     )
     parser.add_argument(
-        "type_request", type=str, help="type request to specialize the grammar to"
+        "type_request",
+        type=str,
+        nargs="+",
+        help="type requests to specialize the grammar to",
     )
     parser.add_argument(
         "--dsl",
@@ -32,18 +34,49 @@ def parse_args():
         "--output",
         type=str,
         default="./grammar.grape",
-        help="output file containing the pruned grammar",
+        help="output file containing the pruned grammar, with several type requests '{}' is replaced by the index of the type request",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to specialize to several type requests",
     )
-    return parser.parse_args()
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def output_files(output: str, n: int) -> list[str]:
+    """
+    Without '{}', the index is added before the extensions of the file name,
+    e.g.: out.d/grammar_0.grape.gz
+    """
+    if n == 1:
+        return [output]
+    if "{}" not in output:
+        folder, name = os.path.split(output)
+        dot = name.find(".", 1)
+        if dot < 0:
+            dot = len(name)
+        output = os.path.join(folder, name[:dot] + "_{}" + name[dot:])
+    return [output.replace("{}", str(i)) for i in range(n)]
 
 
 def main():
     args = parse_args()
-    dfta = load_automaton_from_file(args.automaton)
-    dsl = dsl_loader.load_python_file(args.dsl)[0] if args.dsl is not None else None
-    grammar = specialize(dfta, args.type_request, dsl)
-    grammar.reduce()
-    dump_automaton_to_file(grammar, args.output)
+    if args.server is not None:
+        serve.delegate(args.server, "specialize")
+    profiling.run_profiled(run, args)
+
+
+def run(args):
+    dfta = artifacts.load_automaton(args.automaton)
+    dsl = artifacts.load_dsl(args.dsl)[0] if args.dsl is not None else None
+    files = output_files(args.output, len(args.type_request))
+    grammars = specialize_many(dfta, args.type_request, dsl, jobs=args.jobs)
+    for grammar, file in zip(grammars, files):
+        dump_automaton_to_file(grammar, file)
 
 
 if __name__ == "__main__":
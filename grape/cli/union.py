@@ -1,11 +1,12 @@
 import argparse
-from grape.automaton.automaton_manager import (
-    dump_automaton_to_file,
-    load_automaton_from_file,
-)
+from typing import Any
+from grape import profiling
+from grape.automaton.automaton_manager import dump_automaton_to_file
+from grape.automaton.tree_automaton import DFTA
+from grape.cli import artifacts, serve
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser(
         description="Produces the union of multiple grammars",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -23,20 +24,34 @@ def parse_args():
         type=str,
         help="output file",
     )
-    return parser.parse_args()
+    serve.add_server_argument(parser)
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
+    if args.server is not None:
+        serve.delegate(args.server, "union")
+    profiling.run_profiled(run, args)
 
-    grammars = [load_automaton_from_file(file) for file in args.grammars]
+
+def run(args):
+    grammars = [artifacts.load_automaton(file) for file in args.grammars]
+    dump_automaton_to_file(union_all(grammars), args.output)
+
+
+def union_all(grammars: list[DFTA]) -> DFTA[str, Any]:
+    """
+    Reduced and minimised union of the grammars, states are renamed.
+    """
+    grammars = list(grammars)
     out = grammars.pop()
     while grammars:
         out = out.read_union(grammars.pop())
         out.reduce()
         out = out.minimise()
-    out = out.classic_state_renaming()
-    dump_automaton_to_file(out, args.output)
+    return out.classic_state_renaming()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+from collections import defaultdict, deque
 from typing import Any, Callable, TypeVar, overload
 from grape import types
 from grape.automaton import spec_manager
@@ -16,6 +17,7 @@ class DSL:
         self.original_primitives: dict[str, str] = {}
         self.eval: dict[str, Callable] = {}
         self.to_merge: dict[Program, Program] = {}
+        self.__signatures: dict[str, list[tuple[tuple[str, ...], str]]] = {}
 
         for name, item in sorted(dsl.items()):
             if isinstance(item, tuple):
@@ -23,14 +25,14 @@ class DSL:
             else:
                 (stype, fn) = types.annotations_to_type_str(item), item
             self.original_primitives[name] = stype
-            variants = types.all_variants(stype)
+            ptype = types.Type.of(stype)
             self.eval[name] = fn
-            if len(variants) == 1:
+            if ptype.variant_count == 1:
                 self.primitives[name] = (stype, fn)
             else:
-                for sversion in variants:
-                    new_name = self.__name_variant__(name, sversion)
-                    self.primitives[new_name] = (sversion, fn)
+                for variant in ptype.iter_variants():
+                    new_name = self.__name_variant__(name, variant.name)
+                    self.primitives[new_name] = (variant.name, fn)
                     self.to_merge[Primitive(new_name)] = Primitive(name)
 
     def __name_variant__(self, primitive: str, str_type: str) -> str:
@@ -47,7 +49,7 @@ class DSL:
             return self.original_primitives[primitive]
 
     def max_arity(self) -> int:
-        return max(len(types.arguments(t)) for t, _ in self.primitives.values())
+        return max(types.Type.of(t).arity for t, _ in self.primitives.values())
 
     def semantic(self, primitive: str) -> Any:
         """
@@ -59,49 +61,78 @@ class DSL:
         else:
             return self.eval[primitive]
 
+    def get_type_signatures(self, stype: str) -> list[tuple[tuple[str, ...], str]]:
+        """
+        Get the (arguments, return type) of all variants of the specified type.
+        """
+        signatures = self.__signatures.get(stype)
+        if signatures is None:
+            signatures = [
+                (t.arguments, t.rtype) for t in types.Type.of(stype).variants
+            ]
+            self.__signatures[stype] = signatures
+        return signatures
+
     def get_state_types(self, automaton: DFTA[T, str | Program]) -> dict[T, str]:
         """
         Get a mapping from states to types.
+        The result is cached on the automaton until its rules change.
         """
+        return automaton.cached(
+            ("state_types", self), lambda: self.__infer_state_types__(automaton)
+        )
+
+    def __infer_state_types__(self, automaton: DFTA[T, str | Program]) -> dict[T, str]:
         # Assumes types variants are not present.
         specialized = spec_manager.is_specialized(automaton)
         if specialized:
             guessed_tr = spec_manager.type_request_from_specialized(automaton, self)
-            arg_types = types.arguments(guessed_tr)
+            arg_types = types.Type.of(guessed_tr).arguments
         state_to_type: dict[Any, str] = {}
         elements = list(automaton.rules.items())
-        while elements:
-            (P, args), dst = elements.pop()
+        # A rule is evaluated again only when one of its arguments gets a type
+        consumers: dict[Any, list[int]] = defaultdict(list)
+        for i, ((_, args), _) in enumerate(elements):
+            for arg_state in set(args):
+                consumers[arg_state].append(i)
+        done = [False] * len(elements)
+        queue = deque(reversed(range(len(elements))))
+        while queue:
+            i = queue.popleft()
+            if done[i]:
+                continue
+            (P, args), dst = elements[i]
             if not specialized and str(P).startswith("var_"):
                 Ptype = str(P)[len("var_") :]
+                signatures = self.get_type_signatures(Ptype)
+                rtype = types.Type.of(Ptype).rtype
             elif specialized and str(P).startswith("var"):
                 Ptype = arg_types[int(str(P)[len("var") :])]
+                signatures = self.get_type_signatures(Ptype)
+                rtype = types.Type.of(Ptype).rtype
             else:
-                base_Ptype = self.get_type(str(P))
-                all_possibles = types.all_variants(base_Ptype)
-                for i, arg_state in enumerate(args):
-                    if arg_state not in state_to_type:
-                        continue
-                    all_possibles = [
-                        t
-                        for t in all_possibles
-                        if state_to_type[arg_state] == types.arguments(t)[i]
-                    ]
-                if len(all_possibles) > 1:
-                    elements.insert(0, ((P, args), dst))
+                all_signatures = self.get_type_signatures(self.get_type(str(P)))
+                signatures = [
+                    (targs, trtype)
+                    for targs, trtype in all_signatures
+                    if all(
+                        state_to_type.get(arg_state, arg_type) == arg_type
+                        for arg_state, arg_type in zip(args, targs)
+                    )
+                ]
+                if len(signatures) > 1:
                     continue
                 else:
-                    assert len(all_possibles) > 0, (
+                    assert len(signatures) > 0, (
                         f"failed to find coherent primitive '{P}' in DSL during analysis of:\n\t{P} {args} -> {dst}\n\t{P} {tuple(map(lambda x: state_to_type.get(x, '?'), args))} -> {state_to_type.get(dst, '?')}"
                     )
-                    Ptype = all_possibles.pop()
+                    rtype = signatures[0][1]
+            done[i] = True
             if dst in state_to_type:
-                all_types = set()
-                for variant in types.all_variants(Ptype):
-                    all_types.add(types.return_type(variant))
-                assert state_to_type[dst] in all_types
+                assert state_to_type[dst] in {trtype for _, trtype in signatures}
             else:
-                state_to_type[dst] = types.return_type(Ptype)
+                state_to_type[dst] = rtype
+                queue.extend(j for j in consumers[dst] if not done[j])
         return state_to_type
 
     @overload
@@ -134,22 +165,16 @@ class DSL:
 
         for (P, args), dst in automaton.rules.items():
             str_type = self.original_primitives.get(str(P))
-            variants = [] if str_type is None else types.all_variants(str_type)
-            if len(variants) <= 1:
+            if str_type is None or types.Type.of(str_type).variant_count <= 1:
                 new_rules[(P, args)] = dst
             else:
-                variants = [
-                    t for t in variants if types.return_type(t) == state2type[dst]
-                ]
-                for i, arg_state in enumerate(args):
-                    variants = [
-                        t
-                        for t in variants
-                        if types.arguments(t)[i] == state2type[arg_state]
-                    ]
-                assert len(variants) == 1
-                newP = make(self.__name_variant__(str(P), variants.pop()))
-                new_rules[(newP, args)] = dst
+                # The variant is given by the types of the states
+                variant = types.Type.of(
+                    "->".join([state2type[arg] for arg in args] + [state2type[dst]])
+                )
+                new_name = self.__name_variant__(str(P), variant.name)
+                assert new_name in self.primitives
+                new_rules[(make(new_name), args)] = dst
         return DFTA(new_rules, set(list(automaton.finals)))
 
     def find_missing_variants(self, grammar: DFTA[Any, Program]) -> set[str]:
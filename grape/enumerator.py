@@ -1,15 +1,33 @@
 from itertools import product
 from collections import defaultdict
-from typing import Any, Generator
-from grape.program import Program, Function, Variable
+from typing import Any, Generator, Iterable
+from grape import profiling
+from grape.program import Program, Function, Primitive, Variable
 from grape.automaton.tree_automaton import DFTA
 from grape.partitions import integer_partitions
 
 
 class Enumerator:
-    def __init__(self, grammar: DFTA[Any, Program]):
+    """
+    Each group of interchangeable variables is assumed to be symmetric: if a
+    program of a final state is pruned by sending a smaller representative,
+    the programs of the same size that only differ from it by a permutation
+    of a group are not yielded. They are pruned with the representative under
+    the same permutation, added to symmetric_merges. As the representative is
+    smaller, its permutation was enumerated before them, so the programs kept
+    are the same as without groups.
+    """
+
+    def __init__(
+        self,
+        grammar: DFTA[Any, Program],
+        interchangeable: Iterable[Iterable[int]] = (),
+    ):
         self.grammar = grammar
         self.states = sorted(self.grammar.states)
+        self.groups = [list(group) for group in interchangeable if len(group) > 1]
+        # variable -> index of its group
+        self.group_of = {no: g for g, group in enumerate(self.groups) for no in group}
         self.__setup__()
 
     def count_programs_at_size(self, size: int) -> int:
@@ -35,6 +53,13 @@ class Enumerator:
                 if len(args) > 0 and args not in self.memory_combinations:
                     self.memory_combinations[args] = {}
         self.current_size = 0
+        # Program in memory -> its variables in order of first appearance
+        self.first_variables: dict[Program, tuple[int, ...]] = {}
+        # Canonical program of the current size -> (permutation that gave it
+        # from a pruned program, representative of that program)
+        self.orbits: dict[Program, tuple[dict[int, int], Program]] = {}
+        # (permuted program, representative) pruned as their canonical program
+        self.symmetric_merges: list[tuple[Program, Program]] = []
 
     def __query_combinations__(
         self, args: tuple[Any, ...], size: int
@@ -58,9 +83,13 @@ class Enumerator:
                     mem.append(combination)
             self.memory_combinations[args][size] = mem
 
-    def enumerate_until_size(self, size: int) -> Generator[Program, bool, None]:
+    def enumerate_until_size(
+        self, size: int
+    ) -> Generator[Program, bool | Program, None]:
         """
         Enumerate all programs until programs reach target size (excluded).
+        Send True to keep the yielded program, False or its representative to
+        prune it.
         """
 
         while self.current_size + 1 < size:
@@ -74,7 +103,7 @@ class Enumerator:
                             should_keep = True
                             if state in self.grammar.finals:
                                 should_keep = yield letter
-                            if should_keep:
+                            if should_keep is True:
                                 self.memory[state][1].append(letter)
             else:
                 for state in self.states:
@@ -85,13 +114,99 @@ class Enumerator:
                                 args, self.current_size - 1
                             ):
                                 program = Function(letter, list(combination))
-                                if state in self.grammar.finals:
-                                    should_keep = yield program
-                                    if should_keep:
-                                        self.memory[state][self.current_size].append(
-                                            program
-                                        )
-                                else:
-                                    self.memory[state][self.current_size].append(
-                                        program
-                                    )
+                                if state not in self.grammar.finals:
+                                    self.__store__(state, program)
+                                    continue
+                                if self.groups and self.__is_symmetric__(program):
+                                    continue
+                                decision = yield program
+                                if self.groups and isinstance(decision, Program):
+                                    self.__add_orbit__(program, decision)
+                                if decision is True:
+                                    self.__store__(state, program)
+                self.orbits.clear()
+            if profiling.ENABLED:
+                self.__count_programs__(self.current_size)
+
+    def __store__(self, state: Any, program: Program) -> None:
+        self.memory[state][self.current_size].append(program)
+        if self.groups:
+            self.first_variables[program] = self.__first_variables__(program)
+
+    def __first_variables__(self, program: Program) -> tuple[int, ...]:
+        match program:
+            case Variable(no):
+                return (no,)
+            case Primitive():
+                return ()
+        out = self.first_variables.get(program)
+        if out is None:
+            seen: dict[int, None] = {}
+            for arg in program.arguments:  # type: ignore
+                seen.update(dict.fromkeys(self.__first_variables__(arg)))
+            out = tuple(seen)
+        return out
+
+    def __canonical_permutation__(self, program: Program) -> dict[int, int]:
+        """
+        Permutation of the groups after which the variables of the program
+        first appear in the order of their group.
+        """
+        permutation: dict[int, int] = {}
+        used = [0] * len(self.groups)
+        for no in self.__first_variables__(program):
+            g = self.group_of.get(no)
+            if g is not None:
+                permutation[no] = self.groups[g][used[g]]
+                used[g] += 1
+        # The variables that do not appear take the remaining places in order
+        for g, group in enumerate(self.groups):
+            free = iter(group[used[g] :])
+            for no in group:
+                if no not in permutation:
+                    permutation[no] = next(free)
+        return permutation
+
+    def __add_orbit__(self, program: Program, representative: Program) -> None:
+        if representative.size() >= self.current_size:
+            return
+        permutation = self.__canonical_permutation__(program)
+        canonical = __rename__(program, permutation)
+        self.orbits.setdefault(canonical, (permutation, representative))
+
+    def __is_symmetric__(self, program: Program) -> bool:
+        """
+        True iff the program is pruned as a permutation of a pruned program,
+        then its merge is added to symmetric_merges.
+        """
+        permutation = self.__canonical_permutation__(program)
+        orbit = self.orbits.get(__rename__(program, permutation))
+        if orbit is None:
+            return False
+        # program = inverse(permutation)(first(pruned program))
+        first, representative = orbit
+        inverse = {target: no for no, target in permutation.items()}
+        representative = __rename__(__rename__(representative, first), inverse)
+        self.symmetric_merges.append((program, representative))
+        if profiling.ENABLED:
+            profiling.count("enumerator.symmetric")
+        return True
+
+    def __count_programs__(self, size: int) -> None:
+        """
+        Count the programs kept at this size per size and per state.
+        """
+        for state in self.states:
+            n = len(self.memory[state][size])
+            if n > 0:
+                profiling.count(f"enumerator.programs.size.{size}", n)
+                profiling.count(f"enumerator.programs.state.{state}", n)
+
+
+def __rename__(program: Program, renaming: dict[int, int]) -> Program:
+    match program:
+        case Variable(no):
+            return Variable(renaming.get(no, no))
+        case Function(function, arguments):
+            return Function(function, [__rename__(arg, renaming) for arg in arguments])
+    return program
@@ -1,6 +1,9 @@
 from collections import defaultdict
 import random
+import sys
+import time
 from typing import Any, Callable, Generator, Optional
+from grape import profiling
 from grape.dsl import DSL
 from grape.program import Function, Primitive, Program, Variable
 import grape.types as types
@@ -13,7 +16,109 @@ def random_product(
         yield tuple(prng.choice(li) for li in elements)
 
 
+class PrimitiveStats:
+    __slots__ = ("calls", "total", "max", "exceptions", "output_bytes")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.exceptions = 0
+        self.output_bytes = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            "calls": self.calls,
+            "total": self.total,
+            "mean": self.mean,
+            "max": self.max,
+            "exception_rate": self.exceptions / self.calls if self.calls else 0.0,
+            "output_size": self.output_bytes / self.calls if self.calls else 0.0,
+        }
+
+
+class PrimitiveProfiler:
+    """
+    Records for each primitive its calls, cumulative and max latency, exceptions
+    and mean output size (shallow size in bytes).
+    """
+
+    # Keys by which the report can be sorted
+    SORT_KEYS = ["total", "mean", "max", "calls", "exception_rate", "output_size"]
+
+    def __init__(self) -> None:
+        self.stats: dict[str, PrimitiveStats] = defaultdict(PrimitiveStats)
+
+    def record(self, name: str, seconds: float, out: Any) -> None:
+        stats = self.stats[name]
+        stats.calls += 1
+        stats.total += seconds
+        if seconds > stats.max:
+            stats.max = seconds
+        stats.output_bytes += sys.getsizeof(out)
+
+    def record_exception(self, name: str, seconds: float) -> None:
+        stats = self.stats[name]
+        stats.calls += 1
+        stats.total += seconds
+        if seconds > stats.max:
+            stats.max = seconds
+        stats.exceptions += 1
+
+    def expensive(self, factor: float = 4, min_calls: int = 100) -> set[str]:
+        """
+        Primitives whose mean latency is factor times the median one.
+        """
+        means = sorted(s.mean for s in self.stats.values() if s.calls >= min_calls)
+        if len(means) < 2:
+            return set()
+        median = means[(len(means) - 1) // 2]
+        return {
+            name
+            for name, s in self.stats.items()
+            if s.calls >= min_calls and s.mean > factor * median
+        }
+
+    def report(self, sort_by: str = "total") -> list[dict[str, Any]]:
+        if sort_by not in self.SORT_KEYS:
+            raise ValueError(f"cannot sort primitives by: {sort_by}")
+        rows = [{"primitive": name, **s.to_dict()} for name, s in self.stats.items()]
+        rows.sort(key=lambda row: row[sort_by], reverse=True)
+        return rows
+
+    def format(self, sort_by: str = "total") -> str:
+        columns = ["calls", "total", "mean", "max", "exc.", "out. size"]
+        lines = ["primitive".ljust(20) + "".join(c.rjust(11) for c in columns)]
+        for row in self.report(sort_by):
+            cells = [
+                str(row["calls"]),
+                f"{row['total']:.3f}s",
+                f"{row['mean'] * 1e6:.2f}us",
+                f"{row['max'] * 1e6:.1f}us",
+                f"{row['exception_rate']:.1%}",
+                f"{row['output_size']:.0f}B",
+            ]
+            lines.append(
+                row["primitive"].ljust(20) + "".join(c.rjust(11) for c in cells)
+            )
+        return "\n".join(lines)
+
+
 class Evaluator:
+    """
+    With defer_expensive, programs rooted in a primitive that the
+    primitive_profiler finds expensive are first evaluated on first_tier inputs
+    only. They are evaluated on all inputs once another program has the same
+    outputs on these inputs, which gives the same equivalence classes.
+    With symmetric_inputs, each argument takes all its sampled values so that
+    arguments of the same type are interchangeable, as symmetry breaking in
+    the pruner assumes.
+    """
+
     def __init__(
         self,
         dsl: DSL,
@@ -21,31 +126,57 @@ class Evaluator:
         equal_dict: dict[str, Callable],
         skip_exceptions: set,
         seed: int = 1,
+        primitive_profiler: Optional[PrimitiveProfiler] = None,
+        defer_expensive: bool = False,
+        first_tier: int = 8,
+        symmetric_inputs: bool = False,
     ):
+        if defer_expensive and primitive_profiler is None:
+            raise ValueError("defer_expensive needs a primitive_profiler")
         self.dsl = dsl
         self.equiv_classes: dict[str, dict[Any, Program]] = defaultdict(dict)
         self.memoization: dict[Program, dict[Any, Any]] = defaultdict(dict)
         self.rtypes: dict[str, str] = {
-            p: types.return_type(stype) for p, (stype, _) in dsl.primitives.items()
+            p: types.Type.of(stype).rtype for p, (stype, _) in dsl.primitives.items()
         }
         self.base_inputs = inputs
         self.full_inputs_size = len(self.base_inputs[list(self.base_inputs.keys())[0]])
         self.full_inputs: dict[str, list] = {}
         self.skip_exceptions = skip_exceptions
         self.prng = random.Random(seed)
+        self.primitive_profiler = primitive_profiler
+        self.defer_expensive = defer_expensive
+        self.first_tier = first_tier
+        self.symmetric_inputs = symmetric_inputs
+        self.deferred: set[str] = set()
+        # rtype -> outputs on the first tier of all classes and deferred programs
+        self.prefixes: dict[str, set[tuple[Any, ...]]] = defaultdict(set)
+        # rtype -> outputs on the first tier -> (deferred program, type request)
+        self.pending: dict[str, dict[tuple[Any, ...], tuple[Program, str]]] = (
+            defaultdict(dict)
+        )
+        self.__nevals = 0
 
     def clean_memoisation(self) -> None:
         self.memoization.clear()
 
     def free_memory(self) -> None:
         self.equiv_classes.clear()
+        self.prefixes.clear()
+        self.pending.clear()
         self.memoization.clear()
         self.full_inputs.clear()
 
     def __gen_full_inputs__(self, type_req: str) -> None:
         if type_req not in self.full_inputs:
-            args = types.arguments(type_req)
+            args = types.Type.of(type_req).arguments
             possibles = [list(set(self.base_inputs[arg])) for arg in args]
+            for arg, el in zip(args, possibles):
+                if len(el) == 0:
+                    raise ValueError(f"no sampled inputs for type {arg}")
+            if self.symmetric_inputs:
+                self.full_inputs[type_req] = self.__symmetric_inputs__(possibles)
+                return
             for el in possibles:
                 self.prng.shuffle(el)
             elems = set()
@@ -58,10 +189,21 @@ class Evaluator:
                     break
             self.full_inputs[type_req] = list(elems)
 
+    def __symmetric_inputs__(self, possibles: list[list]) -> list[tuple[Any, ...]]:
+        # Each column takes all the sampled values of its type, reshuffled
+        columns = []
+        for el in possibles:
+            column: list = []
+            while len(column) < self.full_inputs_size:
+                self.prng.shuffle(el)
+                column += el
+            columns.append(column[: self.full_inputs_size])
+        return list(dict.fromkeys(zip(*columns))) if columns else [()]
+
     def __return_type__(self, program: Program, type_req: str) -> str:
         match program:
             case Variable(no):
-                return types.arguments(type_req)[no]
+                return types.Type.of(type_req).arguments[no]
             case Primitive(name):
                 return self.rtypes[name]
             case Function(func):
@@ -73,30 +215,108 @@ class Evaluator:
         if program in self.memoization:
             return None
         self.__gen_full_inputs__(type_req)
+        profile = profiling.ENABLED or self.primitive_profiler is not None
+        rtype = self.__return_type__(program, type_req)
+        full_inputs = self.full_inputs[type_req]
+        if self.defer_expensive and self.__is_deferred__(program):
+            prefix = self.__outputs__(program, full_inputs[: self.first_tier], profile)
+            if prefix not in self.prefixes[rtype]:
+                self.prefixes[rtype].add(prefix)
+                self.pending[rtype][prefix] = (program, type_req)
+                if profile:
+                    profiling.count("evaluator.deferred")
+                return None
         # Compute its values
+        key = self.__outputs__(program, full_inputs, profile)
+        if profile:
+            profiling.count("evaluator.evaluations")
+            profiling.count("evaluator.inputs_evaluated", len(key))
+        representative = self.__classify__(program, rtype, key, profile)
+        if representative is not None:
+            del self.memoization[program]
+        return representative
+
+    def eval_known(
+        self, program: Program, type_req: str, key: tuple[Any, ...]
+    ) -> Optional[Program]:
+        """
+        Same as eval for a program whose outputs on the full inputs are known.
+        """
+        profile = profiling.ENABLED or self.primitive_profiler is not None
+        rtype = self.__return_type__(program, type_req)
+        if profiling.ENABLED:
+            profiling.count("evaluator.known")
+        return self.__classify__(program, rtype, key, profile)
+
+    def __classify__(
+        self,
+        program: Program,
+        rtype: str,
+        key: tuple[Any, ...],
+        profile: bool,
+    ) -> Optional[Program]:
+        if self.defer_expensive:
+            self.__complete_pending__(rtype, key[: self.first_tier], profile)
+        # Check equivalence class
+        representative = self.equiv_classes[rtype].get(key, None)
+        if representative is None:
+            self.equiv_classes[rtype][key] = program
+            if self.defer_expensive:
+                self.prefixes[rtype].add(key[: self.first_tier])
+        return representative
+
+    def __is_deferred__(self, program: Program) -> bool:
+        # The expensive primitives are updated as the profiler learns
+        self.__nevals += 1
+        if self.__nevals & 1023 == 0:
+            assert self.primitive_profiler is not None
+            self.deferred = self.primitive_profiler.expensive()
+        return isinstance(program, Function) and str(program.function) in self.deferred
+
+    def __outputs__(
+        self,
+        program: Program,
+        full_inputs: list[tuple[Any, ...]],
+        profile: bool,
+    ) -> tuple[Any, ...]:
         outs = []
-        for full_input in self.full_inputs[type_req]:
+        for full_input in full_inputs:
             try:
-                out = self.__eval__(program, full_input)
+                out = self.__eval__(program, full_input, profile)
             except Exception as e:
                 if any(isinstance(e, cls) for cls in self.skip_exceptions):
                     out = None
+                    if profiling.ENABLED:
+                        profiling.count("evaluator.skipped_exceptions")
                 else:
                     raise e
             outs.append(out)
-        # Check equivalence class
-        rtype = self.__return_type__(program, type_req)
-        key = tuple(outs)
-        representative = self.equiv_classes[rtype].get(key, None)
-        if representative is None:
+        return tuple(outs)
+
+    def __complete_pending__(
+        self,
+        rtype: str,
+        prefix: tuple[Any, ...],
+        profile: bool,
+    ) -> None:
+        """
+        Evaluate on all inputs the deferred program sharing this prefix, if any.
+        """
+        pending = self.pending[rtype].pop(prefix, None)
+        if pending is not None:
+            program, type_req = pending
+            key = self.__outputs__(program, self.full_inputs[type_req], profile)
             self.equiv_classes[rtype][key] = program
-        else:
-            del self.memoization[program]
-        return representative
+            if profiling.ENABLED:
+                profiling.count("evaluator.completed")
 
-    def __eval__(self, program: Program, full_input: tuple[Any, ...]) -> Any:
+    def __eval__(
+        self, program: Program, full_input: tuple[Any, ...], profile: bool = False
+    ) -> Any:
         mem = self.memoization[program]
         if full_input in mem:
+            if profile:
+                profiling.count("evaluator.cache_hits")
             return mem[full_input]
         # Compute value
         out = None
@@ -107,8 +327,32 @@ class Evaluator:
                 out = self.dsl.semantic(name)
             case Function(func):
                 fun = self.dsl.semantic(func.name)
-                arg_vals = [self.__eval__(arg, full_input) for arg in program.arguments]
-                out = fun(*arg_vals)
+                arg_vals = [
+                    self.__eval__(arg, full_input, profile) for arg in program.arguments
+                ]
+                if profile:
+                    out = self.__call_profiled__(func.name, fun, arg_vals)
+                else:
+                    out = fun(*arg_vals)
 
         mem[full_input] = out
         return out
+
+    def __call_profiled__(self, name: str, fun: Callable, arg_vals: list[Any]) -> Any:
+        """
+        Calls the primitive and records its time and output or exception.
+        """
+        start = time.perf_counter()
+        try:
+            out = fun(*arg_vals)
+        except Exception:
+            elapsed = time.perf_counter() - start
+            if self.primitive_profiler is not None:
+                self.primitive_profiler.record_exception(name, elapsed)
+            profiling.add_time(f"evaluator.primitive.{name}", elapsed)
+            raise
+        elapsed = time.perf_counter() - start
+        if self.primitive_profiler is not None:
+            self.primitive_profiler.record(name, elapsed, out)
+        profiling.add_time(f"evaluator.primitive.{name}", elapsed)
+        return out
@@ -0,0 +1,251 @@
+"""
+Named timers, counters and stages to find where the time of a run goes.
+
+Everything is a no-op until enable() is called, hot loops should check
+ENABLED before calling count or add_time.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import time
+from typing import TYPE_CHECKING, Any, Callable, Generator, TypeVar
+
+if TYPE_CHECKING:
+    import argparse
+
+T = TypeVar("T")
+
+# Number of functions kept per stage in the cProfile capture
+CPROFILE_ROWS = 25
+
+
+class Profiler:
+    """
+    Accumulates timers (calls, total and max seconds), counters and stages.
+    A stage is a timer that can also capture the peak memory and a cProfile,
+    the cProfile of nested stages is only captured in the outermost one.
+    """
+
+    def __init__(self, cprofile: bool = False, memory: bool = False):
+        self.cprofile = cprofile
+        self.memory = memory
+        self.timers: dict[str, list[float]] = {}
+        self.counters: dict[str, int] = defaultdict(int)
+        self.stages: dict[str, dict[str, Any]] = {}
+        # Peak memory of the children of each open stage
+        self.__peaks: list[int] = []
+        self.__cprofile_active = False
+
+    def add_time(self, name: str, seconds: float) -> None:
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[None, None, None]:
+        import tracemalloc
+
+        profile = None
+        if self.cprofile and not self.__cprofile_active:
+            import cProfile
+
+            profile = cProfile.Profile()
+            self.__cprofile_active = True
+            profile.enable()
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            # The peak can only be reset: the outer stage gets it back on exit
+            outer_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+            self.__peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add_time(name, elapsed)
+            info = self.stages.setdefault(name, {"calls": 0, "time": 0.0})
+            info["calls"] += 1
+            info["time"] += elapsed
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], self.__peaks.pop())
+                info["peak_memory"] = max(info.get("peak_memory", 0), peak)
+                if self.__peaks:
+                    self.__peaks[-1] = max(self.__peaks[-1], outer_peak, peak)
+            if profile is not None:
+                profile.disable()
+                self.__cprofile_active = False
+                info["cprofile"] = info.get("cprofile", []) + __top_functions__(
+                    profile
+                )
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "timers": {
+                name: {"calls": int(calls), "total": total, "max": max_time}
+                for name, (calls, total, max_time) in sorted(self.timers.items())
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "stages": self.stages,
+        }
+
+
+def __top_functions__(profile: Any) -> list[dict[str, Any]]:
+    import pstats
+
+    stats = pstats.Stats(profile).stats  # type: ignore
+    rows = []
+    for (file, line, fn), (_, ncalls, tottime, cumtime, _) in stats.items():
+        rows.append(
+            {
+                "function": f"{file}:{line}({fn})",
+                "calls": ncalls,
+                "tottime": tottime,
+                "cumtime": cumtime,
+            }
+        )
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+    return rows[:CPROFILE_ROWS]
+
+
+__PROFILER__: Profiler | None = None
+ENABLED = False
+
+
+def enable(cprofile: bool = False, memory: bool = False) -> Profiler:
+    global __PROFILER__, ENABLED
+    __PROFILER__ = Profiler(cprofile, memory)
+    ENABLED = True
+    if memory:
+        import tracemalloc
+
+        tracemalloc.start()
+    return __PROFILER__
+
+
+def disable() -> Profiler | None:
+    """
+    Stop profiling and returns the profiler that was enabled.
+    """
+    global __PROFILER__, ENABLED
+    profiler = __PROFILER__
+    __PROFILER__ = None
+    ENABLED = False
+    if profiler is not None and profiler.memory:
+        import tracemalloc
+
+        tracemalloc.stop()
+    return profiler
+
+
+def count(name: str, n: int = 1) -> None:
+    if __PROFILER__ is not None:
+        __PROFILER__.counters[name] += n
+
+
+def add_time(name: str, seconds: float) -> None:
+    if __PROFILER__ is not None:
+        __PROFILER__.add_time(name, seconds)
+
+
+def timer(name: str) -> Any:
+    """
+    Context manager timing its body.
+    """
+    if __PROFILER__ is None:
+        return __NULL_CONTEXT__
+    return __Timer__(__PROFILER__, name)
+
+
+def stage(name: str) -> Any:
+    """
+    Context manager timing a stage, with its cProfile and peak memory if enabled.
+    """
+    if __PROFILER__ is None:
+        return __NULL_CONTEXT__
+    return __PROFILER__.stage(name)
+
+
+def timed(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """
+    Decorator timing each call of the function.
+    """
+
+    def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            if __PROFILER__ is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                __PROFILER__.add_time(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class __NullContext__:
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *args: Any) -> None:
+        return None
+
+
+__NULL_CONTEXT__ = __NullContext__()
+
+
+class __Timer__:
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args: Any) -> None:
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+
+
+def add_profile_arguments(parser: "argparse.ArgumentParser") -> None:
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="write the timers, counters and stages of the run in this JSON file",
+    )
+    parser.add_argument(
+        "--profile-capture",
+        nargs="+",
+        choices=["cprofile", "memory"],
+        default=[],
+        help="also capture a cProfile and/or the peak memory of each stage",
+    )
+
+
+def run_profiled(run: Callable[[Any], T], args: Any) -> T:
+    """
+    Call run(args), profiled if args.profile is set.
+    """
+    if getattr(args, "profile", None) is None:
+        return run(args)
+    capture = args.profile_capture
+    profiler = enable("cprofile" in capture, "memory" in capture)
+    try:
+        with timer("total"):
+            return run(args)
+    finally:
+        disable()
+        import json
+
+        with open(args.profile, "w") as fd:
+            json.dump(profiler.report(), fd, indent=1)
@@ -11,6 +11,10 @@ class Program(ABC):
     def __repr__(self):
         return str(self)
 
+    def __reduce__(self):
+        # Rebuilt from their fields since hashes of str differ between processes
+        return (type(self), tuple(getattr(self, f) for f in self.__match_args__))
+
     @abstractmethod
     def size(self) -> int:
         pass
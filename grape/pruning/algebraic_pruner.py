@@ -0,0 +1,113 @@
+from collections import defaultdict
+from grape.dsl import DSL
+from grape.evaluator import Evaluator
+from grape.program import Function, Primitive, Program, Variable
+from grape.pruning.equivalence_class_manager import EquivalenceClassManager
+import grape.types as types
+
+# (primitive, property, [argument index, element]) the argument is only given
+# for identity and absorbing elements
+Law = tuple[str, str, list]
+
+
+def __equivalent__(
+    evaluator: Evaluator, program: Program, other: Program, type_req: str
+) -> bool:
+    # Subprograms of previous laws are memoized but may not have their class
+    evaluator.clean_memoisation()
+    representative = evaluator.eval(other, type_req) or other
+    return (evaluator.eval(program, type_req) or program) == representative
+
+
+def __apply__(primitive: str, *args: Program) -> Function:
+    return Function(Primitive(primitive), list(args))
+
+
+def __unary_laws__(
+    prim: str, evaluator: Evaluator, manager: EquivalenceClassManager, type_req: str
+) -> list[Law]:
+    x = Variable(0)
+    twice = __apply__(prim, __apply__(prim, x))
+    if __equivalent__(evaluator, twice, x, type_req):
+        manager.add_merge(twice, x)
+        return [(prim, "involutive", [])]
+    elif __equivalent__(evaluator, twice, __apply__(prim, x), type_req):
+        manager.add_merge(twice, __apply__(prim, x))
+        return [(prim, "idempotent", [])]
+    return []
+
+
+def __binary_laws__(
+    prim: str,
+    constants: list[str],
+    commutative: bool,
+    evaluator: Evaluator,
+    manager: EquivalenceClassManager,
+    type_req: str,
+) -> list[Law]:
+    laws: list[Law] = []
+    x, y, z, w = (Variable(i) for i in range(4))
+    left = __apply__(prim, __apply__(prim, x, y), z)
+    right = __apply__(prim, x, __apply__(prim, y, z))
+    if __equivalent__(evaluator, left, right, type_req):
+        laws.append((prim, "associative", []))
+        if commutative:
+            manager.add_merge(
+                __apply__(prim, __apply__(prim, x, y), __apply__(prim, z, w)),
+                __apply__(prim, left, w),
+            )
+        else:
+            manager.add_merge(left, right)
+    same = __apply__(prim, x, x)
+    if __equivalent__(evaluator, same, x, type_req):
+        laws.append((prim, "idempotent", []))
+        manager.add_merge(same, x)
+    for constant in constants:
+        c = Primitive(constant)
+        for i, program in enumerate([__apply__(prim, c, x), __apply__(prim, x, c)]):
+            if __equivalent__(evaluator, program, x, type_req):
+                laws.append((prim, "identity", [i, constant]))
+                manager.add_merge(program, x)
+            elif __equivalent__(evaluator, program, c, type_req):
+                laws.append((prim, "absorbing", [i, constant]))
+                manager.add_merge(program, c)
+    return laws
+
+
+def prune(
+    dsl: DSL,
+    evaluator: Evaluator,
+    manager: EquivalenceClassManager,
+    commutatives: list[tuple[str, list[int]]],
+) -> list[Law]:
+    """
+    Finds on the sampled inputs the involutive and idempotent unary primitives,
+    and the associative and idempotent binary primitives with their identity
+    and absorbing elements, of type t -> t and t -> t -> t.
+    """
+    # Laws are checked on their own inputs so they do not pollute the classes
+    tester = Evaluator(dsl, evaluator.base_inputs, {}, evaluator.skip_exceptions)
+    commutative = {p for p, _ in commutatives}
+    constants: dict[str, list[str]] = defaultdict(list)
+    for prim, (stype, _) in dsl.primitives.items():
+        ptype = types.Type.of(stype)
+        if ptype.arity == 0:
+            constants[ptype.rtype].append(prim)
+    laws: list[Law] = []
+    for prim, (stype, _) in dsl.primitives.items():
+        ptype = types.Type.of(stype)
+        t = ptype.rtype
+        if t not in evaluator.base_inputs or any(a != t for a in ptype.arguments):
+            continue
+        if ptype.arity == 1:
+            laws += __unary_laws__(prim, tester, manager, f"{t}->{t}")
+        elif ptype.arity == 2:
+            laws += __binary_laws__(
+                prim,
+                constants[t],
+                prim in commutative,
+                tester,
+                manager,
+                "->".join([t] * 5),
+            )
+    return laws
@@ -0,0 +1,67 @@
+import sys
+import time
+
+
+def peak_memory() -> int:
+    """
+    Peak resident size of the process in bytes.
+    """
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes except on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Budget:
+    """
+    Time in seconds since its creation and peak memory in bytes that a pruning
+    run may use, it stops once a margin of either is used so that the grammar
+    can still be built.
+    With auto_size, a size is only started if it is predicted to fit.
+    """
+
+    def __init__(
+        self,
+        seconds: float | None = None,
+        memory: int | None = None,
+        auto_size: bool = False,
+        margin: float = 0.9,
+    ):
+        if seconds is None and memory is None:
+            raise ValueError("a budget needs a time or a memory limit")
+        self.seconds = seconds
+        self.memory = memory
+        self.auto_size = auto_size
+        self.margin = margin
+        self.start = time.perf_counter()
+        # Largest size whose programs were all enumerated, set by the pruner
+        self.verified_size: int | None = None
+        self.begin()
+
+    def begin(self) -> None:
+        """
+        Starts the work whose growth is predicted.
+        """
+        self.work_start = time.perf_counter()
+        self.work_memory = peak_memory() if self.memory is not None else 0
+
+    def used(self, growth: float = 1) -> float:
+        """
+        Largest fraction used of the time and memory limits, if the work since
+        begin grows by this factor.
+        """
+        used = 0.0
+        if self.seconds is not None:
+            work = time.perf_counter() - self.work_start
+            used = (self.work_start - self.start + work * growth) / self.seconds
+        if self.memory is not None:
+            work = peak_memory() - self.work_memory
+            used = max(used, (self.work_memory + work * growth) / self.memory)
+        return used
+
+    def exceeded(self) -> bool:
+        return self.used() >= self.margin
+
+    def fits(self, growth: float) -> bool:
+        return self.used(growth) < self.margin
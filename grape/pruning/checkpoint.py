@@ -0,0 +1,309 @@
+from collections import Counter
+from functools import partial
+from itertools import islice
+import pickle
+import sys
+from types import (
+    BuiltinFunctionType,
+    ClassMethodDescriptorType,
+    CodeType,
+    FunctionType,
+    MethodDescriptorType,
+    MethodType,
+    MethodWrapperType,
+    ModuleType,
+    WrapperDescriptorType,
+)
+from typing import Any, Iterable, Iterator
+from grape.dsl import DSL
+from grape.evaluator import Evaluator
+from grape.program import Function, Primitive, Program
+import grape.types as types
+
+CHECKPOINT_VERSION = 2
+__CONSTANTS__ = (type(None), bool, int, float, complex, str, bytes, type(...))
+__BUILTINS__ = (
+    BuiltinFunctionType,
+    MethodDescriptorType,
+    WrapperDescriptorType,
+    MethodWrapperType,
+    ClassMethodDescriptorType,
+)
+# Attributes of classes that do not change their behaviour
+__CLASS_IGNORED__ = {
+    "__dict__",
+    "__doc__",
+    "__firstlineno__",
+    "__module__",
+    "__qualname__",
+    "__static_attributes__",
+    "__weakref__",
+}
+
+
+def __primitives__(program: Program) -> Iterator[str]:
+    match program:
+        case Primitive(name):
+            yield name
+        case Function(function, arguments):
+            yield from __primitives__(function)
+            for arg in arguments:
+                yield from __primitives__(arg)
+
+
+def __join__(parts: Iterable[Any]) -> tuple | None:
+    parts = tuple(parts)
+    return None if any(part is None for part in parts) else parts
+
+
+def __is_stdlib__(module: str | None) -> bool:
+    return module is not None and module.split(".")[0] in sys.stdlib_module_names
+
+
+def __code_fingerprint__(code: CodeType, scope: dict, seen: set[int]) -> tuple | None:
+    consts = (
+        (
+            __code_fingerprint__(const, scope, seen)
+            if isinstance(const, CodeType)
+            else __fingerprint__(const, seen)
+        )
+        for const in code.co_consts
+    )
+    # Attribute names are also there but only globals are looked up
+    names = (
+        __join__((name, __fingerprint__(scope[name], seen)))
+        for name in code.co_names
+        if name in scope
+    )
+    return __join__((code.co_code, code.co_names, __join__(consts), __join__(names)))
+
+
+def __fingerprint__(value: Any, seen: set[int]) -> Any:
+    """
+    Picklable description of the value that changes with its implementation,
+    None if it cannot be described.
+    """
+    if isinstance(value, __CONSTANTS__):
+        return type(value).__name__, repr(value)
+    if isinstance(value, (tuple, list)):
+        values = __join__(__fingerprint__(v, seen) for v in value)
+        return None if values is None else (type(value).__name__, values)
+    if isinstance(value, (set, frozenset)):
+        values = __join__(__fingerprint__(v, seen) for v in value)
+        if values is None:
+            return None
+        return type(value).__name__, tuple(sorted(values, key=repr))
+    if isinstance(value, dict):
+        items = __join__(
+            __join__((__fingerprint__(k, seen), __fingerprint__(v, seen)))
+            for k, v in value.items()
+        )
+        return None if items is None else ("dict", tuple(sorted(items, key=repr)))
+    if isinstance(value, ModuleType):
+        return "module", value.__name__
+    if isinstance(value, partial):
+        return __join__(
+            (
+                "partial",
+                __fingerprint__(value.func, seen),
+                __fingerprint__(value.args, seen),
+                __fingerprint__(value.keywords, seen),
+            )
+        )
+    if isinstance(value, __BUILTINS__):
+        owner = getattr(value, "__self__", None)
+        if owner is not None and not isinstance(owner, (ModuleType, type)):
+            owner = __fingerprint__(owner, seen)
+            if owner is None:
+                return None
+        else:
+            owner = None
+        return "builtin", getattr(value, "__module__", None), value.__qualname__, owner
+    if isinstance(value, (classmethod, staticmethod)):
+        return __join__((type(value).__name__, __fingerprint__(value.__func__, seen)))
+    if isinstance(value, MethodType):
+        return __join__(
+            (
+                "method",
+                __fingerprint__(value.__func__, seen),
+                __fingerprint__(value.__self__, seen),
+            )
+        )
+    if not isinstance(value, (FunctionType, type)):
+        return None
+    # Recursive definitions
+    if id(value) in seen:
+        return "seen", value.__qualname__
+    seen.add(id(value))
+    if isinstance(value, type):
+        if value.__module__ == "builtins" or __is_stdlib__(value.__module__):
+            return "class", value.__module__, value.__qualname__
+        attributes = (
+            __join__((name, __fingerprint__(attr, seen)))
+            for name, attr in sorted(vars(value).items())
+            if name not in __CLASS_IGNORED__
+        )
+        return __join__(
+            (
+                "class",
+                value.__qualname__,
+                __fingerprint__(value.__bases__, seen),
+                __join__(attributes),
+            )
+        )
+    if __is_stdlib__(value.__module__):
+        return "function", value.__module__, value.__qualname__
+    try:
+        cells = tuple(cell.cell_contents for cell in value.__closure__ or ())
+    except ValueError:
+        # Empty cell
+        return None
+    return __join__(
+        (
+            "function",
+            __code_fingerprint__(value.__code__, value.__globals__, seen),
+            __fingerprint__(value.__defaults__, seen),
+            __fingerprint__(value.__kwdefaults__, seen),
+            __fingerprint__(cells, seen),
+        )
+    )
+
+
+def __primitive_fingerprint__(dsl: DSL, prim: str) -> tuple | None:
+    """
+    Type and implementation of the primitive, None if the implementation
+    cannot be described so that the primitive is considered changed.
+    """
+    stype, fn = dsl.primitives[prim]
+    return __join__((stype, __fingerprint__(fn, set())))
+
+
+def __covers__(type_req: str, other: str) -> bool:
+    """
+    True iff the variables of other can be given by those of type_req.
+    """
+    if types.Type.of(type_req).rtype != types.Type.of(other).rtype:
+        return False
+    available = Counter(types.arguments(type_req))
+    return all(available[t] >= n for t, n in Counter(types.arguments(other)).items())
+
+
+class Checkpoint:
+    """
+    Inputs and outputs of the programs enumerated by a pruning run, from which
+    a modified DSL is pruned again without evaluating the programs that only
+    use unchanged primitives.
+    Primitives are compared by their type and the code, constants, closures
+    and globals of their implementation.
+    """
+
+    def __init__(self, inputs: dict[str, list]):
+        self.inputs = inputs
+        self.type_req: str | None = None
+        self.full_inputs: list[tuple[Any, ...]] = []
+        self.fingerprints: dict[str, tuple | None] = {}
+        # program -> outputs on the full inputs, shared by its class
+        self.outputs: dict[Program, tuple[Any, ...]] = {}
+        self.__first_new: dict[str, int] = {}
+        self.__pruned: dict[Program, Program] = {}
+
+    def resume(self, dsl: DSL, type_req: str) -> str:
+        """
+        Forgets the programs using primitives that were removed or changed,
+        returns the type request to enumerate with.
+        """
+        fingerprints = {
+            prim: __primitive_fingerprint__(dsl, prim) for prim in dsl.primitives
+        }
+        if self.type_req is not None and __covers__(self.type_req, type_req):
+            invalid = {
+                prim
+                for prim, fingerprint in self.fingerprints.items()
+                if fingerprint is None or fingerprints.get(prim) != fingerprint
+            }
+            if invalid:
+                self.outputs = {
+                    program: key
+                    for program, key in self.outputs.items()
+                    if invalid.isdisjoint(__primitives__(program))
+                }
+            type_req = self.type_req
+            print(
+                f"checkpoint: {len(self.outputs)} programs known, "
+                f"{len(invalid)} primitives changed or removed"
+            )
+        elif self.type_req is not None:
+            print(
+                f"[warning] checkpoint not reused: {type_req} needs variables missing from {self.type_req}",
+                file=sys.stderr,
+            )
+            self.full_inputs = []
+            self.outputs.clear()
+        self.type_req = type_req
+        self.fingerprints = fingerprints
+        return type_req
+
+    def begin(self, evaluator: Evaluator) -> None:
+        """
+        Gives the evaluator the inputs of the previous run, to call before
+        enumerating.
+        """
+        assert self.type_req is not None
+        if self.full_inputs:
+            evaluator.full_inputs[self.type_req] = self.full_inputs
+        self.__first_new = {
+            rtype: len(classes) for rtype, classes in evaluator.equiv_classes.items()
+        }
+        self.__pruned.clear()
+
+    def known(self, program: Program) -> tuple[Any, ...] | None:
+        return self.outputs.get(program)
+
+    def record(self, program: Program, representative: Program) -> None:
+        self.__pruned[program] = representative
+
+    def end(self, evaluator: Evaluator) -> None:
+        """
+        Saves the outputs of the classes found since begin.
+        """
+        assert self.type_req is not None
+        self.full_inputs = evaluator.full_inputs[self.type_req]
+        for rtype, classes in evaluator.equiv_classes.items():
+            start = self.__first_new.get(rtype, 0)
+            for key, program in islice(classes.items(), start, None):
+                self.outputs[program] = key
+        for program, representative in self.__pruned.items():
+            key = self.outputs.get(representative)
+            if key is not None:
+                self.outputs[program] = key
+        self.__pruned.clear()
+
+    def save(self, file: str) -> None:
+        with open(file, "wb") as fd:
+            pickle.dump(
+                (
+                    CHECKPOINT_VERSION,
+                    self.inputs,
+                    self.type_req,
+                    self.full_inputs,
+                    self.fingerprints,
+                    self.outputs,
+                ),
+                fd,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+    @staticmethod
+    def load(file: str) -> "Checkpoint":
+        with open(file, "rb") as fd:
+            data = pickle.load(fd)
+        if data[0] != CHECKPOINT_VERSION:
+            raise ValueError(f"unsupported checkpoint version: {data[0]}")
+        checkpoint = Checkpoint(data[1])
+        (
+            checkpoint.type_req,
+            checkpoint.full_inputs,
+            checkpoint.fingerprints,
+            checkpoint.outputs,
+        ) = data[2:]
+        return checkpoint
@@ -33,16 +33,17 @@ def __add_rewrite__(
     swapped_indices: tuple[int, int],
     manager: EquivalenceClassManager,
 ):
-    stype = dsl.primitives[primitive][0]
-    args_type, _ = types.parse(stype)
-    swapped_type = args_type[swapped_indices[0]]
+    ptype = types.Type.of(dsl.primitives[primitive][0])
+    swapped_type = ptype.arguments[swapped_indices[0]]
+    nargs = ptype.arity
+    # Only primitives returning the swapped type are relevant
+    candidates = []
+    for p, (stype, _) in dsl.primitives.items():
+        t = types.Type.of(stype)
+        if t.rtype == swapped_type:
+            candidates.append((p, t.arguments))
 
-    nargs = len(types.arguments(dsl.primitives[primitive][0]))
-
-    for p1, (stype1, _) in dsl.primitives.copy().items():
-        args1, rtype1 = types.parse(stype1)
-        if rtype1 != swapped_type:
-            continue
+    for p1, args1 in candidates:
         nargs1 = len(args1)
         first_arg = (
             Function(Primitive(p1), [Variable(i + nargs) for i in range(nargs1)])
@@ -50,12 +51,9 @@ def __add_rewrite__(
             else Primitive(p1)
         )
 
-        for p2, (stype2, _) in dsl.primitives.items():
+        for p2, args2 in candidates:
             if p1 >= p2:
                 continue
-            args2, rtype2 = types.parse(stype2)
-            if rtype2 != swapped_type:
-                continue
 
             second_arg: Program = (
                 Function(
@@ -95,7 +93,7 @@ def prune(
 ) -> list[tuple[str, list[int]]]:
     commutatives = []
     for prim, (stype, _) in dsl.primitives.items():
-        args = types.arguments(stype)
+        args = types.Type.of(stype).arguments
         if len(args) < 2:
             continue
         # Check if we can sample all elements
@@ -121,6 +119,7 @@ def prune(
                 commutatives.append(
                     (prim, [i for i, x in enumerate(new_args) if x.no != i])
                 )
+                manager.add_commutative(prim, swapped)
                 __add_rewrite__(dsl, prim, (swapped[0], swapped[1]), manager)
     evaluator.clean_memoisation()
     return commutatives
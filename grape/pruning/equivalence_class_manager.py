@@ -1,42 +1,230 @@
+from collections import defaultdict
 import json
-from grape.program import Program
+from typing import IO, Generator, Iterable, Optional
+from grape.program import Function, Program, Variable, Primitive
 
 
 class EquivalenceClassManager:
-    def __init__(self):
-        self.classes: dict[Program, set[Program]] = {}
+    """
+    Union-find over interned programs: a program is stored as the tuple of the
+    ids of its letter and of its arguments, so subprograms are shared.
+
+    With keep_elements=False, only the number of programs merged into each
+    class is kept.
+    """
+
+    def __init__(self, keep_elements: bool = True):
+        self.keep_elements = keep_elements
+        self.letter_ids: dict[str, int] = {}
+        self.letters: list[str] = []
+        # (letter id, *argument ids) <-> program id
+        self.ids: dict[tuple[int, ...], int] = {}
+        self.keys: list[tuple[int, ...]] = []
+        self.parent: list[int] = []
+        # representative id -> number of programs merged into its class
+        self.counts: dict[int, int] = {}
+        # (primitive, swapped argument indices) found by the commutativity pruner
+        self.commutatives: list[tuple[str, list[int]]] = []
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __intern__(self, program: Program) -> int:
+        match program:
+            case Function(function, arguments):
+                key = (self.__letter__(str(function)),) + tuple(
+                    self.__intern__(arg) for arg in arguments
+                )
+            case _:
+                key = (self.__letter__(str(program)),)
+        pid = self.ids.get(key)
+        if pid is None:
+            pid = len(self.keys)
+            self.ids[key] = pid
+            self.keys.append(key)
+            self.parent.append(pid)
+        return pid
+
+    def __letter__(self, name: str) -> int:
+        lid = self.letter_ids.get(name)
+        if lid is None:
+            lid = len(self.letters)
+            self.letter_ids[name] = lid
+            self.letters.append(name)
+        return lid
+
+    def __lookup__(self, program: Program) -> Optional[int]:
+        """
+        Id of the program if it was interned.
+        """
+        match program:
+            case Function(function, arguments):
+                lid = self.letter_ids.get(str(function))
+                key: list[Optional[int]] = [lid] + [
+                    self.__lookup__(arg) for arg in arguments
+                ]
+            case _:
+                key = [self.letter_ids.get(str(program))]
+        if any(x is None for x in key):
+            return None
+        return self.ids.get(tuple(key))  # type: ignore
+
+    def __find__(self, pid: int) -> int:
+        parent = self.parent
+        root = pid
+        while parent[root] != root:
+            root = parent[root]
+        while parent[pid] != root:
+            parent[pid], pid = root, parent[pid]
+        return root
+
+    def __program__(self, pid: int) -> Program:
+        letter, *args = self.keys[pid]
+        name = self.letters[letter]
+        if args:
+            return Function(Primitive(name), [self.__program__(arg) for arg in args])
+        elif name.startswith("var"):
+            return Variable(int(name[len("var") :]))
+        return Primitive(name)
+
+    def __str_program__(self, pid: int) -> str:
+        letter, *args = self.keys[pid]
+        if args:
+            args_str = " ".join(self.__str_program__(arg) for arg in args)
+            return f"({self.letters[letter]} {args_str})"
+        return self.letters[letter]
 
     def new_class(self, representative: Program):
         """
         Create a new class of equivalence.
         Assumes class does not already exist.
         """
-        assert representative not in self.classes
-        self.classes[representative] = set()
+        rid = self.__intern__(representative)
+        assert rid not in self.counts
+        self.counts[rid] = 0
 
     def add_to_class(self, program: Program, representative: Program):
         """
         Add a program to an already existing equivalence class.
         Assumes class already exists.
         """
-        self.classes[representative].add(program)
+        root = self.__find__(self.__intern__(representative))
+        if self.keep_elements:
+            other = self.__find__(self.__intern__(program))
+        else:
+            # Only representatives are interned, their classes are merged
+            pid = self.__lookup__(program)
+            other = self.__find__(pid) if pid is not None else -1
+            if other not in self.counts:
+                self.counts[root] += 1
+                return
+        if other == root:
+            return
+        self.parent[other] = root
+        self.counts[root] += 1 + self.counts.pop(other, 0)
 
     def add_merge(self, program: Program, representative: Program):
         """
         Add a program to an already existing equivalence class.
         Assumes nothing so it creates a new class if it does not exist.
         """
-        if representative not in self.classes:
-            self.new_class(representative)
+        rid = self.__intern__(representative)
+        if self.__find__(rid) not in self.counts:
+            self.counts[rid] = 0
         self.add_to_class(program, representative)
 
+    def add_commutative(self, primitive: str, swapped: list[int]):
+        """
+        Record that swapping these two arguments of the primitive is an equivalence.
+        """
+        self.commutatives.append((primitive, swapped))
+
+    def representative(self, program: Program) -> Optional[Program]:
+        """
+        Representative of the class of the program if it was recorded.
+        """
+        pid = self.__lookup__(program)
+        if pid is None:
+            return None
+        root = self.__find__(pid)
+        return self.__program__(root) if root in self.counts else None
+
+    def iter_classes(self) -> Generator[tuple[str, list[str], int], None, None]:
+        """
+        Yields (representative, elements, number of elements) for each class,
+        elements are empty if they are not kept.
+        """
+        members: dict[int, list[int]] = defaultdict(list)
+        if self.keep_elements:
+            for pid in range(len(self.parent)):
+                root = self.__find__(pid)
+                if root != pid and root in self.counts:
+                    members[root].append(pid)
+        for root, count in self.counts.items():
+            elements = [self.__str_program__(pid) for pid in members.get(root, [])]
+            yield self.__str_program__(root), elements, count
+
+    def write_jsonl(self, fd: IO[str]) -> None:
+        """
+        Write one JSON object per class: representative, count (number of programs)
+        and elements.
+        Commutative primitives are written first.
+        """
+        for primitive, swapped in self.commutatives:
+            fd.write(json.dumps({"commutative": primitive, "swapped": swapped}))
+            fd.write("\n")
+        for representative, elements, count in self.iter_classes():
+            line = {"representative": representative, "count": count}
+            if self.keep_elements:
+                line["elements"] = elements
+            fd.write(json.dumps(line))
+            fd.write("\n")
+
     def to_json(self) -> str:
         str_classes = sorted(
             [
-                {"representative": str(key), "elements": list(map(str, value))}
-                for key, value in self.classes.items()
+                {"representative": representative, "elements": elements}
+                for representative, elements, _ in self.iter_classes()
             ],
             key=lambda x: (x["representative"], len(x["elements"])),
             reverse=True,
         )
         return json.dumps(str_classes)
+
+
+def read_classes(
+    lines: Iterable[str],
+) -> Generator[tuple[str, list[str], int], None, None]:
+    """
+    Yields (representative, elements, count) from the lines written by write_jsonl,
+    elements are empty if they were not kept.
+    """
+    for line in lines:
+        if line.startswith('{"representative"'):
+            data = json.loads(line)
+            yield data["representative"], data.get("elements", []), data["count"]
+
+
+def read_commutatives(
+    lines: Iterable[str],
+) -> Generator[tuple[str, list[int]], None, None]:
+    """
+    Yields (primitive, swapped argument indices) from the lines written by write_jsonl.
+    """
+    for line in lines:
+        if line.startswith('{"commutative"'):
+            data = json.loads(line)
+            yield data["commutative"], data["swapped"]
+
+
+def load_representatives(file: str) -> dict[str, str]:
+    """
+    Map each program recorded in the JSON Lines file to its representative.
+    """
+    representatives: dict[str, str] = {}
+    with open(file) as fd:
+        for representative, elements, _ in read_classes(fd):
+            representatives[representative] = representative
+            for element in elements:
+                representatives[element] = representative
+    return representatives
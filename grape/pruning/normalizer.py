@@ -0,0 +1,279 @@
+from collections import defaultdict
+from typing import IO, TYPE_CHECKING, Any, Callable, Iterable, Generator, Optional
+from grape import types
+from grape.program import Function, Program, Variable, str_to_program
+from grape.pruning.equivalence_class_manager import read_classes, read_commutatives
+
+if TYPE_CHECKING:
+    from grape.dsl import DSL
+
+# (types of the arguments, return type) of a letter, None when unknown
+Signature = tuple[tuple[Optional[str], ...], Optional[str]]
+
+
+class Normalizer:
+    """
+    Rewrites programs into the representatives of their equivalence classes.
+
+    Each class element is a rule element -> representative. The variables of a
+    rule match any normalized subprogram, the same one for all occurrences of
+    a variable, as observational equivalence is a congruence. Rules are
+    indexed in a trie of their letters in prefix order where variables are
+    wildcards, the match that gives the smallest program is applied, the
+    first rule on ties. Arguments of commutative primitives are first sorted
+    as in the grammars built with the commutativity constraint.
+
+    With the DSL, a variable of a rule only matches subprograms of its type.
+    The type of a variable is given by the primitive it is an argument of, it
+    is unknown for polymorphic primitives whose variant is not named.
+
+    A program is normalized in one bottom-up pass, its subprograms are memoized
+    until memo_size programs are. Rules that only permute variables can
+    rewrite a program back into itself, then the smallest program of the
+    cycle is chosen.
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[tuple[Program, Program]],
+        commutatives: Iterable[tuple[str, list[int]]] = (),
+        max_steps: int = 100,
+        memo_size: int = 1 << 20,
+        dsl: Optional["DSL"] = None,
+    ):
+        self.dsl = dsl
+        self.signatures: dict[tuple[str, int], Signature] = {}
+        self.commutatives: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        for primitive, swapped in commutatives:
+            self.commutatives[primitive].append((swapped[0], swapped[1]))
+        self.max_steps = max_steps
+        self.memo_size = memo_size
+        # Trie node: letter -> child, __WILDCARD__ -> type of the variable -> child,
+        # None -> rules ending here as
+        # (rule number, variables of the element in prefix order, representative)
+        self.index: dict = {}
+        self.nrules = 0
+        for element, representative in rules:
+            element = self.__sort_commutative__(element)
+            representative = self.__sort_commutative__(representative)
+            variables = __variables__(element)
+            # Rules subsumed by commutativity or introducing variables are skipped
+            if element == representative or not set(
+                __variables__(representative)
+            ).issubset(variables):
+                continue
+            node = self.index
+            for symbol in __symbols__(element, self.__signature__):
+                if symbol[0] == __WILDCARD__:
+                    node = node.setdefault(__WILDCARD__, {}).setdefault(symbol[1], {})
+                else:
+                    node = node.setdefault(symbol, {})
+            node.setdefault(None, []).append((self.nrules, variables, representative))
+            self.nrules += 1
+        self.memo: dict[Program, Program] = {}
+
+    @classmethod
+    def from_classes(
+        cls, fd: IO[str], max_steps: int = 100, dsl: Optional["DSL"] = None
+    ) -> "Normalizer":
+        """
+        Normalizer of the classes written by EquivalenceClassManager.write_jsonl.
+        """
+        lines = fd.readlines()
+        rules = [
+            (str_to_program(element), str_to_program(representative))
+            for representative, elements, _ in read_classes(lines)
+            for element in elements
+        ]
+        return cls(rules, read_commutatives(lines), max_steps, dsl=dsl)
+
+    def __signature__(self, letter: str, arity: int) -> Signature:
+        out = self.signatures.get((letter, arity))
+        if out is None:
+            out = ((None,) * arity, None)
+            if self.dsl is not None:
+                try:
+                    ptype = types.Type.of(self.dsl.get_type(letter))
+                except KeyError:
+                    ptype = None
+                if ptype is not None and ptype.arity == arity:
+                    out = (
+                        tuple(map(__known__, ptype.arguments)),
+                        __known__(ptype.rtype),
+                    )
+            self.signatures[(letter, arity)] = out
+        return out
+
+    def __sort_commutative__(self, program: Program) -> Program:
+        """
+        Sort the arguments of commutative primitives, the subprograms must be sorted.
+        """
+        if not isinstance(program, Function):
+            return program
+        pairs = self.commutatives.get(str(program.function))
+        if pairs is None:
+            return program
+        args = list(program.arguments)
+        changed = True
+        while changed:
+            changed = False
+            for i, j in pairs:
+                if __order__(args[j]) < __order__(args[i]):
+                    args[i], args[j] = args[j], args[i]
+                    changed = True
+        return Function(program.function, args)
+
+    def normalize(self, program: Program) -> Program:
+        out = self.memo.get(program)
+        if out is not None:
+            return out
+        if isinstance(program, Function):
+            node: Program = Function(
+                program.function, [self.normalize(arg) for arg in program.arguments]
+            )
+            node = self.__sort_commutative__(node)
+        else:
+            node = program
+        seen = {node: 0}
+        path = [node]
+        rewritten = self.__rewrite__(node)
+        while rewritten is not None and len(path) <= self.max_steps:
+            # The instantiated representative may not be normalized
+            node = self.__sort_commutative__(
+                Function(
+                    rewritten.function,
+                    [self.normalize(arg) for arg in rewritten.arguments],
+                )
+                if isinstance(rewritten, Function)
+                else rewritten
+            )
+            if node in seen:
+                node = min(path[seen[node] :], key=str)
+                break
+            seen[node] = len(path)
+            path.append(node)
+            rewritten = self.__rewrite__(node)
+        if len(self.memo) >= self.memo_size:
+            self.memo.clear()
+        self.memo[program] = node
+        return node
+
+    def __rewrite__(self, node: Program) -> Optional[Program]:
+        flat: list[tuple[Any, Program, int, Optional[str]]] = []
+        __flatten__(node, flat, self.__signature__)
+        # (size of the rewritten program, rule number, rewritten program)
+        best: Optional[tuple[int, int, Program]] = None
+        # (trie node, position in flat, subprograms matched by the wildcards)
+        stack: list[tuple[dict, int, list[Program]]] = [(self.index, 0, [])]
+        while stack:
+            trie, i, matched = stack.pop()
+            if i == len(flat):
+                for number, variables, representative in trie.get(None, []):
+                    mapping: dict[int, Program] = {}
+                    if all(
+                        mapping.setdefault(no, sub) == sub
+                        for no, sub in zip(variables, matched)
+                    ):
+                        out = __substitute__(representative, mapping)
+                        if best is None or (out.size(), number) < best[:2]:
+                            best = (out.size(), number, out)
+                continue
+            symbol, sub, after, sub_type = flat[i]
+            child = trie.get(symbol)
+            if child is not None:
+                stack.append((child, i + 1, matched))
+            for var_type, child in trie.get(__WILDCARD__, {}).items():
+                if var_type is None or sub_type is None or var_type == sub_type:
+                    stack.append((child, after, matched + [sub]))
+        return best[2] if best is not None else None
+
+    def normalize_all(
+        self, programs: Iterable[Program | str]
+    ) -> Generator[Program, None, None]:
+        """
+        Normalize the programs, which can be given as strings, in order.
+        """
+        for program in programs:
+            if isinstance(program, str):
+                program = str_to_program(program)
+            yield self.normalize(program)
+
+
+def __order__(program: Program) -> tuple[str, str]:
+    # Same order as the commutativity constraint, ties are broken by the program
+    letter = program.function if isinstance(program, Function) else program
+    return str(letter), str(program)
+
+
+# Symbol of the variables of rules
+__WILDCARD__ = ()
+
+
+def __known__(stype: str) -> Optional[str]:
+    # Polymorphic types are unknown
+    return None if "'" in stype else stype
+
+
+def __symbols__(
+    program: Program,
+    signature: Callable[[str, int], Signature],
+    expected: Optional[str] = None,
+) -> list:
+    """
+    Letters with their arity in prefix order, variables are wildcards with the
+    type expected at their position.
+    """
+    if isinstance(program, Function):
+        letter = str(program.function)
+        args_types, _ = signature(letter, len(program.arguments))
+        out: list = [(letter, len(program.arguments))]
+        for arg, arg_type in zip(program.arguments, args_types):
+            out += __symbols__(arg, signature, arg_type)
+        return out
+    elif isinstance(program, Variable):
+        return [(__WILDCARD__, expected)]
+    return [(str(program), 0)]
+
+
+def __flatten__(
+    program: Program,
+    out: list[tuple[Any, Program, int, Optional[str]]],
+    signature: Callable[[str, int], Signature],
+    expected: Optional[str] = None,
+) -> None:
+    """
+    Appends (letter with its arity, subprogram, index after the subprogram, type)
+    for each subprogram in prefix order.
+    """
+    i = len(out)
+    if isinstance(program, Function):
+        letter = str(program.function)
+        args_types, rtype = signature(letter, len(program.arguments))
+        out.append(((letter, len(program.arguments)), program, 0, rtype or expected))
+        for arg, arg_type in zip(program.arguments, args_types):
+            __flatten__(arg, out, signature, arg_type)
+    elif isinstance(program, Variable):
+        out.append(((str(program), 0), program, 0, expected))
+    else:
+        rtype = signature(str(program), 0)[1]
+        out.append(((str(program), 0), program, 0, rtype or expected))
+    out[i] = (out[i][0], program, len(out), out[i][3])
+
+
+def __variables__(program: Program) -> list[int]:
+    if isinstance(program, Function):
+        return [no for arg in program.arguments for no in __variables__(arg)]
+    elif isinstance(program, Variable):
+        return [program.no]
+    return []
+
+
+def __substitute__(program: Program, mapping: dict[int, Program]) -> Program:
+    if isinstance(program, Function):
+        return Function(
+            program.function,
+            [__substitute__(arg, mapping) for arg in program.arguments],
+        )
+    elif isinstance(program, Variable):
+        return mapping[program.no]
+    return program
@@ -1,6 +1,7 @@
 from collections import defaultdict
 import math
 from typing import Any, Callable
+from grape import profiling
 from grape.automaton.spec_manager import (
     despecialize,
     is_specialized,
@@ -10,19 +11,22 @@ from grape.automaton.spec_manager import (
 from grape.dsl import DSL
 from grape.enumerator import Enumerator
 from grape.evaluator import Evaluator
-from grape.program import Primitive, Program, Variable
+from grape.program import Function, Primitive, Program, Variable
 from grape.automaton_generator import (
     grammar_by_saturation,
     grammar_from_memory,
+    program_state_names,
     commutativity_constraint,
+    algebraic_constraint,
 )
 from grape.automaton.tree_automaton import DFTA
+import grape.pruning.algebraic_pruner as algebraic_pruner
 import grape.pruning.commutativity_pruner as commutativity_pruner
+from grape.pruning.budget import Budget
+from grape.pruning.checkpoint import Checkpoint
 from grape.pruning.equivalence_class_manager import EquivalenceClassManager
 import grape.types as types
 
-from tqdm import tqdm
-
 
 def __infer_mega_type_req__(
     dsl: dict[str, tuple[str, Callable]],
@@ -59,6 +63,39 @@ def __infer_mega_type_req__(
     return type_req
 
 
+def __interchangeable_variables__(type_req: str) -> list[list[int]]:
+    # Variables of the same type are sampled from the same inputs
+    groups: dict[str, list[int]] = defaultdict(list)
+    for i, arg_type in enumerate(types.arguments(type_req)):
+        groups[arg_type].append(i)
+    return list(groups.values())
+
+
+def __sort_commutative__(
+    program: Program, commutatives: dict[str, list[tuple[int, int]]]
+) -> Program:
+    """
+    Orders the arguments of commutative primitives as the commutativity
+    constraint does, by their head letter.
+    """
+    if not isinstance(program, Function):
+        return program
+    args = [__sort_commutative__(arg, commutatives) for arg in program.arguments]
+    pairs = commutatives.get(str(program.function), [])
+    changed = True
+    while changed:
+        changed = False
+        for i, j in pairs:
+            if __head__(args[j]) < __head__(args[i]):
+                args[i], args[j] = args[j], args[i]
+                changed = True
+    return Function(program.function, args)
+
+
+def __head__(program: Program) -> str:
+    return str(program.function if isinstance(program, Function) else program)
+
+
 def __get_base_grammar__(
     dsl: DSL,
     evaluator: Evaluator,
@@ -67,14 +104,22 @@ def __get_base_grammar__(
     base_dfta: DFTA | None,
     type_req: str,
 ) -> tuple[DFTA[Any, Program], dict[int, int]]:
-    base_grammar = grammar_by_saturation(dsl, type_req)
+    with profiling.stage("prune.saturation"):
+        base_grammar = grammar_by_saturation(dsl, type_req)
     if base_dfta is None:
-        commutatives = commutativity_pruner.prune(dsl, evaluator, manager)
-        grammar = grammar_by_saturation(
-            dsl,
-            type_req,
-            [commutativity_constraint(commutatives)],
-        )
+        with profiling.stage("prune.commutativity"):
+            commutatives = commutativity_pruner.prune(dsl, evaluator, manager)
+        with profiling.stage("prune.algebraic"):
+            laws = algebraic_pruner.prune(dsl, evaluator, manager, commutatives)
+        with profiling.stage("prune.saturation"):
+            grammar = grammar_by_saturation(
+                dsl,
+                type_req,
+                [
+                    commutativity_constraint(commutatives),
+                    algebraic_constraint(laws, commutatives),
+                ],
+            )
     else:
         base_grammar = base_dfta
         if is_specialized(base_grammar):
@@ -100,42 +145,57 @@ def prune(
     max_size: int,
     rtype: str | None = None,
     base_grammar: DFTA | None = None,
+    symmetry_breaking: bool = False,
+    checkpoint: Checkpoint | None = None,
+    budget: Budget | None = None,
 ) -> DFTA[str, Program]:
     """
     Returns specialized grammar
+
+    With symmetry_breaking, programs that only differ from a pruned program by
+    a permutation of variables of the same type are merged with its
+    representative under the same permutation instead of being evaluated,
+    the evaluator must have symmetric_inputs.
+    With a checkpoint, the outputs it knows are used instead of evaluating
+    the programs and it is updated with those of this run.
+    With a budget, the enumeration stops at the last size whose programs were
+    all enumerated before it runs out, this size is saved in the budget.
     """
+    if symmetry_breaking and not evaluator.symmetric_inputs:
+        raise ValueError("symmetry breaking needs an evaluator with symmetric_inputs")
     # Find all type requests
     type_req = __infer_mega_type_req__(
         dsl.primitives, rtype, max_size, set(evaluator.base_inputs.keys())
     )
-    grammar, base_expected_trees = __get_base_grammar__(
-        dsl,
-        evaluator,
-        manager,
-        max_size,
-        base_grammar,
-        type_req,
-    )
+    if checkpoint is not None:
+        type_req = checkpoint.resume(dsl, type_req)
+    with profiling.stage("prune.base_grammar"):
+        grammar, base_expected_trees = __get_base_grammar__(
+            dsl,
+            evaluator,
+            manager,
+            max_size,
+            base_grammar,
+            type_req,
+        )
     old_finals = grammar.finals.copy()
     grammar.finals = set(grammar.all_states)
-    enum_ntrees = grammar.trees_until_size(max_size)
-    base_ntrees = sum(base_expected_trees.values())
 
-    enumerator = Enumerator(grammar)
+    enumerator = Enumerator(
+        grammar, __interchangeable_variables__(type_req) if symmetry_breaking else ()
+    )
 
     expected_trees = grammar.trees_by_size(max_size)
     max_arity = dsl.max_arity()
 
-    def estimate_total(size: int) -> tuple[int, float]:
+    def estimate_total(size: int, until: int = max_size) -> tuple[int, float]:
         min_size = max(1, size - max_arity)
         ratio = sum(
             enumerator.count_programs_at_size(s) / expected_trees[s]
             for s in range(min_size, size + 1)
         ) / (size - min_size + 1)
         total = sum(enumerator.count_programs_at_size(i) for i in range(1, size + 1))
-        total += int(
-            sum(expected_trees[s] * ratio for s in range(size + 1, max_size + 1))
-        )
+        total += int(sum(expected_trees[s] * ratio for s in range(size + 1, until + 1)))
         ratio = sum(
             enumerator.count_programs_at_size(s) / base_expected_trees[s]
             for s in range(min_size, size + 1)
@@ -143,39 +203,118 @@ def prune(
 
         return total, ratio
 
+    def largest_fitting_size(size: int) -> int:
+        # The time and memory used grow with the number of programs kept
+        assert budget is not None
+        done = max(1, estimate_total(size, size)[0])
+        fitting = size
+        while fitting < max_size and budget.fits(
+            estimate_total(size, fitting + 1)[0] / done
+        ):
+            fitting += 1
+        return fitting
+
+    def classify(program: Program) -> Program | None:
+        key = checkpoint.known(program) if checkpoint is not None else None
+        if key is None:
+            return evaluator.eval(program, type_req)
+        return evaluator.eval_known(program, type_req, key)
+
+    if profiling.ENABLED:
+        classify_timed = profiling.timed("prune.evaluation")(classify)
+    else:
+        classify_timed = classify
+
+    from tqdm import tqdm
+
     # Generate all programs until some size
-    pbar = tqdm(total=enum_ntrees)
-    pbar.set_description_str("obs. equiv.")
-    gen = enumerator.enumerate_until_size(max_size + 1)
-    program = next(gen)
-    evaluator.eval(program, type_req)
-    should_keep = True
-    last_size = 1
-    try:
-        n = 0
-        while True:
-            program = gen.send(should_keep)
-            representative = evaluator.eval(program, type_req)
-            should_keep = representative is None
-            if not should_keep:
-                manager.add_merge(program, representative)
-            n += 1
-            if n & 15 == 0:
-                pbar.update(16)
-                if enumerator.current_size != last_size:
-                    pbar.total, ratio = estimate_total(last_size)
-                    pbar.set_postfix_str(f"est. ratio unique programs:{ratio:.0%}")
-                    last_size += 1
-                n = 0
-    except StopIteration:
-        pass
-    pbar.update(n)
-    pbar.close()
+    with profiling.stage("prune.enumeration"):
+        pbar = tqdm(total=grammar.trees_until_size(max_size))
+        pbar.set_description_str("obs. equiv.")
+        if checkpoint is not None:
+            checkpoint.begin(evaluator)
+        if budget is not None:
+            budget.begin()
+        verified_size = max_size
+        gen = enumerator.enumerate_until_size(max_size + 1)
+        program = next(gen)
+        classify_timed(program)
+        decision: bool | Program = True
+        last_size = 1
+
+        def merge(program: Program, representative: Program) -> None:
+            manager.add_merge(program, representative)
+            if checkpoint is not None:
+                checkpoint.record(program, representative)
+
+        commutatives: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        for primitive, swapped in manager.commutatives:
+            commutatives[primitive].append((swapped[0], swapped[1]))
+
+        def merge_symmetric() -> None:
+            # The permuted representative may not be in the grammar
+            for permuted, representative in enumerator.symmetric_merges:
+                merge(permuted, __sort_commutative__(representative, commutatives))
+            enumerator.symmetric_merges.clear()
+
+        try:
+            n = 0
+            while True:
+                program = gen.send(decision)
+                merge_symmetric()
+                representative = classify_timed(program)
+                decision = True if representative is None else representative
+                if representative is not None:
+                    merge(program, representative)
+                n += 1
+                if n & 15 == 0:
+                    pbar.update(16)
+                    if enumerator.current_size != last_size:
+                        pbar.total, ratio = estimate_total(last_size)
+                        postfix = f"est. ratio unique programs:{ratio:.0%}"
+                        if budget is not None:
+                            fitting = largest_fitting_size(last_size)
+                            postfix += f" est. size in budget:{fitting}"
+                            if budget.auto_size and fitting == last_size:
+                                verified_size = last_size
+                                break
+                        pbar.set_postfix_str(postfix)
+                        last_size += 1
+                    elif (
+                        budget is not None
+                        and enumerator.current_size > 1
+                        and budget.exceeded()
+                    ):
+                        verified_size = enumerator.current_size - 1
+                        break
+                    n = 0
+        except StopIteration:
+            merge_symmetric()
+        gen.close()
+        pbar.update(n)
+        pbar.close()
+    if verified_size < max_size:
+        # Drop the programs of the sizes that were not fully enumerated
+        for programs in enumerator.memory.values():
+            for size in range(verified_size + 1, max_size + 1):
+                programs.pop(size, None)
+    if budget is not None:
+        budget.verified_size = verified_size
+        print(f"budget: programs fully verified until size {verified_size}")
+    enum_ntrees = grammar.trees_until_size(verified_size)
+    base_ntrees = sum(
+        n for size, n in base_expected_trees.items() if size <= verified_size
+    )
+    if checkpoint is not None:
+        checkpoint.end(evaluator)
     evaluator.free_memory()
     grammar.finals = old_finals
-    reduced_grammar, t = grammar_from_memory(enumerator.memory, type_req, old_finals)
-    t = reduced_grammar.trees_until_size(max_size)
-    print(f"at size {max_size} programs (after graping): {t:.2e}")
+    with profiling.stage("prune.grammar_from_memory"):
+        reduced_grammar, t = grammar_from_memory(
+            enumerator.memory, type_req, old_finals
+        )
+    t = reduced_grammar.trees_until_size(verified_size)
+    print(f"at size {verified_size} programs (after graping): {t:.2e}")
     print(
         "\tmethod: ratio no graping | ratio base | ratio graped",
     )
@@ -187,4 +326,5 @@ def prune(
         print(
             f"\t{s}: {v / base_ntrees:.2%} | {v / enum_ntrees:.2%} | {v / t:.2%}",
         )
-    return reduced_grammar
+    names = program_state_names(reduced_grammar)
+    return reduced_grammar.map_states(names.__getitem__)
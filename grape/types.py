@@ -1,7 +1,6 @@
 from collections import defaultdict
-import inspect
 from itertools import product
-from typing import Any, get_type_hints, TYPE_CHECKING
+from typing import Any, Generator, get_type_hints, TYPE_CHECKING
 
 from grape.program import Primitive, Program, Variable
 from grape.automaton.tree_automaton import DFTA
@@ -11,17 +10,93 @@ if TYPE_CHECKING:
     from grape.dsl import DSL
 
 
+class Type:
+    """
+    Parsed type, e.g. "int -> int -> bool".
+    Types are interned: use Type.of to get the unique instance of a type string,
+    spellings that only differ by spaces share the same instance and id.
+    Variants are only computed when they are first needed.
+    """
+
+    __slots__ = ("name", "arguments", "rtype", "id", "__variants")
+    __interned: dict[str, "Type"] = {}
+
+    def __init__(self, name: str, arguments: tuple[str, ...], rtype: str, id: int):
+        self.name = name
+        self.arguments = arguments
+        self.rtype = rtype
+        self.id = id
+        self.__variants: tuple["Type", ...] | None = None
+
+    @staticmethod
+    def of(type_req: str) -> "Type":
+        out = Type.__interned.get(type_req)
+        if out is None:
+            elems = tuple(map(lambda x: x.strip(), type_req.split("->")))
+            name = "->".join(elems)
+            out = Type.__interned.get(name)
+            if out is None:
+                out = Type(name, elems[:-1], elems[-1], len(Type.__interned))
+                Type.__interned[name] = out
+            Type.__interned[type_req] = out
+        return out
+
+    @property
+    def arity(self) -> int:
+        return len(self.arguments)
+
+    @property
+    def variant_count(self) -> int:
+        """
+        Number of variants, without computing them.
+        """
+        if self.__variants is not None:
+            return len(self.__variants)
+        count = 1
+        for possibles in __variant_options__(self.name)[1].values():
+            count *= len(possibles)
+        return count
+
+    @property
+    def variants(self) -> tuple["Type", ...]:
+        """
+        All variants of this type, computed once.
+        """
+        if self.__variants is None:
+            self.__variants = tuple(self.iter_variants())
+        return self.__variants
+
+    def iter_variants(self) -> Generator["Type", None, None]:
+        """
+        Lazily yield the variants of this type.
+        """
+        if self.__variants is not None:
+            yield from self.__variants
+            return
+        names, names2possibles = __variant_options__(self.name)
+        keys = list(names2possibles.keys())
+        for conf in product(*names2possibles.values()):
+            chosen = dict(zip(keys, conf))
+            yield Type.of("->".join(chosen[n] for n in names))
+
+    def __str__(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        return f"Type({self.name!r})"
+
+
 def return_type(type_req: str) -> str:
-    return type_req.split("->")[-1].strip()
+    return Type.of(type_req).rtype
 
 
 def arguments(type_req: str) -> tuple[str, ...]:
-    return parse(type_req)[0]
+    return Type.of(type_req).arguments
 
 
 def parse(type_req: str) -> tuple[tuple[str, ...], str]:
-    elems = tuple(map(lambda x: x.strip(), type_req.split("->")))
-    return elems[:-1], elems[-1]
+    t = Type.of(type_req)
+    return t.arguments, t.rtype
 
 
 def annotations_to_type_str(item: Any) -> str:
@@ -40,6 +115,8 @@ def annotations_to_type_str(item: Any) -> str:
     Does not support generic functions.
     """
     if callable(item):
+        import inspect
+
         hints = get_type_hints(item)
         sig = inspect.signature(item)
         items = [hints[v] for v in sig.parameters] + [hints["return"]]
@@ -49,7 +126,12 @@ def annotations_to_type_str(item: Any) -> str:
         return type(item).__name__
 
 
-def all_variants(type_req: str) -> list[str]:
+def __variant_options__(
+    type_req: str,
+) -> tuple[list[int | str], dict[int | str, list[str]]]:
+    """
+    Returns the name of each element of the type and the possible types for each name.
+    """
     elements = map(lambda x: x.strip(), type_req.split("->"))
     names: list[int | str] = []
     names2possibles: dict[int | str, list[str]] = {}
@@ -75,18 +157,11 @@ def all_variants(type_req: str) -> list[str]:
         else:
             names.append(i)
             names2possibles[i] = [el]
-    out = []
-    options: list[list[tuple[str | int, str]]] = [
-        [(name, x) for x in poss] for name, poss in names2possibles.items()
-    ]
-
-    def get_by_name(n: int | str, conf) -> str:
-        return [t for name, t in conf if name == n][0]
-
-    for conf in product(*options):
-        type_req_variant = "->".join(map(lambda n: get_by_name(n, conf), names))
-        out.append(type_req_variant)
-    return out
+    return names, names2possibles
+
+
+def all_variants(type_req: str) -> list[str]:
+    return [t.name for t in Type.of(type_req).variants]
 
 
 def check_automaton(dfta: DFTA[Any, Program], dsl: "DSL", type_req: str) -> bool:
@@ -0,0 +1,93 @@
+import pytest
+
+from grape.automaton.automaton_manager import (
+    AutomatonFormat,
+    dump_automaton_to_bytes,
+    dump_automaton_to_file,
+    load_automaton_from_bytes,
+    load_automaton_from_file,
+    load_automaton_from_str,
+)
+from grape.automaton_generator import grammar_by_saturation
+from grape.dsl import DSL
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+        "True": ("bool", True),
+        ">0": ("int -> bool", lambda x: x > 0),
+    }
+)
+grammar = (
+    grammar_by_saturation(dsl, "int -> bool").map_alphabet(str).classic_state_renaming()
+)
+
+
+@pytest.mark.parametrize(
+    "extension",
+    [".grape", ".grapeb", ".lark", ".ebnf", ".grape.gz", ".grape.xz", ".grapeb.xz"],
+)
+@pytest.mark.parametrize("sort", [True, False])
+def test_file_round_trip(extension: str, sort: bool, tmp_path):
+    file = str(tmp_path / f"grammar{extension}")
+    dump_automaton_to_file(grammar, file, sort)
+    loaded = load_automaton_from_file(file)
+    assert loaded.rules == grammar.rules
+    if extension.startswith(".grape"):
+        assert loaded.finals == grammar.finals
+
+
+def test_binary_checksum():
+    data = bytearray(dump_automaton_to_bytes(grammar))
+    assert load_automaton_from_bytes(bytes(data)).rules == grammar.rules
+    data[-1] ^= 1
+    with pytest.raises(ValueError):
+        load_automaton_from_bytes(bytes(data))
+
+
+def test_lark():
+    data = """
+// comment
+%import common.WS
+start : "a".."c" | "+" start start
+    | "-" start
+"""
+    dfta = load_automaton_from_str(data, AutomatonFormat.LARK)
+    assert dfta.finals == {"start"}
+    assert set(dfta.rules) == {
+        ("a", ()),
+        ("b", ()),
+        ("c", ()),
+        ("+", ("start", "start")),
+        ("-", ("start",)),
+    }
+
+
+@pytest.mark.parametrize(
+    "format,data,message",
+    [
+        (
+            AutomatonFormat.LARK,
+            'a : "x" b\nb : "x" b',
+            "line 2, column 5: nondeterministic",
+        ),
+        (AutomatonFormat.LARK, 'a : "x" b\n | "y b', "line 2, column 4: unterminated"),
+        (
+            AutomatonFormat.EBNF,
+            'a = "x" , b;\nb = "x", b;',
+            "line 2, column 5: nondeterministic",
+        ),
+        (
+            AutomatonFormat.EBNF,
+            'a = "x" , b;\nb = x;',
+            "line 2, column 5: expected a terminal",
+        ),
+        (AutomatonFormat.EBNF, 'a = "x" ,', "end of file"),
+    ],
+)
+def test_import_errors(format: AutomatonFormat, data: str, message: str):
+    with pytest.raises(ValueError, match=message):
+        load_automaton_from_str(data, format)
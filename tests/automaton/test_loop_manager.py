@@ -1,14 +1,22 @@
+import os
 import pytest
 import random
-from grape.automaton.loop_manager import LoopingAlgorithm, add_loops
+from grape.automaton.automaton_manager import load_automaton_from_file
+from grape.automaton.loop_manager import (
+    LoopingAlgorithm,
+    add_loops,
+    describe_states,
+)
 from grape.automaton.spec_manager import (
     respecialize,
     type_request_from_specialized,
 )
+from grape.automaton.tree_automaton import DFTA
 from grape.automaton_generator import grammar_by_saturation
 from grape.dsl import DSL
 from grape.enumerator import Enumerator
 from grape.evaluator import Evaluator
+from grape.program import Primitive, Variable
 from grape.pruning.equivalence_class_manager import EquivalenceClassManager
 from grape.pruning.obs_equiv_pruner import prune
 
@@ -76,6 +84,7 @@ manager = EquivalenceClassManager()
 evaluator = Evaluator(dsl, inputs, {}, set())
 tr = "int->none"
 saturated = grammar_by_saturation(dsl, tr)
+DATA = os.path.join(os.path.dirname(__file__), "data")
 
 
 def comp_by_enum(grammars: list, tr: str, max_size: int):
@@ -136,3 +145,85 @@ def test_next_size(algo: LoopingAlgorithm):
         new_out, tr, type_request_from_specialized(new_out, dsl), dsl
     )
     comp_by_enum([saturated, spec_out], tr, max_size + 1)
+
+
+def test_parallel():
+    out = prune(dsl, evaluator, manager, max_size=max_size)
+    new_out = add_loops(out, dsl, LoopingAlgorithm.GRAPE, jobs=2)
+    # Same rules whatever the number of jobs
+    for jobs in [1, 3]:
+        other = add_loops(out, dsl, LoopingAlgorithm.GRAPE, jobs=jobs)
+        assert new_out.rules == other.rules
+    spec_out = respecialize(
+        new_out, tr, type_request_from_specialized(new_out, dsl), dsl
+    )
+    comp_by_enum([saturated, spec_out], tr, max_size + 1)
+
+
+def test_describe_states():
+    out = prune(dsl, evaluator, manager, max_size=max_size)
+    state_to_type = dsl.get_state_types(out)
+    descriptors, rules = describe_states(out, state_to_type)
+    assert len(rules) == len(out.rules)
+    for (P, args), dst in out.rules.items():
+        s = descriptors.states.index(dst)
+        program = str(dst)
+        assert descriptors.letters[descriptors.letter[s]] == str(P)
+        assert descriptors.size[s] == program.count(" ") + 1
+        assert descriptors.is_var[s] == program.startswith("var")
+        assert descriptors.depth[s] <= descriptors.size[s]
+        assert descriptors.types[descriptors.type_id[s]] == state_to_type[dst]
+
+
+def test_virtual_variables():
+    # No variable of type bool: a virtual one is added then removed
+    bool_dsl = DSL(
+        {
+            "1": ("int", 1),
+            "+": ("int -> int -> int", lambda x, y: x + y),
+            ">0": ("int -> bool", lambda x: x > 0),
+            "not": ("bool -> bool", lambda b: not b),
+        }
+    )
+    bool_evaluator = Evaluator(bool_dsl, {"int": inputs["int"]}, {}, set())
+    out = prune(bool_dsl, bool_evaluator, EquivalenceClassManager(), max_size=4)
+    new_out = add_loops(out, bool_dsl, LoopingAlgorithm.GRAPE)
+    variables = {str(P) for P, _ in new_out.rules if str(P).startswith("var")}
+    assert variables == {str(P) for P, _ in out.rules if str(P).startswith("var")}
+
+
+@pytest.mark.parametrize("algo", algorithms)
+def test_reference_grammar(algo: LoopingAlgorithm):
+    # Stored grammars so that any change of the looped grammar is noticed
+    pruned = load_automaton_from_file(os.path.join(DATA, "pruned_4.grape"))
+    expected = load_automaton_from_file(os.path.join(DATA, f"looped_4_{algo}.grape"))
+    for jobs in [1, 2]:
+        out = add_loops(pruned, dsl, algo, jobs=jobs)
+        rules = {
+            (str(P), tuple(map(str, args))): str(dst)
+            for (P, args), dst in out.rules.items()
+        }
+        assert rules == expected.rules
+        assert set(map(str, out.finals)) == expected.finals
+
+
+def test_grape_is_more_restrictive():
+    pruned = load_automaton_from_file(os.path.join(DATA, "pruned_4.grape"))
+    grape = add_loops(pruned, dsl, LoopingAlgorithm.GRAPE)
+    other = add_loops(pruned, dsl, LoopingAlgorithm.OBSERVATIONAL_EQUIVALENCE)
+    # Windows are checked against the rules of strictly smaller merges
+    counts = sum(grape.trees_by_size(7).values())
+    assert counts < sum(other.trees_by_size(7).values())
+
+
+def test_final_without_rule():
+    small_dsl = DSL(
+        {"1": ("int", 1), "+": ("int -> int -> int", lambda x, y: x + y)}
+    )
+    one, plus, var = Primitive("1"), Primitive("+"), Variable(0)
+    grammar = DFTA(
+        {(one, ()): "1", (var, ()): "var0", (plus, ("1", "var0")): "(+ 1 var0)"},
+        {"1", "var0", "(+ 1 var0)", "(+ var0 var0)"},
+    )
+    out = add_loops(grammar, small_dsl, LoopingAlgorithm.GRAPE)
+    assert len(out.finals) == 3
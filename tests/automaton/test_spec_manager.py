@@ -1,4 +1,4 @@
-from grape.automaton.spec_manager import despecialize, specialize
+from grape.automaton.spec_manager import despecialize, specialize, specialize_many
 from grape.automaton_generator import grammar_by_saturation
 from grape.dsl import DSL
 
@@ -20,3 +20,15 @@ def test():
     prev = despecialize(grammar, type_req)
     spec = specialize(prev, type_req, dsl)
     assert spec.trees_until_size(100) == grammar.trees_until_size(100)
+
+
+def test_specialize_many():
+    type_req = "int->int->int"
+    grammar = grammar_by_saturation(dsl, type_req)
+    prev = despecialize(grammar, type_req)
+    type_requests = ["int->int", "int->int->int", "int->int->none"]
+    for tr, spec in zip(type_requests, specialize_many(prev, type_requests, dsl)):
+        expected = specialize(prev, tr, dsl)
+        expected.reduce()
+        assert spec.rules == expected.rules
+        assert spec.finals == expected.finals
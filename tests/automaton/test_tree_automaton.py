@@ -0,0 +1,104 @@
+import io
+import itertools
+
+import pytest
+from grape.automaton.automaton_manager import read_lark
+from grape.automaton.tree_automaton import NFTA
+from grape.automaton_generator import (
+    depth_constraint,
+    grammar_by_saturation,
+    size_constraint,
+)
+from grape.dsl import DSL
+from grape.enumerator import Enumerator
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+    }
+)
+by_size = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 5)])
+by_depth = grammar_by_saturation(dsl, "int->int", [depth_constraint(0, 3)])
+
+
+def union() -> NFTA:
+    rules = {}
+    finals = set()
+    for tag, g in [("size", by_size), ("depth", by_depth)]:
+        for (P, args), dst in g.rules.items():
+            key = (P, tuple((tag, x) for x in args))
+            rules.setdefault(key, set()).add((tag, dst))
+        finals |= {(tag, q) for q in g.finals}
+    return NFTA(rules, finals)
+
+
+def enumerate_programs(grammar, max_size: int) -> set[str]:
+    gen = Enumerator(grammar).enumerate_until_size(max_size)
+    out = set()
+    try:
+        p = next(gen)
+        while True:
+            out.add(str(p))
+            p = gen.send(True)
+    except StopIteration:
+        pass
+    return out
+
+
+def test_lazy_determinise():
+    nfta = union()
+    assert not nfta.is_deterministic()
+    lazy = nfta.lazy_determinise()
+    expected = enumerate_programs(by_size, 10) | enumerate_programs(by_depth, 10)
+    programs = list(lazy.enumerate_until_size(10))
+    assert set(map(str, programs)) == expected
+    assert len(programs) == len(expected)
+    assert sum(lazy.trees_by_size(9).values()) == len(expected)
+    assert all(lazy.accepts(p) for p in programs)
+
+
+def test_determinise():
+    nfta = union()
+    lazy = nfta.lazy_determinise()
+    dfta = nfta.determinise()
+    assert dfta.trees_by_size(9) == lazy.trees_by_size(9)
+    assert len(dfta.all_states) == len(lazy.states)
+    # Every combination of reachable states is read once, and only those
+    lazy = nfta.lazy_determinise()
+    dfta = lazy.materialise()
+    assert dfta.rules == {k: v for k, v in lazy.rules.items() if v is not None}
+    for letter, arities in lazy.arities.items():
+        for arity in arities:
+            for combi in itertools.product(lazy.states, repeat=arity):
+                assert (letter, combi) in lazy.rules
+    with pytest.raises(ValueError):
+        nfta.determinise(max_states=3)
+
+
+def test_read_nondeterministic():
+    text = """
+    start : "+" start start | "1"
+    start : "-" start
+    other : "-" start
+    """
+    with pytest.raises(ValueError):
+        read_lark(io.StringIO(text))
+    nfta = read_lark(io.StringIO(text), True)
+    assert nfta.rules[("-", ("start",))] == {"start", "other"}
+    assert nfta.determinise().trees_by_size(3) == {1: 1, 2: 1, 3: 2}
+
+
+def test_cached_in_place_edit():
+    grammar = by_size.copy()
+    snapshot = lambda: dict(grammar.rules)
+    grammar.cached("rules", snapshot)
+    # Edits that keep the number of rules
+    first, second = list(grammar.rules)[:2]
+    grammar.rules[first] = grammar.rules[second]
+    assert grammar.cached("rules", snapshot) == grammar.rules
+    dst = grammar.rules.pop(first)
+    grammar.rules[(first[0], first[1] + first[1])] = dst
+    assert grammar.cached("rules", snapshot) == grammar.rules
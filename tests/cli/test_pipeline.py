@@ -0,0 +1,81 @@
+import json
+
+from grape.automaton.automaton_manager import load_automaton_from_file
+from grape.cli.compile import compile_grammar
+from grape.cli.pipeline import Pipeline, parse_stages
+
+dsl_file = """
+import random
+
+random.seed(1)
+sample_dict = {"int": lambda: random.randint(-100, 100)}
+dsl = {
+    "+": ("int -> int -> int", lambda x, y: x + y),
+    "*": ("int -> int -> int", lambda x, y: x * y),
+    "-": ("int -> int", lambda x: -x),
+    "1": ("int", 1),
+}
+target_type = "int"
+"""
+
+
+def run(tmp_path, spec: dict) -> Pipeline:
+    pipeline = Pipeline(parse_stages(spec, str(tmp_path)), str(tmp_path / "cache"))
+    pipeline.run()
+    return pipeline
+
+
+def test_pipeline(tmp_path):
+    (tmp_path / "dsl.py").write_text(dsl_file)
+    spec = {
+        "dsl": "dsl.py",
+        "stages": [
+            {"name": "base", "op": "compile", "Msize": 4},
+            {"name": "pruned", "op": "prune", "size": 4, "samples": 20},
+            {"name": "spec", "op": "specialize", "type_request": "int -> int"},
+            {"name": "count", "op": "count", "size": 6},
+            {"name": "save", "op": "save", "input": "pruned", "output": "out.grape"},
+        ],
+    }
+    first = run(tmp_path, spec)
+    assert all(not isinstance(s, str) for s in first.report.values())
+    saved = load_automaton_from_file(str(tmp_path / "out.grape"))
+    assert saved.rules == first.values["pruned"].rules
+    base = compile_grammar(str(tmp_path / "dsl.py"), Msize=4)
+    assert len(first.values["base"].rules) == len(base.rules)
+
+    # Everything is cached but the save
+    second = run(tmp_path, spec)
+    assert second.values["count"] == first.values["count"]
+    assert {n for n, s in second.report.items() if s != "cached"} == {"save"}
+    assert "base" not in second.report
+
+    # The number of jobs does not change the grammar, so it is not hashed
+    spec["stages"][1]["jobs"] = 2
+    cached = run(tmp_path, spec)
+    assert {n for n, s in cached.report.items() if s != "cached"} == {"save"}
+    parallel = Pipeline(parse_stages(spec, str(tmp_path)), str(tmp_path / "other"))
+    parallel.run()
+    assert parallel.values["pruned"].rules == first.values["pruned"].rules
+
+    # Only the modified suffix is computed again
+    spec["stages"][2]["type_request"] = "int -> int -> int"
+    third = run(tmp_path, spec)
+    computed = {n for n, s in third.report.items() if s != "cached"}
+    assert computed == {"spec", "count", "save"}
+    assert json.dumps(third.values["count"]) != json.dumps(first.values["count"])
+
+
+def test_stage_keys(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    (tmp_path / "helpers.py").write_text("def add(x, y):\n    return x + y\n")
+    (tmp_path / "dsl.py").write_text("from helpers import add\n" + dsl_file)
+    spec = {"dsl": "dsl.py", "stages": [{"name": "pruned", "op": "prune"}]}
+    key = parse_stages(spec, str(tmp_path))[0].key
+    # The seed of the sampling is part of the key
+    spec["stages"][0]["seed"] = 1
+    seeded = parse_stages(spec, str(tmp_path))[0].key
+    assert seeded != key
+    # So are the local modules imported by the DSL
+    (tmp_path / "helpers.py").write_text("def add(x, y):\n    return y + x\n")
+    assert parse_stages(spec, str(tmp_path))[0].key != seeded
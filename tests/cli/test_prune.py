@@ -216,3 +216,71 @@ def test_is_superset():
         assert set(old_memory_to_size.get(size, [])).issubset(
             set(new_memory_to_size[size])
         )
+
+
+def test_budget_arguments():
+    from grape.cli.prune import parse_args
+
+    args = parse_args(
+        ["dsl.py", "--time-budget", "1.5h", "--memory-budget", "16G", "--auto-size"]
+    )
+    assert args.time_budget == 5400
+    assert args.memory_budget == 16 << 30
+    assert parse_args(["dsl.py", "--time-budget", "90"]).time_budget == 90
+    for argv in [["--auto-size"], ["--time-budget", "2x"], ["--memory-budget", "0"]]:
+        with pytest.raises(SystemExit):
+            parse_args(["dsl.py", *argv])
+
+
+def test_checkpoint_samples(tmp_path, capsys):
+    from grape.cli.prune import prune_grammar
+    from grape.pruning.checkpoint import Checkpoint
+
+    dsl_file = tmp_path / "dsl.py"
+    dsl_file.write_text(
+        'sample_dict = {"int": lambda: __import__("random").randint(-100, 100)}\n'
+        'dsl = {"+": ("int -> int -> int", lambda x, y: x + y), "1": ("int", 1)}\n'
+        'target_type = "int"\n'
+    )
+    file = str(tmp_path / "checkpoint")
+    for samples in [10, 10, 20]:
+        prune_grammar(str(dsl_file), 3, samples, "none", checkpoint_file=file)
+        assert len(Checkpoint.load(file).inputs["int"]) == samples
+    # Only the run with another number of samples does not reuse it
+    assert capsys.readouterr().err.count("checkpoint not reused") == 1
+
+
+def test_symmetry_breaking():
+    from grape import profiling
+
+    sym_dsl = DSL(
+        {
+            "0": ("int", 0),
+            "1": ("int", 1),
+            "neg": ("int -> int", lambda x: -x),
+            "+": ("int -> int -> int", lambda x, y: x + y),
+            "-": ("int -> int -> int", lambda x, y: x - y),
+            "*": ("int -> int -> int", lambda x, y: x * y),
+        }
+    )
+    sym_inputs = {"int": list(range(-10, 10))}
+    out = []
+    for symmetry_breaking in [False, True]:
+        manager = EquivalenceClassManager()
+        profiler = profiling.enable()
+        try:
+            grammar = prune(
+                sym_dsl,
+                Evaluator(sym_dsl, sym_inputs, {}, set(), symmetric_inputs=True),
+                manager,
+                5,
+                "int",
+                symmetry_breaking=symmetry_breaking,
+            )
+        finally:
+            profiling.disable()
+        classes = {r: sorted(elements) for r, elements, _ in manager.iter_classes()}
+        out.append((grammar.rules, classes, profiler.counters["evaluator.evaluations"]))
+    # Same grammar and classes with fewer evaluations
+    assert out[0][:2] == out[1][:2]
+    assert out[1][2] < out[0][2]
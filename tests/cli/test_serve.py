@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+import pytest
+from grape.automaton.automaton_manager import dump_automaton_to_file
+from grape.automaton_generator import grammar_by_saturation, size_constraint
+from grape.cli import serve
+from grape.dsl import DSL
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+    }
+)
+
+
+def wait_for_server(socket_path: str, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            assert serve.request(socket_path, "ping") == "pong"
+            return
+        except OSError:
+            # Not created or not listening yet
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def test_serve(tmp_path):
+    grammar = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 5)])
+    grammar = grammar.classic_state_renaming()
+    file = str(tmp_path / "grammar.grape")
+    dump_automaton_to_file(grammar, file)
+    socket_path = str(tmp_path / "grape.sock")
+    server = threading.Thread(target=serve.serve, args=(socket_path, 4))
+    server.start()
+    try:
+        wait_for_server(socket_path)
+        params = {"command": "count", "argv": ["grammar.grape", "--size", "5"]}
+        params["cwd"] = str(tmp_path)
+        first = serve.request(socket_path, "run", params)
+        assert first["code"] == 0
+        cumulative = grammar.trees_until_size(5)
+        assert f"cumulative: {cumulative:.2e}" in first["stdout"].splitlines()[-1]
+        # info reduces the grammar in place: it must not alter the cached one
+        params["command"] = "info"
+        params["argv"] = ["grammar.grape"]
+        assert serve.request(socket_path, "run", params)["code"] == 0
+        params["command"] = "count"
+        params["argv"] = ["grammar.grape", "--size", "5"]
+        assert serve.request(socket_path, "run", params) == first
+        assert serve.request(socket_path, "stats")["hits"] == 2
+        params["argv"] = ["missing.grape"]
+        assert serve.request(socket_path, "run", params)["code"] == 1
+    finally:
+        serve.request(socket_path, "shutdown")
+        server.join()
+    assert not os.path.exists(socket_path)
+
+
+def test_serve_not_a_socket(tmp_path):
+    path = tmp_path / "grape.sock"
+    path.write_text("data")
+    with pytest.raises(ValueError):
+        serve.serve(str(path), 4)
+    assert path.read_text() == "data"
@@ -0,0 +1,12 @@
+from grape.cli.specialize import output_files
+
+
+def test_output_files():
+    assert output_files("grammar.grape", 1) == ["grammar.grape"]
+    assert output_files("grammar.grape", 2) == ["grammar_0.grape", "grammar_1.grape"]
+    assert output_files("grammar", 2) == ["grammar_0", "grammar_1"]
+    assert output_files("out.d/grammar.grape.gz", 2) == [
+        "out.d/grammar_0.grape.gz",
+        "out.d/grammar_1.grape.gz",
+    ]
+    assert output_files("out/{}-{a}.grape", 2) == ["out/0-{a}.grape", "out/1-{a}.grape"]
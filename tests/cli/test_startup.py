@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+import pytest
+
+# Commands that never need the DSL or a progress bar
+light_commands = [
+    "convert",
+    "count",
+    "despecialize",
+    "enum",
+    "info",
+    "intersection",
+    "normalize",
+    "specialize",
+    "union",
+]
+heavy_modules = ["tqdm", "multiprocessing", "grape.dsl", "grape.evaluator", "gzip"]
+
+
+@pytest.mark.parametrize("command", light_commands)
+def test_lazy_imports(command: str):
+    code = (
+        f"import sys, grape.cli.{command}; "
+        f"print(*[m for m in {heavy_modules} if m in sys.modules])"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == ""
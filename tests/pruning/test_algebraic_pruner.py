@@ -0,0 +1,95 @@
+from grape.automaton_generator import (
+    algebraic_constraint,
+    commutativity_constraint,
+    grammar_by_saturation,
+)
+from grape.dsl import DSL
+from grape.enumerator import Enumerator
+from grape.evaluator import Evaluator
+from grape.program import str_to_program
+from grape.pruning import algebraic_pruner, commutativity_pruner
+from grape.pruning.equivalence_class_manager import EquivalenceClassManager
+
+dsl = DSL(
+    {
+        "0": ("int", 0),
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "*": ("int -> int -> int", lambda x, y: x * y),
+        "-": ("int -> int -> int", lambda x, y: x - y),
+        "max": ("int -> int -> int", max),
+        "neg": ("int -> int", lambda x: -x),
+        "abs": ("int -> int", abs),
+    }
+)
+inputs = {"int": list(range(-10, 10))}
+tr = "int->int->int"
+
+
+def find_laws() -> tuple[list, list, EquivalenceClassManager]:
+    evaluator = Evaluator(dsl, inputs, {}, set())
+    manager = EquivalenceClassManager()
+    commutatives = commutativity_pruner.prune(dsl, evaluator, manager)
+    return (
+        commutatives,
+        algebraic_pruner.prune(dsl, evaluator, manager, commutatives),
+        manager,
+    )
+
+
+def count_classes(constraints: list, max_size: int) -> tuple[int, int]:
+    """
+    (number of programs enumerated, number of equivalence classes)
+    """
+    grammar = grammar_by_saturation(dsl, tr, constraints)
+    evaluator = Evaluator(dsl, inputs, {}, set())
+    gen = Enumerator(grammar).enumerate_until_size(max_size + 1)
+    nprograms, nclasses = 0, 0
+    try:
+        program = next(gen)
+        while True:
+            nprograms += 1
+            keep = evaluator.eval(program, tr) is None
+            nclasses += keep
+            program = gen.send(keep)
+    except StopIteration:
+        pass
+    return nprograms, nclasses
+
+
+def test_laws():
+    _, laws, manager = find_laws()
+    assert sorted((p, law, data) for p, law, data in laws) == [
+        ("*", "absorbing", [0, "0"]),
+        ("*", "absorbing", [1, "0"]),
+        ("*", "associative", []),
+        ("*", "identity", [0, "1"]),
+        ("*", "identity", [1, "1"]),
+        ("+", "associative", []),
+        ("+", "identity", [0, "0"]),
+        ("+", "identity", [1, "0"]),
+        ("-", "identity", [1, "0"]),
+        ("abs", "idempotent", []),
+        ("max", "associative", []),
+        ("max", "idempotent", []),
+        ("neg", "involutive", []),
+    ]
+    for program, representative in [
+        ("(neg (neg var0))", "var0"),
+        ("(abs (abs var0))", "(abs var0)"),
+        ("(* 0 var0)", "0"),
+        ("(max var0 var0)", "var0"),
+    ]:
+        assert manager.representative(str_to_program(program)) == str_to_program(
+            representative
+        )
+
+
+def test_constraint_is_complete():
+    commutatives, laws, _ = find_laws()
+    constraints = [commutativity_constraint(commutatives)]
+    with_comm = count_classes(constraints, 7)
+    constraints.append(algebraic_constraint(laws, commutatives))
+    with_laws = count_classes(constraints, 7)
+    assert with_laws[0] < with_comm[0]
+    assert with_laws[1] == with_comm[1]
@@ -0,0 +1,67 @@
+from grape.dsl import DSL
+from grape.evaluator import Evaluator
+from grape.pruning.budget import Budget
+from grape.pruning.equivalence_class_manager import EquivalenceClassManager
+from grape.pruning.obs_equiv_pruner import prune
+
+dsl = DSL(
+    {
+        "0": ("int", 0),
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "*": ("int -> int -> int", lambda x, y: x * y),
+        "neg": ("int -> int", lambda x: -x),
+    }
+)
+inputs = {"int": list(range(-10, 10))}
+
+
+class FakeBudget(Budget):
+    """
+    Exceeded after some checks, growing the work by more than limit never fits.
+    """
+
+    def __init__(self, checks: int = -1, limit: float = float("inf")):
+        super().__init__(seconds=1, auto_size=limit != float("inf"))
+        self.checks = checks
+        self.limit = limit
+
+    def used(self, growth: float = 1) -> float:
+        if growth == 1:
+            self.checks -= 1
+            return 1 if self.checks == 0 else 0
+        return 0 if growth <= self.limit else 1
+
+
+def run(budget: Budget | None):
+    return prune(
+        dsl,
+        Evaluator(dsl, inputs, {}, set()),
+        EquivalenceClassManager(),
+        max_size=6,
+        rtype="int",
+        budget=budget,
+    )
+
+
+def test_exceeded():
+    full = run(None)
+    budget = FakeBudget(checks=4)
+    grammar = run(budget)
+    assert budget.verified_size is not None and 1 < budget.verified_size < 6
+    # Same programs until the verified size
+    for size in range(1, budget.verified_size + 1):
+        assert grammar.trees_until_size(size) == full.trees_until_size(size)
+    assert grammar.trees_until_size(6) < full.trees_until_size(6)
+
+
+def test_auto_size():
+    budget = FakeBudget()
+    run(budget)
+    assert budget.verified_size == 6
+    # There are about twice more programs until size 2 than until size 1,
+    # then more than three times more until size 3 than until size 2
+    budget = FakeBudget(limit=3)
+    grammar = run(budget)
+    assert budget.verified_size == 2
+    assert grammar.trees_until_size(6) == grammar.trees_until_size(2)
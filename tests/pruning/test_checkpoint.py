@@ -0,0 +1,140 @@
+from grape import profiling
+from grape.dsl import DSL
+from grape.evaluator import Evaluator
+from grape.program import Primitive
+from grape.pruning.checkpoint import Checkpoint
+from grape.pruning.equivalence_class_manager import EquivalenceClassManager
+from grape.pruning.obs_equiv_pruner import prune
+
+primitives = {
+    "0": ("int", 0),
+    "1": ("int", 1),
+    "+": ("int -> int -> int", lambda x, y: x + y),
+    "-": ("int -> int -> int", lambda x, y: x - y),
+    "neg": ("int -> int", lambda x: -x),
+}
+inputs = {"int": list(range(-10, 10)), "bool": [True, False]}
+
+
+def run(dsl: DSL, checkpoint: Checkpoint) -> tuple[int, float]:
+    """
+    (number of evaluations, number of programs of the grammar)
+    """
+    profiler = profiling.enable()
+    try:
+        grammar = prune(
+            dsl,
+            Evaluator(dsl, checkpoint.inputs, {}, set()),
+            EquivalenceClassManager(),
+            max_size=5,
+            rtype="int",
+            checkpoint=checkpoint,
+        )
+    finally:
+        profiling.disable()
+    return profiler.counters["evaluator.evaluations"], grammar.trees_until_size(5)
+
+
+def test_incremental(tmp_path):
+    file = str(tmp_path / "checkpoint")
+    checkpoint = Checkpoint(inputs)
+    run(DSL(primitives), checkpoint)
+    checkpoint.save(file)
+    modified = dict(primitives)
+    del modified["-"]
+    modified["neg"] = ("int -> int", lambda x: x * x)
+    modified["*"] = ("int -> int -> int", lambda x, y: x * y)
+    incremental = Checkpoint.load(file)
+    assert incremental.known(next(iter(incremental.outputs))) is not None
+    fresh = Checkpoint.load(file)
+    fresh.outputs.clear()
+    evaluations, ntrees = run(DSL(modified), incremental)
+    # Same inputs so the same grammar as pruning from scratch
+    scratch = run(DSL(modified), fresh)
+    assert ntrees == scratch[1]
+    assert 0 < evaluations < scratch[0]
+    assert len(incremental.outputs) == len(fresh.outputs)
+
+
+def test_type_request_changed():
+    checkpoint = Checkpoint(inputs)
+    run(DSL(primitives), checkpoint)
+    known = len(checkpoint.outputs)
+    # Needs boolean variables
+    modified = dict(primitives)
+    modified["if"] = ("bool -> int -> int -> int", lambda c, x, y: x if c else y)
+    run(DSL(modified), checkpoint)
+    assert checkpoint.type_req is not None and "bool" in checkpoint.type_req
+    assert len(checkpoint.outputs) > known
+
+
+def changed(before: dict, after: dict) -> set[str]:
+    """
+    Primitives of before whose programs are forgotten with after.
+    """
+    checkpoint = Checkpoint(inputs)
+    checkpoint.resume(DSL(before), "int -> int")
+    checkpoint.outputs = {Primitive(name): () for name in before}
+    checkpoint.resume(DSL(after), "int -> int")
+    return set(before) - {str(program) for program in checkpoint.outputs}
+
+
+def adder(n: int):
+    return lambda x: x + n
+
+
+class Shift:
+    def __call__(self, x: int) -> int:
+        return x + 1
+
+
+def test_fingerprint():
+    length = {"len": ("list -> int", len)}
+    # list is not sampled
+    assert changed(length, {"len": ("list -> int", len)}) == set()
+    assert changed(length, {"len": ("list -> int", lambda l: len(l) + 1)}) == {"len"}
+    # Same code but another closure or constant
+    add = {"f": ("int -> int", adder(1)), "g": ("int -> int", lambda x: x * 2)}
+    same = {"f": ("int -> int", adder(1)), "g": ("int -> int", lambda x: x * 2)}
+    assert changed(add, same) == set()
+    assert changed(
+        add, {"f": ("int -> int", adder(2)), "g": ("int -> int", lambda x: x * 3)}
+    ) == {"f", "g"}
+    # Callables that cannot be described are always changed
+    shift = {"s": ("int -> int", Shift())}
+    assert changed(shift, {"s": ("int -> int", Shift())}) == {"s"}
+
+
+class Scale:
+    factor = 2
+
+    @classmethod
+    def apply(cls, x: int) -> int:
+        return x * cls.factor
+
+
+def described(fn) -> bool:
+    """
+    Whether the programs of a primitive are kept when it does not change.
+    """
+    primitive = {"p": ("int -> int", fn)}
+    return changed(primitive, primitive) == set()
+
+
+def test_fingerprint_not_described():
+    shift = Shift()
+    # Closures over objects that cannot be described
+    assert not described(lambda x: shift(x))
+    # Bound methods of instances, builtin or not
+    assert not described(shift.__call__)
+    assert not described(shift.__sizeof__)
+
+    # Empty cells of closures
+    def empty():
+        return lambda x: later(x)
+        later = None
+
+    assert not described(empty())
+    # Bound methods of classes and builtin methods of described values are
+    assert described(Scale.apply)
+    assert described([1, 2].count)
@@ -0,0 +1,92 @@
+import io
+import json
+
+from grape.program import str_to_program
+from grape.pruning.equivalence_class_manager import (
+    EquivalenceClassManager,
+    load_representatives,
+    read_classes,
+)
+
+merges = [
+    ("(+ var0 1)", "(+ 1 var0)"),
+    ("(+ (+ 1 var0) 1)", "(+ 1 (+ 1 var0))"),
+    ("(+ 1 (+ var0 1))", "(+ 1 (+ 1 var0))"),
+    ("(- var0 var0)", "0"),
+    ("(* 0 var0)", "0"),
+]
+
+
+def build(keep_elements: bool = True) -> EquivalenceClassManager:
+    manager = EquivalenceClassManager(keep_elements)
+    for program, representative in merges:
+        manager.add_merge(str_to_program(program), str_to_program(representative))
+    return manager
+
+
+def test_union_find():
+    manager = build()
+    assert len(manager) == 3
+    for program, representative in merges:
+        assert manager.representative(str_to_program(program)) == str_to_program(
+            representative
+        )
+    assert manager.representative(str_to_program("(+ var0 var0)")) is None
+    # Merging a representative merges its whole class
+    manager.add_merge(str_to_program("0"), str_to_program("(- 1 1)"))
+    assert len(manager) == 3
+    assert manager.representative(str_to_program("(* 0 var0)")) == str_to_program(
+        "(- 1 1)"
+    )
+    classes = {r: (sorted(e), n) for r, e, n in manager.iter_classes()}
+    assert classes["(- 1 1)"] == (["(* 0 var0)", "(- var0 var0)", "0"], 3)
+
+
+def test_jsonl(tmp_path):
+    manager = build()
+    file = tmp_path / "classes.jsonl"
+    with open(file, "w") as fd:
+        manager.write_jsonl(fd)
+    lines = [json.loads(line) for line in file.read_text().splitlines()]
+    assert sum(line["count"] for line in lines) == len(merges)
+    assert sorted(len(line["elements"]) for line in lines) == [1, 2, 2]
+    representatives = load_representatives(str(file))
+    for program, representative in merges:
+        assert representatives[program] == representative
+        assert representatives[representative] == representative
+    legacy = json.loads(manager.to_json())
+    assert {c["representative"] for c in legacy} == {
+        line["representative"] for line in lines
+    }
+
+
+def test_counts_only():
+    manager = build(keep_elements=False)
+    # Only representatives and their subprograms are interned
+    assert len(manager.keys) == 5
+    out = io.StringIO()
+    manager.write_jsonl(out)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert {line["representative"]: line["count"] for line in lines} == {
+        "(+ 1 var0)": 1,
+        "(+ 1 (+ 1 var0))": 2,
+        "0": 2,
+    }
+    assert all("elements" not in line for line in lines)
+    out.seek(0)
+    assert {(r, n) for r, e, n in read_classes(out) if not e} == {
+        ("(+ 1 var0)", 1),
+        ("(+ 1 (+ 1 var0))", 2),
+        ("0", 2),
+    }
+
+
+def test_merge_representatives():
+    classes = []
+    for keep_elements in [True, False]:
+        manager = build(keep_elements)
+        # A representative can be found equivalent to another program later
+        manager.add_merge(str_to_program("0"), str_to_program("(- 1 1)"))
+        classes.append(sorted((r, n) for r, _, n in manager.iter_classes()))
+    assert classes[0] == classes[1]
+    assert ("(- 1 1)", 3) in classes[1]
@@ -0,0 +1,113 @@
+import io
+
+from grape.dsl import DSL
+from grape.evaluator import Evaluator
+from grape.program import str_to_program
+from grape.pruning.equivalence_class_manager import EquivalenceClassManager
+from grape.pruning.normalizer import Normalizer
+from grape.pruning.obs_equiv_pruner import prune
+
+
+def rules(*pairs: tuple[str, str]) -> list:
+    return [(str_to_program(a), str_to_program(b)) for a, b in pairs]
+
+
+def test_rewrite():
+    normalizer_rules = rules(
+        ("(- var0 var0)", "0"), ("(* 1 var0)", "var0"), ("(- (- var0))", "var0")
+    )
+    normalizer = Normalizer(normalizer_rules)
+    assert normalizer.nrules == 3
+    tests = {
+        # Variables are renamed consistently
+        "(- var2 var2)": "0",
+        "(- var1 var2)": "(- var1 var2)",
+        "(* 1 (- (- var1)))": "var1",
+        # Rewrites of the arguments enable a rewrite at the root
+        "(- (* 1 var3) var3)": "0",
+        # Variables of rules match any subprogram, the same for each occurrence
+        "(* 1 (- (* 1 var0) (- (- var0))))": "0",
+        "(* 1 (- (- (- var0 var1))))": "(- var0 var1)",
+        "(- (- var0 var1) (- var0 var1))": "0",
+        "(- (- var0 var1) (- var1 var0))": "(- (- var0 var1) (- var1 var0))",
+    }
+    for program, expected in tests.items():
+        assert normalizer.normalize(str_to_program(program)) == str_to_program(
+            expected
+        )
+    assert [str(p) for p in normalizer.normalize_all(tests)] == list(tests.values())
+    # The memo is bounded
+    small = Normalizer(normalizer_rules, memo_size=4)
+    assert [str(p) for p in small.normalize_all(tests)] == list(tests.values())
+    assert len(small.memo) <= 4
+
+
+def test_commutative():
+    normalizer = Normalizer(
+        rules(("(+ var1 var0)", "(+ var0 var1)"), ("(+ 0 var0)", "var0")),
+        commutatives=[("+", [0, 1])],
+    )
+    # The first rule is subsumed by commutativity
+    assert normalizer.nrules == 1
+    assert normalizer.normalize(str_to_program("(+ var1 var0)")) == str_to_program(
+        "(+ var0 var1)"
+    )
+    assert normalizer.normalize(str_to_program("(+ var2 0)")) == str_to_program(
+        "var2"
+    )
+    assert normalizer.normalize(
+        str_to_program("(+ (+ var1 var0) (+ var0 var1))")
+    ) == str_to_program("(+ (+ var0 var1) (+ var0 var1))")
+
+
+def test_from_pruning():
+    dsl = DSL(
+        {
+            "1": ("int", 1),
+            "0": ("int", 0),
+            "+": ("int -> int -> int", lambda x, y: x + y),
+            "*": ("int -> int -> int", lambda x, y: x * y),
+            "-": ("int -> int", lambda x: -x),
+        }
+    )
+    inputs = {"int": list(range(-20, 20))}
+    manager = EquivalenceClassManager()
+    prune(dsl, Evaluator(dsl, inputs, {}, set()), manager, max_size=4, rtype="int")
+    assert manager.commutatives
+    out = io.StringIO()
+    manager.write_jsonl(out)
+    normalizer = Normalizer.from_classes(io.StringIO(out.getvalue()))
+    assert normalizer.nrules > 0
+    for representative, elements, _ in manager.iter_classes():
+        expected = normalizer.normalize(str_to_program(representative))
+        for element in elements:
+            assert normalizer.normalize(str_to_program(element)) == expected
+
+
+def test_typed():
+    dsl = DSL(
+        {
+            "add": ("'a [int|list] -> 'a -> 'a", lambda x, y: x + y),
+            "length": ("list -> int", len),
+            "0": ("int", 0),
+            "nil": ("list", ()),
+        }
+    )
+    normalizer_rules = rules(
+        ("(add|@>int->int->int 0 var0)", "var0"), ("(add nil var0)", "var0")
+    )
+    typed = Normalizer(normalizer_rules, dsl=dsl)
+    untyped = Normalizer(normalizer_rules)
+    tests = {
+        "(add|@>int->int->int 0 (length var1))": "(length var1)",
+        "(add|@>int->int->int 0 var1)": "var1",
+        # The variable of the rule is an int
+        "(add|@>int->int->int 0 nil)": "(add|@>int->int->int 0 nil)",
+        # The type of the variable of a polymorphic primitive is unknown
+        "(add nil 0)": "0",
+    }
+    for program, expected in tests.items():
+        assert typed.normalize(str_to_program(program)) == str_to_program(expected)
+    assert untyped.normalize(str_to_program("(add|@>int->int->int 0 nil)")) == (
+        str_to_program("nil")
+    )
@@ -0,0 +1,51 @@
+from grape.automaton_generator import (
+    automaton_constraint,
+    constrain,
+    depth_constraint,
+    grammar_by_saturation,
+    size_constraint,
+)
+from grape.dsl import DSL
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+        "True": ("bool", True),
+        "ite": (
+            "bool -> 'a [bool|int] -> 'a -> 'a",
+            lambda b, pos, neg: pos if b else neg,
+        ),
+    }
+)
+
+max_size = 7
+
+
+def test_size_constraint():
+    base = grammar_by_saturation(dsl, "int->int")
+    constrained = grammar_by_saturation(
+        dsl, "int->int", [size_constraint(0, max_size)]
+    )
+    expected = base.trees_by_size(max_size)
+    assert constrained.trees_by_size(max_size) == expected
+    assert constrained.trees_at_size(max_size + 1) == 0
+
+
+def test_depth_constraint():
+    constrained = grammar_by_saturation(dsl, "int->int", [depth_constraint(0, 2)])
+    _, max_depth = constrained.compute_max_size_and_depth()
+    assert max_depth == 2
+    assert not constrained.is_unbounded()
+
+
+def test_automaton_constraint():
+    size = grammar_by_saturation(dsl, "int->int", [size_constraint(0, max_size)])
+    depth = grammar_by_saturation(dsl, "int->int", [depth_constraint(0, 3)])
+    same = grammar_by_saturation(dsl, "int->int", [automaton_constraint(depth)])
+    assert same.trees_by_size(max_size) == depth.trees_by_size(max_size)
+    inter = constrain(size, [automaton_constraint(depth)])
+    expected = size.read_intersection(depth).trees_by_size(max_size + 2)
+    assert inter.trees_by_size(max_size + 2) == expected
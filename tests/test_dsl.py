@@ -1,3 +1,6 @@
+from grape import types
+from grape.automaton.spec_manager import type_request_from_specialized
+from grape.automaton_generator import grammar_by_saturation
 from grape.dsl import DSL
 
 
@@ -34,3 +37,31 @@ def test_type_hints():
     }
 
     _dsl = DSL(dsl_dict)
+
+
+def test_state_types():
+    dsl = DSL(
+        {
+            "1": ("int", 1),
+            "True": ("bool", True),
+            ">0": ("int -> bool", lambda x: x > 0),
+            "ite": (
+                "bool -> 'a [bool|int] -> 'a -> 'a",
+                lambda b, pos, neg: pos if b else neg,
+            ),
+        }
+    )
+    grammar = dsl.map_to_variants(grammar_by_saturation(dsl, "int -> bool -> int"))
+    assert type_request_from_specialized(grammar, dsl) == "int->bool-> int"
+    state_to_type = dsl.get_state_types(grammar)
+    assert set(state_to_type.values()) == {"int", "bool"}
+    for (P, args), dst in grammar.rules.items():
+        if str(P).startswith("var"):
+            continue
+        targs, rtype = types.parse(dsl.get_type(str(P)))
+        assert state_to_type[dst] == rtype
+        assert tuple(state_to_type[arg] for arg in args) == targs
+    # Cached until the rules change
+    assert dsl.get_state_types(grammar) is state_to_type
+    grammar.reduce()
+    assert dsl.get_state_types(grammar) is not state_to_type
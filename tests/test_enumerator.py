@@ -1,4 +1,5 @@
 from grape.automaton_generator import grammar_by_saturation
+from grape.program import Variable, str_to_program
 from grape.dsl import DSL
 from grape.enumerator import Enumerator
 
@@ -66,3 +67,42 @@ def test_enumerator_deterministic_order():
             assert g1.send(True) == g2.send(True)
     except StopIteration:
         pass
+
+
+def enumerate_all(e: Enumerator) -> list:
+    yielded = []
+    g = e.enumerate_until_size(max_size)
+    try:
+        p = next(g)
+        while True:
+            yielded.append(p)
+            p = g.send(True)
+    except StopIteration:
+        pass
+    return yielded
+
+
+def test_enumerator_symmetry_breaking():
+    sym_grammar = grammar_by_saturation(dsl, "int->int->int->int")
+    e = Enumerator(sym_grammar, [[0, 1, 2]])
+    doubles = {str_to_program(f"(+ var{i} var{i})"): Variable(i) for i in range(3)}
+    yielded = []
+    g = e.enumerate_until_size(max_size)
+    try:
+        p = next(g)
+        while True:
+            yielded.append(p)
+            # Pruned as equivalent to its variable
+            p = g.send(doubles.get(p, True))
+    except StopIteration:
+        pass
+    # Only one of them is yielded, the others are merged under the permutation
+    assert len(set(doubles).intersection(yielded)) == 1
+    merges = dict(e.symmetric_merges)
+    for program, variable in doubles.items():
+        assert program in yielded or merges[program] == variable
+    assert len(merges) == 2
+    # Nothing is inherited when all programs are kept
+    assert enumerate_all(Enumerator(sym_grammar, [[0, 1, 2]])) == enumerate_all(
+        Enumerator(sym_grammar)
+    )
@@ -1,8 +1,10 @@
 import random
+
+import pytest
 from grape.automaton_generator import grammar_by_saturation
 from grape.dsl import DSL
 from grape.enumerator import Enumerator
-from grape.evaluator import Evaluator
+from grape.evaluator import Evaluator, PrimitiveProfiler
 from grape.program import str_to_program
 
 
@@ -104,6 +106,18 @@ def test_evaluator_representatives():
     assert e.eval(p, tr) == r
 
 
+def test_symmetric_inputs():
+    tr2 = "int->int->int"
+    e = Evaluator(dsl, inputs, {}, set(), symmetric_inputs=True)
+    e.eval(str_to_program("var0"), tr2)
+    # Both variables see every sampled value
+    for column in zip(*e.full_inputs[tr2]):
+        assert set(column) == set(inputs["int"])
+    empty = Evaluator(dsl, {"int": []}, {}, set())
+    with pytest.raises(ValueError):
+        empty.eval(str_to_program("var0"), tr)
+
+
 def test_skip_exception():
     dsl = DSL(
         {
@@ -127,3 +141,48 @@ def test_skip_exception():
         e.eval(r, tr)
     except ZeroDivisionError:
         assert False
+
+
+def enumerate_kept(e: Evaluator) -> list:
+    enumerator = Enumerator(grammar_by_saturation(dsl, tr))
+    g = enumerator.enumerate_until_size(max_size + 1)
+    kept = []
+    p = next(g)
+    try:
+        while True:
+            keep = e.eval(p, tr) is None
+            if keep:
+                kept.append(p)
+            p = g.send(keep)
+    except StopIteration:
+        pass
+    return kept
+
+
+def test_primitive_profiler():
+    profiler = PrimitiveProfiler()
+    e = Evaluator(dsl, inputs, {}, set(), primitive_profiler=profiler)
+    assert enumerate_kept(e) == enumerate_kept(Evaluator(dsl, inputs, {}, set()))
+    rows = profiler.report("calls")
+    assert [row["primitive"] for row in rows] == ["+"]
+    assert rows[0]["calls"] > 0 and rows[0]["exception_rate"] == 0
+    assert rows[0]["max"] >= rows[0]["mean"] > 0
+    profiler.record("slow", 1.0, 0)
+    profiler.record_exception("slow", 1.0)
+    assert profiler.report()[0]["primitive"] == "slow"
+    assert profiler.stats["slow"].to_dict()["exception_rate"] == 0.5
+    assert profiler.expensive(min_calls=1) == {"slow"}
+
+
+def test_defer_expensive():
+    e = Evaluator(
+        dsl,
+        inputs,
+        {},
+        set(),
+        primitive_profiler=PrimitiveProfiler(),
+        defer_expensive=True,
+        first_tier=2,
+    )
+    e.deferred = {"+"}
+    assert enumerate_kept(e) == enumerate_kept(Evaluator(dsl, inputs, {}, set()))
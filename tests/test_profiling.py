@@ -0,0 +1,76 @@
+from grape import profiling
+from grape.automaton_generator import grammar_by_saturation
+from grape.dsl import DSL
+from grape.enumerator import Enumerator
+from grape.evaluator import Evaluator
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "/": ("int -> int -> int", lambda x, y: x // y),
+    }
+)
+inputs = {"int": list(range(-10, 10))}
+tr = "int->int"
+
+
+def run_enumeration() -> list:
+    grammar = grammar_by_saturation(dsl, tr)
+    evaluator = Evaluator(dsl, inputs, {}, {ZeroDivisionError})
+    enumerator = Enumerator(grammar)
+    gen = enumerator.enumerate_until_size(5)
+    kept = []
+    program = next(gen)
+    try:
+        while True:
+            keep = evaluator.eval(program, tr) is None
+            if keep:
+                kept.append(program)
+            program = gen.send(keep)
+    except StopIteration:
+        pass
+    return kept
+
+
+@profiling.timed("double")
+def double(x: int) -> int:
+    return 2 * x
+
+
+def test_disabled():
+    assert not profiling.ENABLED
+    with profiling.stage("stage"), profiling.timer("timer"):
+        profiling.count("counter")
+    assert double(2) == 4
+    assert profiling.disable() is None
+
+
+def test_profiler():
+    expected = run_enumeration()
+    profiler = profiling.enable(memory=True)
+    try:
+        with profiling.stage("outer"):
+            with profiling.stage("inner"):
+                data = [0] * 100_000
+            del data
+            kept = run_enumeration()
+            assert double(2) == 4
+    finally:
+        assert profiling.disable() is profiler
+    # Profiling does not change the results
+    assert kept == expected
+    report = profiler.report()
+    assert report["timers"]["double"]["calls"] == 1
+    stages = report["stages"]
+    assert stages["outer"]["peak_memory"] >= stages["inner"]["peak_memory"]
+    assert stages["inner"]["peak_memory"] >= 800_000
+    counters = report["counters"]
+    assert sum(
+        n for name, n in counters.items() if name.startswith("enumerator.programs.size")
+    ) == len(kept)
+    assert counters["evaluator.skipped_exceptions"] > 0
+    assert counters["evaluator.inputs_evaluated"] == 20 * counters[
+        "evaluator.evaluations"
+    ]
+    assert report["timers"]["evaluator.primitive.+"]["calls"] > 0
@@ -4,6 +4,7 @@ from grape.types import (
     arguments,
     parse,
     all_variants,
+    Type,
 )
 
 
@@ -58,3 +59,15 @@ def test_all_variants():
     assert all_variants("a -> b") == ["a->b"]
     assert all_variants("a -> b | c") == ["a->b", "a->c"]
     assert all_variants("'a [b|c] -> 'a -> c") == ["b->b->c", "c->c->c"]
+
+
+def test_type_interned():
+    t = Type.of("'a [b|c] -> 'a -> c | d")
+    assert t is Type.of("'a [b|c]->'a->c | d")
+    assert t.id == Type.of("'a [b|c]->'a->c | d").id
+    assert t.arguments == ("'a [b|c]", "'a")
+    assert t.rtype == "c | d"
+    assert t.variant_count == 4
+    assert next(t.iter_variants()) is Type.of("b -> b -> c")
+    assert [v.name for v in t.variants] == all_variants("'a [b|c] -> 'a -> c | d")
+    assert len(t.variants) == 4